@@ -0,0 +1,175 @@
+"""Sustituto local de MongoDB para los benchmarks de almacenamiento.
+
+Si `mongomock` está instalado se usa; si no, `FakeDatabase` implementa en
+memoria el subconjunto que usa el proyecto (`bulk_write` con `InsertOne` /
+`UpdateOne` y `$set/$inc/$min/$max/$setOnInsert`, `insert_many`, `find`
+con orden y límite, `create_index`). Sin pymongo instalado, `install()`
+también le da a la capa write-behind unas clases de operación compatibles.
+"""
+import copy
+import itertools
+
+from base_de_datos import writer as writer_mod
+
+try:
+    import mongomock
+except Exception:
+    mongomock = None
+
+
+class InsertOne:
+    def __init__(self, document):
+        self._doc = document
+
+
+class UpdateOne:
+    def __init__(self, filter, update, upsert=False):
+        self._filter = filter
+        self._doc = update
+        self._upsert = upsert
+
+
+def _matches(doc: dict, flt: dict) -> bool:
+    for k, v in flt.items():
+        if isinstance(v, dict) and v and all(op.startswith('$') for op in v):
+            cur = doc.get(k)
+            for op, arg in v.items():
+                if op == '$in' and cur not in arg:
+                    return False
+                if op == '$gte' and not (cur is not None and cur >= arg):
+                    return False
+                if op == '$lt' and not (cur is not None and cur < arg):
+                    return False
+        elif doc.get(k) != v:
+            return False
+    return True
+
+
+def _apply(doc: dict, update: dict, inserting: bool):
+    for op, fields in update.items():
+        for k, v in fields.items():
+            if op == '$set':
+                doc[k] = v
+            elif op == '$inc':
+                doc[k] = doc.get(k, 0) + v
+            elif op == '$min':
+                doc[k] = v if k not in doc else min(doc[k], v)
+            elif op == '$max':
+                doc[k] = v if k not in doc else max(doc[k], v)
+            elif op == '$setOnInsert' and inserting:
+                doc[k] = v
+
+
+class _Cursor:
+    def __init__(self, docs):
+        self._docs = docs
+
+    def sort(self, key, direction=1):
+        self._docs.sort(key=lambda d: (d.get(key) is None, d.get(key)), reverse=direction < 0)
+        return self
+
+    def limit(self, n):
+        if n:
+            self._docs = self._docs[:n]
+        return self
+
+    def batch_size(self, _n):
+        return self
+
+    def __iter__(self):
+        return iter(self._docs)
+
+
+class FakeCollection:
+    def __init__(self, name):
+        self.name = name
+        self.docs = []
+        self._ids = itertools.count(1)
+        self._unique = {}
+
+    def create_index(self, keys, unique=False, **_kw):
+        if unique and isinstance(keys, str):
+            self._unique[keys] = {d.get(keys): d for d in self.docs}
+        return keys
+
+    def _find_one(self, flt):
+        if len(flt) == 1:
+            (k, v), = flt.items()
+            index = self._unique.get(k)
+            if index is not None and not isinstance(v, dict):
+                return index.get(v)
+        for d in self.docs:
+            if _matches(d, flt):
+                return d
+        return None
+
+    def _insert(self, doc):
+        doc.setdefault('_id', next(self._ids))
+        self.docs.append(doc)
+        for k, index in self._unique.items():
+            index[doc.get(k)] = doc
+
+    def insert_many(self, docs, ordered=True):
+        for d in docs:
+            self._insert(d)
+
+    def insert_one(self, doc):
+        self._insert(doc)
+
+    def update_one(self, flt, update, upsert=False):
+        doc = self._find_one(flt)
+        if doc is None:
+            if not upsert:
+                return
+            doc = {k: v for k, v in flt.items() if not isinstance(v, dict)}
+            _apply(doc, update, True)
+            self._insert(doc)
+        else:
+            _apply(doc, update, False)
+
+    def bulk_write(self, ops, ordered=True):
+        for op in ops:
+            if hasattr(op, '_filter'):
+                self.update_one(op._filter, op._doc, upsert=op._upsert)
+            else:
+                self._insert(op._doc)
+
+    def find(self, flt=None, projection=None):
+        docs = [d for d in self.docs if _matches(d, flt or {})]
+        if projection:
+            hidden = [k for k, v in projection.items() if not v]
+            docs = [{k: v for k, v in d.items() if k not in hidden} for d in docs]
+        else:
+            docs = [copy.copy(d) for d in docs]
+        return _Cursor(docs)
+
+    def find_one(self, flt, projection=None):
+        for d in self.find(flt, projection):
+            return d
+        return None
+
+    def count_documents(self, flt):
+        return sum(1 for d in self.docs if _matches(d, flt))
+
+
+class FakeDatabase:
+    def __init__(self):
+        self._cols = {}
+
+    def get_collection(self, name):
+        col = self._cols.get(name)
+        if col is None:
+            col = self._cols[name] = FakeCollection(name)
+        return col
+
+    __getitem__ = get_collection
+
+
+def install():
+    """Devuelve una base de datos sustituta lista para `WriteBehind`/`MetricRollups`."""
+    if mongomock is not None:
+        return mongomock.MongoClient().get_database('bench')
+    if writer_mod.InsertOne is None:
+        # pymongo is not installed: give the write-behind layer compatible ops
+        writer_mod.InsertOne, writer_mod.UpdateOne = InsertOne, UpdateOne
+    return FakeDatabase()
@@ -0,0 +1,109 @@
+"""Red simulada para los benchmarks (sin root y sin tráfico real).
+
+`FakeNetwork` decide de forma determinista (por semilla e IP) qué hosts
+están vivos, su latencia y si tienen nombre DNS; la pérdida se sortea en
+cada sonda. `install()` la conecta a los puntos de extensión del código:
+el motor ICMP (`icmp.set_engine` con un `FakeProber`), el resolver de
+nombres (`resolver.set_resolver`) y la lectura de la tabla de vecinos.
+"""
+import asyncio
+import functools
+import hashlib
+import ipaddress
+import random
+import time
+import zlib
+
+from monitores import devices, icmp
+from monitores.resolver import HostnameResolver, set_resolver
+
+
+def _unit(ip: str, salt: str) -> float:
+    # deterministic uniform [0, 1) per (salt, ip); crc32 is too correlated across salts
+    digest = hashlib.blake2b(('%s:%s' % (salt, ip)).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') / 18446744073709551616.0
+
+
+class FakeNetwork:
+    def __init__(self, alive: float = 0.3, latency_ms: float = 2.0, jitter_ms: float = 1.0,
+                 loss: float = 0.01, named: float = 0.5, dns_ms: float = 5.0, seed: int = 1):
+        self.alive = alive
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.loss = loss
+        self.named = named
+        self.dns_ms = dns_ms
+        self.seed = str(seed)
+        self._rng = random.Random(seed)
+        self._neigh = {}
+        self.probes = 0
+        self.lookups = 0
+
+    # -- hosts -----------------------------------------------------------
+    def is_alive(self, ip: str) -> bool:
+        return _unit(ip, self.seed + 'alive') < self.alive
+
+    def rtt_ms(self, ip: str) -> float:
+        return self.latency_ms + self.jitter_ms * _unit(ip, self.seed + 'rtt')
+
+    def mac(self, ip: str) -> str:
+        h = zlib.crc32(ip.encode()) & 0xffffffff
+        return '02:00:%02x:%02x:%02x:%02x' % ((h >> 24) & 0xff, (h >> 16) & 0xff,
+                                              (h >> 8) & 0xff, h & 0xff)
+
+    def add_prefix(self, cidr: str):
+        """Puebla la tabla de vecinos con los hosts vivos de `cidr`."""
+        net = ipaddress.ip_network(cidr, strict=False)
+        for addr in net.hosts():
+            ip = str(addr)
+            if self.is_alive(ip):
+                self._neigh[ip] = {'mac': self.mac(ip), 'dev': 'fake0', 'state': 'REACHABLE'}
+
+    def alive_hosts(self, cidr: str) -> list:
+        net = ipaddress.ip_network(cidr, strict=False)
+        return [str(a) for a in net.hosts() if self.is_alive(str(a))]
+
+    # -- backends ----------------------------------------------------------
+    def read_neigh(self, family=None) -> dict:
+        return self._neigh
+
+    def resolve(self, ip: str):
+        """`resolve_fn` del resolver: bloquea `dns_ms` como una consulta PTR."""
+        self.lookups += 1
+        time.sleep(self.dns_ms / 1000.0)
+        if self.is_alive(ip) and _unit(ip, self.seed + 'dns') < self.named:
+            return 'host-%s.lan' % ip.replace('.', '-').replace(':', '-')
+        return None
+
+    def lost(self) -> bool:
+        return self._rng.random() < self.loss
+
+
+class FakeProber(icmp.IcmpProber):
+    """`IcmpProber` cuyas respuestas salen de una `FakeNetwork`."""
+
+    def __init__(self, loop, net: FakeNetwork):
+        super().__init__(loop)
+        self.net = net
+
+    async def probe(self, host: str, timeout: float = icmp.DEFAULT_TIMEOUT):
+        self.net.probes += 1
+        if not self.net.is_alive(host) or self.net.lost():
+            await asyncio.sleep(timeout)
+            return None
+        rtt = self.net.rtt_ms(host)
+        if rtt / 1000.0 >= timeout:
+            await asyncio.sleep(timeout)
+            return None
+        await asyncio.sleep(rtt / 1000.0)
+        return rtt
+
+
+def install(net: FakeNetwork, resolver_workers: int = 32) -> FakeNetwork:
+    """Sustituye ICMP, DNS y tabla de vecinos del proceso por `net`."""
+    # a partial over a module-level class: scan shards (spawned processes) unpickle it
+    icmp.set_engine(icmp.ProbeEngine(functools.partial(FakeProber, net=net)))
+    set_resolver(HostnameResolver(max_workers=resolver_workers, resolve_fn=net.resolve))
+    # scan code reads the kernel table through this module-level helper
+    devices._read_neigh = net.read_neigh
+    return net
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""Benchmarks de escaneo, checks, DNS, almacenamiento y API sobre una red simulada.
+
+Uso (desde la raíz del proyecto):
+
+    python benchmarks/run.py                         # todo, resultados en benchmarks/results/
+    python benchmarks/run.py --suite scan --sizes 24,20
+    python benchmarks/run.py --compare benchmarks/results/anterior.json
+
+Cada resultado es `{valor, unidad, mejor: 'lower'|'higher'}` en un JSON con
+la revisión de git; `--compare` marca las regresiones por encima de
+`--threshold` y termina con código 1 si hay alguna.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+SRC = ROOT / 'src'
+for p in (SRC, ROOT / 'benchmarks'):
+    if str(p) not in sys.path:
+        sys.path.insert(0, str(p))
+
+# keep benchmark writes out of data/monitor.db and force the in-process engine
+os.environ.setdefault('MONITOR_DB', str(Path(tempfile.mkdtemp(prefix='monitor-bench-')) / 'bench.db'))
+os.environ.pop('MONGO_URI', None)
+os.environ['PING_MODE'] = 'icmp'
+
+import fakemongo  # noqa: E402
+import fakenet  # noqa: E402
+
+SUITES = ('scan', 'checks', 'dns', 'storage', 'api')
+RESULTS_DIR = ROOT / 'benchmarks' / 'results'
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    pos = (len(ordered) - 1) * q / 100.0
+    lo = int(pos)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (pos - lo)
+
+
+class Report:
+    def __init__(self):
+        self.results = {}
+
+    def add(self, name, value, unit, better='lower'):
+        self.results[name] = {'value': round(value, 4), 'unit': unit, 'better': better}
+        print('  %-40s %12.3f %s' % (name, value, unit))
+
+    def latency(self, name, samples_ms):
+        self.add(name + '.p50', percentile(samples_ms, 50), 'ms')
+        self.add(name + '.p99', percentile(samples_ms, 99), 'ms')
+
+
+# -- suites -----------------------------------------------------------------
+def bench_scan(report, net, args):
+    from monitores.devices import scan_cidr
+    for size in args.sizes:
+        cidr = '10.%d.0.0/%d' % (size, size)
+        net.add_prefix(cidr)
+        probes = net.probes
+        started = time.perf_counter()
+        devices = scan_cidr(cidr, timeout=args.timeout, on_hostname=lambda d, h: None)
+        elapsed = time.perf_counter() - started
+        report.add('scan.sweep_/%d' % size, elapsed, 's')
+        report.add('scan.sweep_/%d.probes_per_s' % size, (net.probes - probes) / elapsed,
+                   'probes/s', 'higher')
+        report.add('scan.sweep_/%d.alive' % size, sum(d['ok'] for d in devices), 'hosts', 'info')
+        if args.shards > 1:
+            started = time.perf_counter()
+            scan_cidr(cidr, timeout=args.timeout, on_hostname=lambda d, h: None,
+                      shards=args.shards, rate=args.rate)
+            report.add('scan.sharded_/%d' % size, time.perf_counter() - started, 's')
+
+
+def bench_checks(report, net, args):
+    from monitores import icmp
+    from monitores.checks import run_ping
+    hosts = net.alive_hosts('10.99.0.0/20')[:4096]
+    started = time.perf_counter()
+    icmp.ping_many(hosts, timeout=args.timeout)
+    elapsed = time.perf_counter() - started
+    report.add('checks.ping_many.probes_per_s', len(hosts) / elapsed, 'probes/s', 'higher')
+    samples = []
+    for ip in hosts[:args.requests]:
+        t0 = time.perf_counter()
+        res = run_ping(ip, timeout=args.timeout)
+        elapsed = (time.perf_counter() - t0) * 1000.0
+        if res['ok']:
+            # overhead on top of the simulated RTT (lost probes only measure the timeout)
+            samples.append(max(0.0, elapsed - res['rtt_ms']))
+    report.latency('checks.run_ping_overhead', samples)
+
+
+def bench_dns(report, net, args):
+    from monitores.resolver import HostnameResolver
+    hosts = net.alive_hosts('10.98.0.0/22')
+    resolver = HostnameResolver(max_workers=32, resolve_fn=net.resolve)
+    started = time.perf_counter()
+    names = resolver.resolve_many(hosts)
+    elapsed = time.perf_counter() - started
+    report.add('dns.enrich_%d_hosts' % len(hosts), elapsed, 's')
+    report.add('dns.named_hosts', sum(1 for n in names.values() if n), 'hosts', 'info')
+    started = time.perf_counter()
+    resolver.resolve_many(hosts)
+    report.add('dns.enrich_cached', (time.perf_counter() - started) * 1000.0, 'ms')
+
+
+def _results(n):
+    now = datetime.utcnow().isoformat()
+    return [{'host': '10.0.%d.%d' % (i // 250 % 250, i % 250 + 1), 'name': 'm%d' % (i % 50),
+             'ok': i % 7 != 0, 'rtt_ms': 1.5, 'timestamp': now} for i in range(n)]
+
+
+def bench_storage(report, net, args):
+    from base_de_datos.db import DBClient
+    from base_de_datos.rollups import MetricRollups
+    from base_de_datos.store import LocalStore
+    from base_de_datos.writer import WriteBehind
+
+    n = args.inserts
+    docs = _results(n)
+
+    # file backend: SQLite through the DBClient + write-behind path
+    client = DBClient()
+    started = time.perf_counter()
+    client.insert_results(docs)
+    client.writer.flush()
+    report.add('storage.file.insert_per_s', n / (time.perf_counter() - started), 'docs/s', 'higher')
+    samples = []
+    for _ in range(args.requests):
+        t0 = time.perf_counter()
+        client.get_recent(50)
+        samples.append((time.perf_counter() - t0) * 1000.0)
+    report.latency('storage.file.get_recent', samples)
+    store = client.store if client.store is not None else LocalStore()
+    started = time.perf_counter()
+    count = sum(1 for _ in store.iter_range())
+    report.add('storage.file.scan_per_s', count / (time.perf_counter() - started), 'docs/s', 'higher')
+
+    # Mongo stand-in: batched bulk_write inserts and merged rollup upserts
+    db = fakemongo.install()
+    writer = WriteBehind(flush_interval=0.2)
+    col = db.get_collection('monitor_results')
+    started = time.perf_counter()
+    for d in _results(n):
+        writer.insert(col, d)
+    writer.flush()
+    report.add('storage.mongo.insert_per_s', n / (time.perf_counter() - started), 'docs/s', 'higher')
+    rollups = MetricRollups(db, writer)
+    rollups.ensure_indexes()
+    ts = int(time.time())
+    started = time.perf_counter()
+    for i in range(n):
+        rollups.add('cpu_percent', ts + i, float(i % 100))
+    writer.flush()
+    report.add('storage.mongo.rollup_add_per_s', n / (time.perf_counter() - started),
+               'samples/s', 'higher')
+    stats = writer.stats()
+    report.add('storage.mongo.avg_flush_ms', stats['avg_flush_ms'], 'ms')
+    writer.close()
+
+
+def bench_api(report, net, args):
+    try:
+        import flask  # noqa: F401
+    except ImportError:
+        print('  api: Flask not installed, skipped')
+        return
+    for cidr in ('192.168.1.0/24', '192.168.2.0/24'):
+        net.add_prefix(cidr)
+    # a private lock dir: this process must win the election and run the scan itself
+    os.environ.setdefault('LEADER_DIR', tempfile.mkdtemp(prefix='bench-leader-'))
+    import app as flask_app
+    client = flask_app.app.test_client()
+    flask_app.start_background()
+    # let the startup scan populate the cache before measuring
+    deadline = time.monotonic() + 30
+    while ((flask_app._SCANNING or flask_app._DEVICES_CACHE_TS is None)
+           and time.monotonic() < deadline):
+        time.sleep(0.05)
+    for path in ('/api/devices', '/api/monitors', '/api/status'):
+        samples = []
+        for _ in range(args.requests):
+            t0 = time.perf_counter()
+            client.get(path)
+            samples.append((time.perf_counter() - t0) * 1000.0)
+        report.latency('api.flask.GET_%s' % path.strip('/').replace('/', '_'), samples)
+
+
+# -- comparison ---------------------------------------------------------------
+def compare(current: dict, baseline: dict, threshold: float) -> int:
+    regressions = 0
+    print('\n%-44s %12s %12s %8s' % ('benchmark', 'baseline', 'current', 'change'))
+    for name, cur in sorted(current.items()):
+        old = baseline.get(name)
+        if old is None or cur['better'] == 'info' or not old['value']:
+            continue
+        change = (cur['value'] - old['value']) / abs(old['value'])
+        worse = change > threshold if cur['better'] == 'lower' else change < -threshold
+        regressions += worse
+        print('%-44s %12.3f %12.3f %+7.1f%%%s' % (name, old['value'], cur['value'], change * 100,
+                                                  '  REGRESSION' if worse else ''))
+    return regressions
+
+
+def git_rev():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=str(ROOT),
+                              capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('--suite', default=','.join(SUITES), help='comma separated: ' + ','.join(SUITES))
+    ap.add_argument('--sizes', default='24,20,16', help='prefix lengths to sweep')
+    ap.add_argument('--timeout', type=float, default=0.2, help='probe timeout (s)')
+    ap.add_argument('--shards', type=int, default=4, help='processes for the sharded sweeps (1 = skip)')
+    ap.add_argument('--rate', type=float, default=0, help='global probes/s for the sharded sweeps (0 = unlimited)')
+    ap.add_argument('--alive', type=float, default=0.3)
+    ap.add_argument('--latency-ms', type=float, default=2.0)
+    ap.add_argument('--jitter-ms', type=float, default=1.0)
+    ap.add_argument('--loss', type=float, default=0.01)
+    ap.add_argument('--dns-ms', type=float, default=5.0)
+    ap.add_argument('--inserts', type=int, default=20000)
+    ap.add_argument('--requests', type=int, default=200, help='samples per latency benchmark')
+    ap.add_argument('--seed', type=int, default=1)
+    ap.add_argument('--out', help='results file (default: benchmarks/results/<rev>-<time>.json)')
+    ap.add_argument('--compare', help='baseline results file')
+    ap.add_argument('--threshold', type=float, default=0.10, help='relative change that counts as regression')
+    args = ap.parse_args(argv)
+    args.sizes = [int(s) for s in args.sizes.split(',') if s]
+
+    net = fakenet.install(fakenet.FakeNetwork(
+        alive=args.alive, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+        loss=args.loss, dns_ms=args.dns_ms, seed=args.seed))
+    report = Report()
+    for suite in [s.strip() for s in args.suite.split(',') if s.strip()]:
+        if suite not in SUITES:
+            ap.error('unknown suite %r' % suite)
+        print('[%s]' % suite)
+        globals()['bench_' + suite](report, net, args)
+
+    rev = git_rev()
+    doc = {
+        'meta': {'rev': rev, 'time': datetime.utcnow().isoformat(),
+                 'python': platform.python_version(), 'platform': platform.platform(),
+                 'params': {k: v for k, v in vars(args).items() if k not in ('out', 'compare')}},
+        'results': report.results,
+    }
+    out = Path(args.out) if args.out else \
+        RESULTS_DIR / ('%s-%s.json' % (rev or 'worktree', datetime.utcnow().strftime('%Y%m%dT%H%M%S')))
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(doc, indent=2), encoding='utf-8')
+    print('\nresults: %s' % out)
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f).get('results', {})
+        if compare(report.results, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,124 +1,148 @@
-from flask import Flask, jsonify, send_from_directory, request
+from flask import Flask, Response, abort, g, jsonify, request
+from werkzeug.wsgi import wrap_file
 from pathlib import Path
-try:
-    import yaml
-    _HAS_YAML = True
-except Exception:
-    yaml = None
-    _HAS_YAML = False
 import os
 import sys
 
 from base_de_datos.db import get_db
-from monitores.checks import run_ping
-from monitores.devices import scan_cidr
-import yaml as _yaml
+from base_de_datos import export
+from monitores.runner import MonitorRunner
+from monitores.devices import SCAN_HOSTS, SCAN_SECONDS, apply_neighbor, iter_scan_cidr
+from monitores.neighbors import start_watcher
+from monitores.scheduler import DEFAULT_RATE, ProbeScheduler
+from utilidades.config import get_config
+from utilidades.leader import Elector, FileLock, SharedFile
+from utilidades.static import StaticAssets
+from utilidades.streaming import EventFeed, encode, media_type, pick_format
+from utilidades import telemetry
 import threading
 import time
 from datetime import datetime
 
 ROOT = Path(__file__).resolve().parent
 UI_DIR = ROOT / 'ui' / 'static'
-CONFIG = Path(__file__).resolve().parents[1] / 'configuracion' / 'monitores.yaml'
 
 # Ensure project root is on sys.path so `from src...` imports work
 PROJECT_ROOT = ROOT.parent
 if str(PROJECT_ROOT) not in sys.path:
     sys.path.insert(0, str(PROJECT_ROOT))
 
-app = Flask(__name__, static_folder=str(UI_DIR), static_url_path='/static')
-
-DB = get_db()
-
-
-def load_monitors():
-    if not CONFIG.exists():
-        return []
-    if _HAS_YAML:
-        with open(CONFIG, 'r', encoding='utf-8') as f:
-            cfg = yaml.safe_load(f) or {}
-        return cfg.get('monitores', [])
-    # Fallback simple parser: busca líneas con '- nombre:' y 'host:'
-    monitors = []
-    cur = {}
-    with open(CONFIG, 'r', encoding='utf-8') as f:
-        for line in f:
-            line = line.strip()
-            if line.startswith('-'):
-                if cur:
-                    monitors.append(cur)
-                cur = {}
-                line = line.lstrip('-').strip()
-            if ':' in line:
-                k, v = line.split(':', 1)
-                k = k.strip()
-                v = v.strip()
-                if v:
-                    cur[k] = v
-    if cur:
-        monitors.append(cur)
-    # Normalize keys to 'host' and 'nombre'
-    normalized = []
-    for m in monitors:
-        nm = m.get('nombre') or m.get('name') or m.get('nombre:')
-        host = m.get('host') or m.get('ip') or m.get('host:')
-        if host:
-            normalized.append({'nombre': nm or host, 'host': host})
-    return normalized
+# static files go through StaticAssets (ETag, precompressed variants) instead of Flask's
+app = Flask(__name__, static_folder=None)
+ASSETS = StaticAssets(UI_DIR)
+
+CONFIG = get_config()
+STATE_INTERVAL = float(os.environ.get('LEADER_STATE_INTERVAL', '1'))
+
+_DB = None
+_DB_LOCK = threading.Lock()
+
+
+def _db():
+    # created on first use: importing the app must not touch the database
+    global _DB
+    with _DB_LOCK:
+        if _DB is None:
+            _DB = get_db()
+    return _DB
+
+
+@app.before_request
+def _start_timer():
+    g.started = time.perf_counter()
+
+
+@app.after_request
+def _time_request(response):
+    started = g.pop('started', None)
+    if started is not None:
+        # label by URL rule, not raw path, to keep the series bounded;
+        # streamed bodies are timed up to the first byte
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        telemetry.observe_request('flask', request.method, route, response.status_code,
+                                  time.perf_counter() - started)
+    return response
+
+
+@app.route('/metrics')
+def prometheus_metrics():
+    return Response(telemetry.render(), content_type=telemetry.CONTENT_TYPE)
+
+
+@app.route('/debug/profile')
+def debug_profile():
+    # sample every thread for ?seconds=N and return folded stacks
+    seconds = min(max(request.args.get('seconds', 10.0, type=float), 0.1),
+                  telemetry.MAX_PROFILE_SECONDS)
+    try:
+        folded = telemetry.PROFILER.profile(seconds)
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 409
+    return Response(folded, mimetype='text/plain')
+
+
+def _static_response(name):
+    res = ASSETS.respond(name, request.headers.get('Accept-Encoding'),
+                         request.headers.get('If-None-Match'))
+    if res is None:
+        abort(404)
+    if res.body is not None:
+        return Response(res.body, status=res.status, headers=res.headers)
+    # large file: the server's wsgi.file_wrapper (sendfile under gunicorn)
+    body = wrap_file(request.environ, open(res.path, 'rb'))
+    return Response(body, status=res.status, headers=res.headers, direct_passthrough=True)
 
 
 @app.route('/')
 def index():
-    return send_from_directory(str(UI_DIR), 'index.html')
+    return _static_response('index.html')
+
+
+@app.route('/static/<path:name>')
+def static_files(name):
+    return _static_response(name)
 
 
 @app.route('/api/status')
 def status():
-    return jsonify({'status': 'ok', 'service': 'Mi Monitor RED'})
+    return jsonify({'status': 'ok', 'service': 'Mi Monitor RED', 'writer': _db().writer.stats(),
+                    'leader': ELECTOR.status()})
 
 
 @app.route('/api/monitors')
 def get_monitors():
-    data = DB.get_recent(limit=100)
+    data = _db().get_recent(limit=100)
     return jsonify({'count': len(data), 'results': data})
 
 
-def load_networks():
-    cfg_path = Path(__file__).resolve().parents[1] / 'configuracion' / 'redes.yaml'
-    if not cfg_path.exists():
-        return []
+@app.route('/api/export/results')
+def export_results():
+    """Resultados de monitores en [from, to) (epoch; último día por defecto) en
+    streaming como NDJSON, CSV o Parquet (`?format=`)."""
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in export.FORMATS:
+        return jsonify({'error': 'format must be one of %s' % ', '.join(export.FORMATS)}), 400
+    try:
+        end = int(request.args.get('to') or time.time())
+        start = int(request.args.get('from') or end - 86400)
+    except ValueError:
+        return jsonify({'error': 'from/to must be epoch seconds'}), 400
+    if start >= end:
+        return jsonify({'error': 'from must be before to'}), 400
+    docs = _db().iter_results(start, end, request.args.get('name'))
     try:
-        with open(cfg_path, 'r', encoding='utf-8') as f:
-            cfg = _yaml.safe_load(f) or {}
-        return cfg.get('redes', [])
-    except Exception:
-        # minimal parser fallback
-        networks = []
-        with open(cfg_path, 'r', encoding='utf-8') as f:
-            cur = {}
-            for line in f:
-                line = line.strip()
-                if line.startswith('-'):
-                    if cur:
-                        networks.append(cur)
-                    cur = {}
-                    line = line.lstrip('-').strip()
-                if ':' in line:
-                    k, v = line.split(':', 1)
-                    cur[k.strip()] = v.strip()
-            if cur:
-                networks.append(cur)
-        return networks
+        chunks = export.export('monitor_results', docs, fmt)
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 501
+    disposition = 'attachment; filename="monitor_results-%d-%d.%s"' % (start, end, fmt)
+    return Response(chunks, mimetype=export.MEDIA_TYPES[fmt],
+                    headers={'Content-Disposition': disposition})
 
 
 @app.route('/api/devices')
 def api_devices():
     # Return cached devices quickly and trigger background refresh if stale
-    global _DEVICES_CACHE, _DEVICES_CACHE_TS, _DEVICES_LOCK, _SCANNING
-    with _DEVICES_LOCK:
-        cache = _DEVICES_CACHE.copy() if isinstance(_DEVICES_CACHE, list) else []
-        ts = _DEVICES_CACHE_TS
-        scanning = _SCANNING
+    cache, ts, scanning = _devices_state()
 
     return jsonify({
         'count': len(cache),
@@ -135,38 +159,123 @@ def api_devices_refresh():
     return jsonify({'started': True})
 
 
+@app.route('/api/devices/stream')
+def api_devices_stream():
+    """Lanza (o se une a) un escaneo y emite los dispositivos según se
+    descubren: NDJSON por defecto, Server-Sent Events con `?format=sse`."""
+    fmt = pick_format(request.args.get('format'), request.headers.get('Accept'))
+    if ELECTOR.is_leader:
+        events = SCAN_FEED.listen()
+        trigger_devices_scan(async_=True)
+    else:
+        # the live scan runs in the leader process: replay the last published cache
+        trigger_devices_scan(async_=True)
+        cache = _devices_state()[0]
+        events = [dict(d, type='device', network=n['nombre']) for n in cache for d in n['devices']]
+        events.append({'type': 'done'})
+    body = (encode(ev, fmt) for ev in events)
+    return Response(body, mimetype=media_type(fmt),
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
 # --- background cache for devices ---
 _DEVICES_CACHE = []
 _DEVICES_CACHE_TS = None
+_DEVICES_INDEX = {}
 _DEVICES_LOCK = threading.Lock()
 _SCANNING = False
+SCAN_FEED = EventFeed()
+# the leader publishes its cache here; the other workers serve /api/devices from it
+DEVICES_STATE = SharedFile('app-devices')
+SCAN_REQUEST = SharedFile('app-scan-request')
+# /api/refresh on a follower: the leader runs the round and publishes its results
+REFRESH_REQUEST = SharedFile('app-refresh-request')
+REFRESH_RESULTS = SharedFile('app-refresh-results')
+REFRESH_WAIT = 15.0
+
+
+def _devices_state():
+    """(networks, cached_at, scanning) de este proceso o del líder."""
+    if not ELECTOR.is_leader:
+        state = DEVICES_STATE.read({})
+        return state.get('networks', []), state.get('cached_at'), state.get('scanning', False)
+    with _DEVICES_LOCK:
+        # the scanner updates entries in place, so copy them under the lock
+        cache = [dict(n, devices=[dict(d) for d in n['devices']]) for n in _DEVICES_CACHE]
+        return cache, _DEVICES_CACHE_TS, _SCANNING
+
+
+def _set_hostname(device, hostname):
+    # names arrive from the resolver pool after the ping phase
+    with _DEVICES_LOCK:
+        _DEVICES_INDEX.get(device['ip'], device)['hostname'] = hostname
+    SCAN_FEED.publish({'type': 'hostname', 'ip': device['ip'], 'hostname': hostname})
+
+
+def _network_entry(name, cidr):
+    # caller holds _DEVICES_LOCK
+    for entry in _DEVICES_CACHE:
+        if entry['nombre'] == name:
+            entry['cidr'] = cidr
+            return entry
+    entry = {'nombre': name, 'cidr': cidr, 'devices': []}
+    _DEVICES_CACHE.append(entry)
+    return entry
 
 
 def do_devices_scan():
-    global _DEVICES_CACHE, _DEVICES_CACHE_TS, _SCANNING
+    """Escanea todas las redes actualizando la caché dispositivo a dispositivo
+    y publicando cada resultado en `SCAN_FEED`."""
+    global _DEVICES_CACHE, _DEVICES_CACHE_TS, _DEVICES_INDEX, _SCANNING
     with _DEVICES_LOCK:
         if _SCANNING:
             return
         _SCANNING = True
     try:
-        nets = load_networks()
-        out = []
+        nets = CONFIG.networks()
+        PROBE_SCHEDULER.set_targets({n.nombre: n.cidr for n in nets})
+        names = set()
         for net in nets:
-            name = net.get('nombre') or net.get('name') or str(net.get('cidr'))
-            cidr = net.get('cidr')
-            if not cidr:
-                continue
-            devices = scan_cidr(str(cidr))
-            out.append({'nombre': name, 'cidr': cidr, 'devices': devices})
+            name, cidr = net.nombre, net.cidr
+            names.add(name)
+            with _DEVICES_LOCK:
+                entry = _network_entry(name, cidr)
+            SCAN_FEED.publish({'type': 'network', 'nombre': name, 'cidr': cidr})
+            started = time.perf_counter()
+            for device in iter_scan_cidr(cidr, on_hostname=_set_hostname):
+                PROBE_SCHEDULER.observe(device['ip'], device['ok'])
+                SCAN_HOSTS.labels(name, 'up' if device['ok'] else 'down').inc()
+                with _DEVICES_LOCK:
+                    known = _DEVICES_INDEX.get(device['ip'])
+                    if known is not None:
+                        # keep the last known name until the resolver answers
+                        device['hostname'] = device['hostname'] or known.get('hostname')
+                        known.update(device)
+                    else:
+                        entry['devices'].append(device)
+                        _DEVICES_INDEX[device['ip']] = known = device
+                    _DEVICES_CACHE_TS = datetime.utcnow().isoformat()
+                    event = dict(known, type='device', network=name)
+                SCAN_FEED.publish(event)
+            SCAN_SECONDS.labels(name).observe(time.perf_counter() - started)
+            with _DEVICES_LOCK:
+                # online devices first
+                entry['devices'].sort(key=lambda d: (not d['ok'], d['ip']))
         with _DEVICES_LOCK:
-            _DEVICES_CACHE = out
+            _DEVICES_CACHE = [n for n in _DEVICES_CACHE if n['nombre'] in names]
+            _DEVICES_INDEX = {d['ip']: d for n in _DEVICES_CACHE for d in n['devices']}
             _DEVICES_CACHE_TS = datetime.utcnow().isoformat()
     finally:
         with _DEVICES_LOCK:
             _SCANNING = False
+        SCAN_FEED.publish({'type': 'done'})
 
 
 def trigger_devices_scan(async_=True):
+    if not ELECTOR.is_leader:
+        # only the leader scans; it notices the touched file on its next sync
+        SCAN_REQUEST.touch()
+        return
     # start a background thread to update the cache
     if async_:
         t = threading.Thread(target=do_devices_scan, daemon=True)
@@ -175,25 +284,143 @@ def trigger_devices_scan(async_=True):
         do_devices_scan()
 
 
-# Start an initial async scan on startup
-trigger_devices_scan(async_=True)
+def _on_neighbor(event, ip, info):
+    # kernel neighbor events keep presence/MAC fresh between full sweeps
+    global _DEVICES_CACHE_TS
+    with _DEVICES_LOCK:
+        device = _DEVICES_INDEX.get(ip)
+        if device is None or not apply_neighbor(device, event, info):
+            return
+        _DEVICES_CACHE_TS = datetime.utcnow().isoformat()
+        update = dict(device, type='device')
+    SCAN_FEED.publish(update)
+
+
+def _on_probe(state, result, changed):
+    # adaptive re-probes between full sweeps (see monitores/scheduler.py)
+    global _DEVICES_CACHE_TS
+    with _DEVICES_LOCK:
+        device = _DEVICES_INDEX.get(state.ip)
+        if device is None:
+            return
+        device.update(ok=result['ok'], rtt_ms=result['rtt_ms'], timestamp=result['timestamp'])
+        _DEVICES_CACHE_TS = datetime.utcnow().isoformat()
+        update = dict(device, type='device', network=state.network)
+    if changed:
+        SCAN_FEED.publish(update)
+
+
+PROBE_SCHEDULER = ProbeScheduler(_on_probe, rate=float(os.environ.get('PROBE_RATE', DEFAULT_RATE)))
+
+# Monitor checks run on their own schedule; results also go to DB history
+MONITOR_RUNNER = MonitorRunner(on_result=lambda res: _db().insert_result(res))
+MONITOR_RUNNER.set_monitors(CONFIG.monitors())
+
+
+@CONFIG.on_change
+def _on_config_change(kind, old, new):
+    # edits to redes.yaml / monitores.yaml apply without a restart
+    if kind == 'monitors':
+        MONITOR_RUNNER.set_monitors(new)
+    elif kind == 'networks':
+        trigger_devices_scan(async_=True)
+
+
+# --- background workers: only the elected process scans, probes and runs monitors ---
+_WORKERS = {}
+_SYNC = {'scan_request': 0.0, 'refresh_request': 0.0, 'published': None}
+_BACKGROUND = threading.Lock()
+_BACKGROUND_PID = [None]
+
+
+def _start_workers():
+    # a request left before this process won the election was for the old leader
+    _SYNC['scan_request'] = SCAN_REQUEST.mtime()
+    _SYNC['refresh_request'] = REFRESH_REQUEST.mtime()
+    trigger_devices_scan(async_=True)
+    _WORKERS['watcher'] = start_watcher(_on_neighbor)
+    PROBE_SCHEDULER.start()
+    MONITOR_RUNNER.start()
+
+
+def _stop_workers():
+    watcher = _WORKERS.pop('watcher', None)
+    if watcher is not None:
+        watcher.stop()
+    PROBE_SCHEDULER.stop()
+    MONITOR_RUNNER.stop()
+    _SYNC['published'] = None
+
+
+ELECTOR = Elector(FileLock('app-leader'), _start_workers, _stop_workers)
+
+
+def _sync_loop():
+    while True:
+        time.sleep(STATE_INTERVAL)
+        if not ELECTOR.is_leader:
+            continue
+        try:
+            with _DEVICES_LOCK:
+                sig = (_DEVICES_CACHE_TS, _SCANNING)
+            if sig != _SYNC['published']:
+                cache, ts, scanning = _devices_state()
+                DEVICES_STATE.publish({'networks': cache, 'cached_at': ts, 'scanning': scanning})
+                _SYNC['published'] = sig
+            requested = SCAN_REQUEST.mtime()
+            if requested > _SYNC['scan_request']:
+                _SYNC['scan_request'] = requested
+                trigger_devices_scan(async_=True)
+            requested = REFRESH_REQUEST.mtime()
+            if requested > _SYNC['refresh_request']:
+                _SYNC['refresh_request'] = requested
+                threading.Thread(target=_run_refresh, name='monitor-refresh', daemon=True).start()
+        except Exception as e:
+            app.logger.warning('state sync failed: %s', e)
+
+
+def start_background():
+    """Arranca la elección de líder, la vigilancia de la configuración y la
+    sincronización de estado en este proceso (una vez por proceso). La llaman
+    `src/wsgi.py` y `__main__`; importar la app no arranca nada."""
+    if _BACKGROUND_PID[0] == os.getpid():
+        return
+    with _BACKGROUND:
+        if _BACKGROUND_PID[0] == os.getpid():
+            return
+        _BACKGROUND_PID[0] = os.getpid()
+        CONFIG.watch()
+        threading.Thread(target=_sync_loop, name='leader-sync', daemon=True).start()
+        ELECTOR.start()
+
+
+def _run_refresh() -> list:
+    # on-demand round using the same engine as the scheduled checks
+    results = MONITOR_RUNNER.run_now()
+    REFRESH_RESULTS.publish({'ts': time.time(), 'results': results})
+    return results
 
 
 @app.route('/api/refresh', methods=['POST'])
 def refresh():
-    monitors = load_monitors()
-    results = []
-    for m in monitors:
-        host = m.get('host')
-        name = m.get('nombre') or host
-        res = run_ping(host)
-        res['name'] = name
-        DB.insert_result(res)
-        results.append(res)
-    return jsonify({'count': len(results), 'results': results})
+    if ELECTOR.is_leader:
+        results = _run_refresh()
+        return jsonify({'count': len(results), 'results': results})
+    # only the leader probes: ask it and wait for the round it publishes
+    asked = time.time()
+    REFRESH_REQUEST.touch()
+    deadline = time.monotonic() + REFRESH_WAIT
+    while time.monotonic() < deadline:
+        state = REFRESH_RESULTS.read({})
+        if state.get('ts', 0) >= asked:
+            results = state['results']
+            return jsonify({'count': len(results), 'results': results})
+        time.sleep(0.1)
+    return jsonify({'error': 'leader did not answer the refresh in time'}), 504
 
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 8000))
     print(f"Arrancando servidor en http://0.0.0.0:{port}")
+    start_background()
     app.run(host='0.0.0.0', port=port)
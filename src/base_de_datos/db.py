@@ -1,16 +1,20 @@
 import os
-import json
 from pathlib import Path
 from datetime import datetime
 
+from base_de_datos.export import EXPORT_BATCH, monitor_results_docs
+from base_de_datos.repository import mongo_options
+from base_de_datos.store import LocalStore
+from base_de_datos.writer import get_writer
+
 try:
     from pymongo import MongoClient
     MONGO_AVAILABLE = True
 except Exception:
     MONGO_AVAILABLE = False
 
+# Legacy JSON fallback, migrated into LocalStore (SQLite) on first use
 DB_FILE = Path(__file__).resolve().parents[3] / 'datos' / 'monitors.json'
-DB_FILE.parent.mkdir(parents=True, exist_ok=True)
 
 class DBClient:
     def __init__(self, mongo_uri=None, db_name='mi_monitor_red'):
@@ -18,48 +22,56 @@ class DBClient:
         self.db_name = db_name
         self.client = None
         self.col = None
+        self.store = None
+        self.writer = get_writer()
         if self.mongo_uri and MONGO_AVAILABLE:
             try:
-                self.client = MongoClient(self.mongo_uri, serverSelectionTimeoutMS=2000)
+                self.client = MongoClient(self.mongo_uri, **dict(mongo_options(), serverSelectionTimeoutMS=2000))
                 self.col = self.client[self.db_name]['results']
                 # Force a connection check
                 self.client.server_info()
             except Exception:
                 self.client = None
                 self.col = None
+        if self.col is None:
+            self.store = LocalStore()
+            if DB_FILE.exists():
+                self.store.import_json(DB_FILE)
 
     def insert_result(self, result: dict):
-        result = dict(result)
-        result.setdefault('timestamp', datetime.utcnow().isoformat())
-        if self.col:
-            self.col.insert_one(result)
-        else:
-            data = self._read_file()
-            data.append(result)
-            self._write_file(data)
+        self.insert_results([result])
+
+    def insert_results(self, results):
+        """Encola resultados en la capa write-behind; se escriben en lotes
+        (bulk_write no ordenado en Mongo, una transacción en SQLite)."""
+        docs = []
+        for result in results:
+            result = dict(result)
+            result.setdefault('timestamp', datetime.utcnow().isoformat())
+            docs.append(result)
+        for doc in docs:
+            if self.col is not None:
+                self.writer.insert(self.col, doc)
+            else:
+                self.writer.submit(self.store.insert_many, doc)
+
+    def iter_results(self, start: float, end: float, name: str = None, batch: int = EXPORT_BATCH):
+        """Resultados con `start <= timestamp < end` (epoch UTC, como los
+        `timestamp` ISO sin zona que se guardan) en orden cronológico, por lotes
+        (memoria constante); antes vacía la cola write-behind."""
+        self.writer.flush()
+        if self.col is not None:
+            return monitor_results_docs(self.col, start, end, name, batch)
+        return self.store.iter_range(start, end, batch, name)
 
     def get_recent(self, limit=50):
-        if self.col:
+        if self.col is not None:
             docs = list(self.col.find().sort('timestamp', -1).limit(limit))
             for d in docs:
                 d['_id'] = str(d.get('_id'))
             return docs
         else:
-            data = self._read_file()
-            return list(reversed(data))[-limit:]
-
-    def _read_file(self):
-        if not DB_FILE.exists():
-            return []
-        try:
-            with open(DB_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except Exception:
-            return []
-
-    def _write_file(self, data):
-        with open(DB_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
+            return self.store.tail(limit)
 
 
 # Helper simple client factory
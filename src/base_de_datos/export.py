@@ -0,0 +1,195 @@
+"""Exportación en streaming de métricas, eventos de dispositivos y resultados.
+
+Los documentos se leen con cursores del servidor (`batch_size`
+`EXPORT_BATCH`, orden por el campo de tiempo indexado) y se escriben por
+trozos en NDJSON, CSV o Parquet (`pyarrow`, opcional: un row group por
+lote). Nada acumula el resultado completo: la memoria es la de un lote,
+así que un año de datos sale por la API o por `src/exportar.py` sin
+agotar la memoria del worker.
+
+    for chunk in export('metrics', metrics_docs(db, start, end), 'csv'):
+        out.write(chunk)
+"""
+import csv
+import io
+import json
+import os
+from datetime import datetime
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except Exception:
+    pa = pq = None
+
+EXPORT_BATCH = int(os.getenv('EXPORT_BATCH', '5000'))
+CHUNK_BYTES = 64 * 1024
+FORMATS = ('ndjson', 'csv', 'parquet')
+MEDIA_TYPES = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv; charset=utf-8',
+               'parquet': 'application/vnd.apache.parquet'}
+
+# column name, type ('int', 'float', 'bool', 'str') for CSV headers and the Parquet schema
+COLUMNS = {
+    'metrics': [('ts', 'int'), ('metric', 'str'), ('value', 'float')],
+    'rollups': [('ts', 'int'), ('metric', 'str'), ('count', 'int'), ('sum', 'float'),
+                ('min', 'float'), ('max', 'float')],
+    'device_events': [('ts', 'int'), ('ip', 'str'), ('network', 'str'), ('type', 'str'),
+                      ('old', 'str'), ('new', 'str')],
+    'monitor_results': [('timestamp', 'str'), ('name', 'str'), ('host', 'str'), ('type', 'str'),
+                        ('ok', 'bool'), ('rtt_ms', 'float'), ('error', 'str')],
+}
+DATASETS = ('metrics', 'device_events', 'monitor_results')
+RESOLUTIONS = ('1m', '1h', '1d')
+
+
+def _iso(ts: float) -> str:
+    # monitor results carry naive UTC ISO timestamps (see monitores/services.py)
+    return datetime.utcfromtimestamp(ts).isoformat()
+
+
+def _cursor(col, flt: dict, sort_field: str, batch: int):
+    return col.find(flt, {'_id': 0, 'expire_at': 0}).sort(sort_field, 1).batch_size(batch)
+
+
+# -- sources ------------------------------------------------------------------------
+def metrics_docs(db, start: float, end: float, metric: str = None, resolution: str = None,
+                 batch: int = EXPORT_BATCH):
+    """Muestras crudas (`metrics`) o buckets de rollup (`metrics_1m` ...)."""
+    name = 'metrics' if not resolution else 'metrics_%s' % resolution
+    flt = {'ts': {'$gte': int(start), '$lt': int(end)}}
+    if metric:
+        flt['metric'] = metric
+    return _cursor(db.get_collection(name), flt, 'ts', batch)
+
+
+def device_events_docs(db, start: float, end: float, ip: str = None, batch: int = EXPORT_BATCH):
+    flt = {'ts': {'$gte': int(start), '$lt': int(end)}}
+    if ip:
+        flt['ip'] = ip
+    return _cursor(db.get_collection('device_events'), flt, 'ts', batch)
+
+
+def monitor_results_docs(col, start: float, end: float, name: str = None,
+                         batch: int = EXPORT_BATCH):
+    flt = {'timestamp': {'$gte': _iso(start), '$lt': _iso(end)}}
+    if name:
+        flt['name'] = name
+    return _cursor(col, flt, 'timestamp', batch)
+
+
+# -- writers ------------------------------------------------------------------------
+def _cell(value, kind: str):
+    if value is None:
+        return None
+    try:
+        if kind == 'int':
+            return int(value)
+        if kind == 'float':
+            return float(value)
+        if kind == 'bool':
+            return bool(value)
+    except (TypeError, ValueError):
+        return None
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False, default=str)
+    return str(value)
+
+
+def ndjson_chunks(docs):
+    buf, size = [], 0
+    for doc in docs:
+        line = json.dumps(doc, ensure_ascii=False, default=str) + '\n'
+        buf.append(line)
+        size += len(line)
+        if size >= CHUNK_BYTES:
+            yield ''.join(buf).encode('utf-8')
+            buf, size = [], 0
+    if buf:
+        yield ''.join(buf).encode('utf-8')
+
+
+def csv_chunks(docs, columns):
+    out = io.StringIO()
+    w = csv.writer(out)
+    w.writerow([name for name, _kind in columns])
+    for doc in docs:
+        w.writerow(['' if v is None else v
+                    for v in (_cell(doc.get(name), kind) for name, kind in columns)])
+        if out.tell() >= CHUNK_BYTES:
+            yield out.getvalue().encode('utf-8')
+            out.seek(0)
+            out.truncate()
+    if out.tell():
+        yield out.getvalue().encode('utf-8')
+
+
+class _Drain:
+    """Fichero de solo escritura cuyo contenido se recoge a trozos."""
+
+    closed = False
+
+    def __init__(self):
+        self.parts = []
+        self.pos = 0
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.pos += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.pos
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self) -> bytes:
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+
+def parquet_chunks(docs, columns, batch: int = EXPORT_BATCH):
+    types = {'int': pa.int64(), 'float': pa.float64(), 'bool': pa.bool_(), 'str': pa.string()}
+    schema = pa.schema([(name, types[kind]) for name, kind in columns])
+    sink = _Drain()
+    writer = pq.ParquetWriter(sink, schema, compression='zstd')
+    cols = {name: [] for name, _kind in columns}
+
+    def row_group():
+        writer.write_table(pa.Table.from_pydict(cols, schema=schema))
+        for values in cols.values():
+            values.clear()
+        return sink.take()
+
+    n = 0
+    for doc in docs:
+        for name, kind in columns:
+            cols[name].append(_cell(doc.get(name), kind))
+        n += 1
+        if n >= batch:
+            n = 0
+            yield row_group()
+    if n:
+        yield row_group()
+    writer.close()
+    tail = sink.take()
+    if tail:
+        yield tail
+
+
+def export(dataset: str, docs, fmt: str = 'ndjson'):
+    """Itera los bytes de `docs` en `fmt`; `dataset` fija las columnas de CSV y Parquet."""
+    if fmt == 'ndjson':
+        return ndjson_chunks(docs)
+    if fmt == 'csv':
+        return csv_chunks(docs, COLUMNS[dataset])
+    if fmt == 'parquet':
+        # checked here, not in the generator: before any response headers go out
+        if pa is None:
+            raise RuntimeError('parquet export requires pyarrow')
+        return parquet_chunks(docs, COLUMNS[dataset])
+    raise ValueError('unknown format: %s' % fmt)
@@ -0,0 +1,147 @@
+"""Acceso a datos asíncrono para los handlers `async def` de la API.
+
+Las lecturas de la API (métricas, log de dispositivos, historial de
+monitores) no deben ocupar el pool de hilos de Starlette ni bloquear el
+bucle de eventos mientras esperan a la base de datos:
+
+`MongoRepository` usa un driver asíncrono nativo (`pymongo.AsyncMongoClient`
+con pymongo >= 4.10, o `motor` si es lo que hay instalado) y aplica un
+tiempo máximo por consulta (`maxTimeMS` en el servidor y un `wait_for`
+local); al superarlo lanza `RepositoryTimeout`, que la API
+traduce a 504. El pool de conexiones se ajusta con `MONGO_POOL_MAX`,
+`MONGO_POOL_MIN`, `MONGO_POOL_IDLE_MS` y `MONGO_QUERY_TIMEOUT_MS`; el
+cliente síncrono que siguen usando los hilos de fondo comparte
+`mongo_options()`.
+
+Las escrituras siguen pasando por la capa write-behind (`writer.py`).
+"""
+import asyncio
+import os
+import time
+
+from base_de_datos.rollups import fold
+
+try:
+    from pymongo import AsyncMongoClient
+    ASYNC_DRIVER = 'pymongo'
+except ImportError:
+    try:
+        from motor.motor_asyncio import AsyncIOMotorClient as AsyncMongoClient
+        ASYNC_DRIVER = 'motor'
+    except ImportError:
+        AsyncMongoClient = None
+        ASYNC_DRIVER = None
+
+try:
+    from pymongo.errors import ExecutionTimeout
+except Exception:
+    ExecutionTimeout = None
+
+POOL_MAX = int(os.getenv('MONGO_POOL_MAX', '50'))
+POOL_MIN = int(os.getenv('MONGO_POOL_MIN', '2'))
+POOL_IDLE_MS = int(os.getenv('MONGO_POOL_IDLE_MS', '60000'))
+QUERY_TIMEOUT_MS = int(os.getenv('MONGO_QUERY_TIMEOUT_MS', '2000'))
+MAX_LIMIT = 1000
+
+
+class RepositoryTimeout(Exception):
+    """Una consulta superó su tiempo máximo."""
+
+
+def mongo_options() -> dict:
+    """Opciones de pool comunes a los clientes síncrono y asíncrono."""
+    return {
+        'maxPoolSize': POOL_MAX,
+        'minPoolSize': POOL_MIN,
+        'maxIdleTimeMS': POOL_IDLE_MS,
+        'connectTimeoutMS': 5000,
+        # fail fast when the server is gone instead of queueing requests
+        'serverSelectionTimeoutMS': 5000,
+    }
+
+
+def _limit(n: int) -> int:
+    return max(1, min(int(n), MAX_LIMIT))
+
+
+class MongoRepository:
+    """Consultas de la API sobre un cliente MongoDB asíncrono."""
+
+    def __init__(self, uri: str, db_name: str = 'monitor', results: str = 'monitor_results',
+                 timeout_ms: int = QUERY_TIMEOUT_MS):
+        if AsyncMongoClient is None:
+            raise RuntimeError('async MongoDB driver not installed (pymongo>=4.10 or motor)')
+        self.client = AsyncMongoClient(uri, **mongo_options())
+        self.db = self.client.get_database(db_name)
+        self.timeout_ms = timeout_ms
+        self.metrics = self.db.get_collection('metrics')
+        self.device_events = self.db.get_collection('device_events')
+        self.device_presence = self.db.get_collection('device_presence')
+        self.results = self.db.get_collection(results)
+        self.runtime = self.db.get_collection('runtime')
+
+    async def _run(self, coro):
+        # maxTimeMS stops the query on the server; wait_for also covers
+        # server selection and a stalled connection
+        try:
+            return await asyncio.wait_for(coro, self.timeout_ms / 1000.0 + 1.0)
+        except asyncio.TimeoutError:
+            raise RepositoryTimeout('query exceeded %d ms' % self.timeout_ms) from None
+        except Exception as e:
+            if ExecutionTimeout is not None and isinstance(e, ExecutionTimeout):
+                raise RepositoryTimeout(str(e)) from None
+            raise
+
+    def _find(self, col, flt, fields, sort, limit=None):
+        cursor = col.find(flt, fields).sort(*sort).max_time_ms(self.timeout_ms)
+        if limit is not None:
+            cursor = cursor.limit(limit)
+        return self._run(cursor.to_list(length=None))
+
+    async def latest_metrics(self, limit: int = 100) -> list:
+        return await self._find(self.metrics, {}, {'_id': 0, 'expire_at': 0}, ('ts', -1),
+                                _limit(limit))
+
+    async def metric_series(self, rollups, metric: str, start: int, end: int,
+                            step: int = None) -> dict:
+        """Como `MetricRollups.query()`, leyendo la resolución elegida en asíncrono."""
+        res, step, col, flt, fields = rollups.plan(metric, start, end, step)
+        docs = await self._find(self.db.get_collection(col.name), flt, fields, ('ts', 1))
+        return fold(docs, metric, start, end, step, res)
+
+    async def device_events(self, since: int = None, ip: str = None, type: str = None,
+                            limit: int = 100) -> list:
+        flt = {}
+        if since is not None:
+            flt['ts'] = {'$gt': since}
+        if ip:
+            flt['ip'] = ip
+        if type:
+            flt['type'] = type
+        return await self._find(self.device_events, flt, {'_id': 0, 'expire_at': 0}, ('ts', -1),
+                                _limit(limit))
+
+    async def presence(self, day_from: int, day_to: int, ips=None, slot: int = None) -> list:
+        """Bitmaps diarios `{ip, day, bits}`; con `slot`, solo los que tienen ese bit a 1."""
+        flt = {'day': {'$gte': day_from, '$lte': day_to}}
+        if ips:
+            flt['ip'] = {'$in': list(ips)}
+        if slot is not None:
+            flt['bits'] = {'$bitsAllSet': [slot]}
+        return await self._find(self.device_presence, flt, {'_id': 0, 'ip': 1, 'day': 1, 'bits': 1},
+                                ('day', 1))
+
+    async def recent_results(self, limit: int = 50, name: str = None) -> list:
+        flt = {'name': name} if name else {}
+        return await self._find(self.results, flt, {'_id': 0}, ('timestamp', -1), _limit(limit))
+
+    async def request_scan(self):
+        """Deja una petición de escaneo para el proceso líder."""
+        await self._run(self.runtime.update_one({'_id': 'scan_request'},
+                                                {'$set': {'ts': time.time()}}, upsert=True))
+
+    async def close(self):
+        res = self.client.close()
+        if asyncio.iscoroutine(res):
+            # pymongo's AsyncMongoClient.close() is a coroutine, motor's is not
+            await res
@@ -0,0 +1,137 @@
+"""Rollups de series temporales para `metrics`.
+
+Cada muestra cruda se agrega de forma incremental en buckets de 1 minuto,
+1 hora y 1 día por métrica (`count`, `sum`, `min`, `max`; la media se
+calcula al leer) mediante upserts `$inc/$min/$max` que la capa write-behind
+fusiona por bucket. Cada resolución tiene su propia retención (índice TTL
+sobre `expire_at`) y un índice `(metric, ts)`.
+
+`query()` elige la resolución más gruesa que aún satisface el `step`
+pedido y cuya retención cubre el rango, de modo que un gráfico de 30 días
+lee unos cientos de documentos en lugar de cientos de miles de muestras.
+"""
+from datetime import datetime, timedelta, timezone
+
+MAX_POINTS = 1000
+
+# name, bucket seconds, retention
+RESOLUTIONS = (
+    ('raw', 0, timedelta(days=7)),
+    ('1m', 60, timedelta(days=30)),
+    ('1h', 3600, timedelta(days=365)),
+    ('1d', 86400, timedelta(days=365 * 5)),
+)
+
+
+def _expire_at(ts: int, retention: timedelta) -> datetime:
+    return datetime.fromtimestamp(ts, tz=timezone.utc) + retention
+
+
+class MetricRollups:
+    """Mantiene y consulta las colecciones `metrics`, `metrics_1m`, `metrics_1h`, `metrics_1d`."""
+
+    def __init__(self, db, writer, raw_col=None):
+        self.writer = writer
+        self.cols = {'raw': raw_col if raw_col is not None else db.get_collection('metrics')}
+        for name, size, _ret in RESOLUTIONS[1:]:
+            self.cols[name] = db.get_collection('metrics_%s' % name)
+        self.retention = {name: ret for name, _size, ret in RESOLUTIONS}
+        self.sizes = {name: size for name, size, _ret in RESOLUTIONS}
+
+    def ensure_indexes(self):
+        raw = self.cols['raw']
+        raw.create_index([('metric', 1), ('ts', 1)])
+        raw.create_index('expire_at', expireAfterSeconds=0)
+        for name, _size, _ret in RESOLUTIONS[1:]:
+            col = self.cols[name]
+            col.create_index([('metric', 1), ('ts', 1)], unique=True)
+            col.create_index('expire_at', expireAfterSeconds=0)
+
+    def add(self, metric: str, ts: int, value: float):
+        """Registra una muestra: inserción cruda + actualización de cada bucket."""
+        ts = int(ts)
+        self.writer.insert(self.cols['raw'], {
+            'ts': ts, 'metric': metric, 'value': value,
+            'expire_at': _expire_at(ts, self.retention['raw'])})
+        for name, size, ret in RESOLUTIONS[1:]:
+            bucket = ts - ts % size
+            self.writer.update(self.cols[name], {'metric': metric, 'ts': bucket}, {
+                '$inc': {'count': 1, 'sum': value},
+                '$min': {'min': value},
+                '$max': {'max': value},
+                '$setOnInsert': {'expire_at': _expire_at(bucket, ret)},
+            })
+
+    def pick_resolution(self, start: int, end: int, step: int = None):
+        """Resolución más gruesa con bucket <= step cuya retención cubre `start`."""
+        if not step:
+            step = max(1, (end - start) // MAX_POINTS)
+        now = datetime.now(timezone.utc).timestamp()
+        covering = [name for name, _size, ret in RESOLUTIONS
+                    if now - ret.total_seconds() <= start]
+        fitting = [name for name in covering if self.sizes[name] <= step]
+        if fitting:
+            return fitting[-1], step
+        if covering:
+            # step finer than any resolution that still has data: use the finest available
+            return covering[0], step
+        # range older than every retention: the longest-lived resolution is all there is
+        return RESOLUTIONS[-1][0], step
+
+    def plan(self, metric: str, start: int, end: int, step: int = None):
+        """(resolución, step, colección, filtro, proyección) de una consulta;
+        la comparten `query()` y el repositorio asíncrono."""
+        res, step = self.pick_resolution(start, end, step)
+        size = self.sizes[res]
+        if size:
+            # whole buckets only: round the step up to a multiple of the bucket size
+            step = max(size, -(-step // size) * size)
+        step = max(int(step), 1)
+        fields = {'_id': 0, 'ts': 1, 'value': 1} if res == 'raw' else \
+            {'_id': 0, 'ts': 1, 'count': 1, 'sum': 1, 'min': 1, 'max': 1}
+        flt = {'metric': metric, 'ts': {'$gte': int(start), '$lt': int(end)}}
+        return res, step, self.cols[res], flt, fields
+
+    def query(self, metric: str, start: int, end: int, step: int = None) -> dict:
+        res, step, col, flt, fields = self.plan(metric, start, end, step)
+        cursor = col.find(flt, fields).sort('ts', 1).batch_size(1000)
+        return fold(cursor, metric, start, end, step, res)
+
+
+class _Folder:
+    """Acumula documentos (crudos o buckets) en puntos de `step` segundos."""
+
+    def __init__(self, step: int, res: str):
+        self.step = step
+        self.res = res
+        self.points = []
+        self._cur = None
+
+    def add(self, doc):
+        if self.res == 'raw':
+            v = doc['value']
+            count, total, lo, hi = 1, v, v, v
+        else:
+            count, total, lo, hi = doc['count'], doc['sum'], doc['min'], doc['max']
+        bucket = doc['ts'] - doc['ts'] % self.step
+        cur = self._cur
+        if cur is None or cur['ts'] != bucket:
+            cur = self._cur = {'ts': bucket, 'count': 0, 'sum': 0.0, 'min': lo, 'max': hi}
+            self.points.append(cur)
+        cur['count'] += count
+        cur['sum'] += total
+        cur['min'] = min(cur['min'], lo)
+        cur['max'] = max(cur['max'], hi)
+
+    def result(self, metric: str, start: int, end: int) -> dict:
+        for p in self.points:
+            p['avg'] = p.pop('sum') / p['count'] if p['count'] else None
+        return {'metric': metric, 'from': int(start), 'to': int(end), 'step': self.step,
+                'resolution': self.res, 'points': self.points}
+
+
+def fold(docs, metric: str, start: int, end: int, step: int, res: str) -> dict:
+    folder = _Folder(step, res)
+    for doc in docs:
+        folder.add(doc)
+    return folder.result(metric, start, end)
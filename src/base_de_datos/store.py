@@ -0,0 +1,170 @@
+"""Almacén local (sin MongoDB) sobre SQLite en modo WAL.
+
+Sustituye al antiguo `monitors.json` que se reescribía entero en cada
+inserción: las escrituras son transacciones por lotes, las lecturas de
+"últimos N" usan el índice de rowid sin cargar el historial y la retención
+borra por rango de tiempo. Usa `data/monitor.db` (el mismo fichero que ya
+tenía las tablas `metrics` y `devices` del MVP).
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+DB_PATH = Path(os.getenv('MONITOR_DB', Path(__file__).resolve().parents[2] / 'data' / 'monitor.db'))
+RETENTION_DAYS = float(os.getenv('RESULTS_RETENTION_DAYS', '30'))
+RETENTION_EVERY = 1000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts REAL NOT NULL,
+    name TEXT,
+    host TEXT,
+    ok INTEGER,
+    rtt_ms REAL,
+    doc TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_ts ON results (ts);
+CREATE INDEX IF NOT EXISTS results_name_ts ON results (name, ts);
+"""
+
+
+# user_version 1: `ts` of naive timestamps computed as UTC (earlier rows used local time)
+SCHEMA_VERSION = 1
+
+
+def _epoch(value) -> float:
+    # producers write naive UTC (`datetime.utcnow().isoformat()`): never read them as local time
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            return time.time()
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.timestamp()
+    return time.time()
+
+
+class LocalStore:
+    """Tabla `results` en SQLite (WAL) con una conexión por hilo."""
+
+    def __init__(self, path=DB_PATH, retention_days: float = RETENTION_DAYS):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.retention_days = retention_days
+        self._local = threading.local()
+        self._inserted = 0
+        self._lock = threading.Lock()
+        with self._conn() as conn:
+            conn.executescript(_SCHEMA)
+            if conn.execute('PRAGMA user_version').fetchone()[0] < SCHEMA_VERSION:
+                self._recompute_ts(conn)
+                conn.execute('PRAGMA user_version = %d' % SCHEMA_VERSION)
+
+    @staticmethod
+    def _recompute_ts(conn):
+        # rows written before the UTC fix are shifted by the host's UTC offset
+        last_id = 0
+        while True:
+            rows = conn.execute('SELECT id, doc FROM results WHERE id > ? ORDER BY id LIMIT 1000',
+                                (last_id,)).fetchall()
+            if not rows:
+                return
+            fixed = []
+            for _id, doc in rows:
+                try:
+                    fixed.append((_epoch(json.loads(doc).get('timestamp')), _id))
+                except (ValueError, AttributeError):
+                    continue
+            conn.executemany('UPDATE results SET ts = ? WHERE id = ?', fixed)
+            last_id = rows[-1][0]
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=10, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def insert_many(self, docs):
+        """Inserta un lote de resultados en una sola transacción."""
+        rows = []
+        for d in docs:
+            rows.append((_epoch(d.get('timestamp')), d.get('name'), d.get('host'),
+                         None if d.get('ok') is None else int(bool(d.get('ok'))),
+                         d.get('rtt_ms'), json.dumps(d, ensure_ascii=False, default=str)))
+        if not rows:
+            return 0
+        with self._conn() as conn:
+            conn.executemany('INSERT INTO results (ts, name, host, ok, rtt_ms, doc) '
+                             'VALUES (?, ?, ?, ?, ?, ?)', rows)
+        with self._lock:
+            self._inserted += len(rows)
+            due = self._inserted >= RETENTION_EVERY
+            if due:
+                self._inserted = 0
+        if due and self.retention_days:
+            self.apply_retention(self.retention_days)
+        return len(rows)
+
+    def tail(self, limit: int = 50, name: str = None) -> list:
+        """Últimos `limit` resultados (de `name` si se indica), del más reciente al más antiguo."""
+        if name:
+            cur = self._conn().execute('SELECT doc FROM results WHERE name = ? '
+                                       'ORDER BY ts DESC, id DESC LIMIT ?', (name, int(limit)))
+        else:
+            cur = self._conn().execute('SELECT doc FROM results ORDER BY id DESC LIMIT ?',
+                                       (int(limit),))
+        return [json.loads(doc) for (doc,) in cur]
+
+    def iter_range(self, start: float = None, end: float = None, batch: int = 1000,
+                   name: str = None):
+        """Itera resultados con `start <= ts < end` (epoch UTC) en orden
+        cronológico, de `name` si se indica, por páginas de `batch` filas
+        (memoria constante). Pagina por `(ts, id)`, así que cada página es un
+        rango del índice `results_ts` (o `results_name_ts`)."""
+        lo = float(start) if start is not None else float('-inf')
+        hi = float(end) if end is not None else float('inf')
+        last_ts, last_id = lo, 0
+        sql = ('SELECT ts, id, doc FROM results WHERE %sts >= ? AND ts < ? '
+               'AND (ts > ? OR (ts = ? AND id > ?)) ORDER BY ts, id LIMIT ?') % ('name = ? AND ' if name else '')
+        prefix = (name,) if name else ()
+        while True:
+            rows = self._conn().execute(sql, prefix + (lo, hi, last_ts, last_ts, last_id, batch)).fetchall()
+            if not rows:
+                return
+            for _ts, _id, doc in rows:
+                yield json.loads(doc)
+            last_ts, last_id = rows[-1][0], rows[-1][1]
+
+    def apply_retention(self, days: float) -> int:
+        """Borra resultados más antiguos que `days` días."""
+        cutoff = time.time() - days * 86400
+        with self._conn() as conn:
+            cur = conn.execute('DELETE FROM results WHERE ts < ?', (cutoff,))
+        return cur.rowcount
+
+    def count(self) -> int:
+        return self._conn().execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+    def import_json(self, path) -> int:
+        """Migra un `monitors.json` heredado (lista de resultados) al almacén."""
+        path = Path(path)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return 0
+        n = self.insert_many(d for d in data if isinstance(d, dict))
+        path.rename(path.with_suffix('.json.migrated'))
+        return n
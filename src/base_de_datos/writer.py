@@ -0,0 +1,333 @@
+"""Capa write-behind para las escrituras a MongoDB (y al almacén local).
+
+Las escrituras se encolan y un hilo las vuelca en lotes (`bulk_write`
+no ordenado / `insert_many`) cuando un destino acumula `max_batch`
+operaciones o pasa `flush_interval`. Las actualizaciones sobre el mismo
+documento se fusionan dentro del lote (`$set` gana el último valor, `$inc`
+suma, `$min`/`$max` conservan el extremo). Un lote que falla (MongoDB
+caído, SQLite bloqueado) vuelve a la cabeza de la cola y se reintenta con
+espera creciente; tras `MAX_RETRIES` fallos seguidos se descarta y se
+cuenta en `dropped`. Si hay
+más de `max_pending` operaciones pendientes, `insert`/`set_fields` bloquean
+hasta que el volcado libere sitio (backpressure).
+
+El hilo de volcado arranca con la primera escritura (y se vuelve a crear
+si el proceso se bifurcó después, p. ej. workers de gunicorn con
+`--preload`), así que importar el módulo no lanza hilos.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+
+from utilidades import telemetry
+
+try:
+    from pymongo import InsertOne, UpdateOne
+    from pymongo.errors import BulkWriteError
+except Exception:
+    InsertOne = UpdateOne = None
+
+    class BulkWriteError(Exception):
+        pass
+
+log = logging.getLogger(__name__)
+
+MAX_BATCH = 500
+FLUSH_INTERVAL = 1.0
+MAX_PENDING = 50000
+MAX_RETRIES = 5
+MAX_BACKOFF = 30.0
+
+FLUSHES = telemetry.histogram('writer_flush_seconds', 'Volcados de la cola write-behind',
+                              ['sink', 'result'])
+OPS = telemetry.counter('writer_ops', 'Operaciones volcadas por la cola write-behind',
+                        ['sink', 'result'])
+
+
+class _MongoSink:
+    kind = 'mongo'
+
+    def __init__(self, col):
+        self.col = col
+        self.inserts = []
+        self.updates = {}
+        self.failures = 0
+
+    def __len__(self):
+        return len(self.inserts) + len(self.updates)
+
+    def take(self):
+        inserts, updates = self.inserts, self.updates
+        self.inserts, self.updates = [], {}
+        return inserts, updates
+
+    def restore(self, batch) -> int:
+        """Devuelve un lote fallido a la cabeza; retorna cuántas operaciones
+        desaparecen al fusionarse con actualizaciones encoladas después."""
+        inserts, updates = batch
+        self.inserts = inserts + self.inserts
+        merged = 0
+        newer, self.updates = self.updates, updates
+        for key, (flt, update, upsert) in newer.items():
+            prev = updates.get(key)
+            if prev is None:
+                updates[key] = (flt, update, upsert)
+            else:
+                # the failed batch applies first, then what was queued meanwhile
+                _merge_update(prev[1], update)
+                updates[key] = (prev[0], prev[1], prev[2] or upsert)
+                merged += 1
+        return merged
+
+    def write(self, batch):
+        inserts, updates = batch
+        ops = [InsertOne(d) for d in inserts]
+        for flt, update, upsert in updates.values():
+            ops.append(UpdateOne(flt, update, upsert=upsert))
+        if ops:
+            self.col.bulk_write(ops, ordered=False)
+        return len(ops)
+
+
+class _CallableSink:
+    # local store writes (SQLite / JSON) go through submit()
+    kind = 'local'
+
+    def __init__(self, fn):
+        self.fn = fn
+        self.items = []
+        self.failures = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def take(self):
+        items, self.items = self.items, []
+        return items
+
+    def restore(self, batch) -> int:
+        self.items = batch + self.items
+        return 0
+
+    def write(self, batch):
+        if batch:
+            self.fn(batch)
+        return len(batch)
+
+
+def _freeze(flt: dict):
+    return tuple(sorted(flt.items()))
+
+
+def _merge_update(into: dict, update: dict):
+    """Fusiona dos documentos de actualización como si se aplicaran en orden."""
+    for op, fields in update.items():
+        cur = into.setdefault(op, {})
+        for k, v in fields.items():
+            if op == '$inc' and k in cur:
+                cur[k] += v
+            elif op == '$min' and k in cur:
+                cur[k] = min(cur[k], v)
+            elif op == '$max' and k in cur:
+                cur[k] = max(cur[k], v)
+            elif op == '$setOnInsert' and k in cur:
+                continue
+            else:
+                cur[k] = v
+
+
+class WriteBehind:
+    """Cola de escrituras con volcado por tamaño o tiempo en un hilo propio."""
+
+    def __init__(self, max_batch: int = MAX_BATCH, flush_interval: float = FLUSH_INTERVAL,
+                 max_pending: int = MAX_PENDING):
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._sinks = {}
+        self._pending = 0
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._closed = False
+        self._retry_at = 0.0
+        self._stats = {'flushes': 0, 'written': 0, 'errors': 0, 'retried': 0, 'dropped': 0,
+                       'blocked': 0,
+                       'last_flush_ms': 0.0, 'max_flush_ms': 0.0, 'total_flush_ms': 0.0}
+        self._thread = None
+        self._pid = None
+
+    # -- producers -------------------------------------------------------
+    def _sink(self, key, factory):
+        sink = self._sinks.get(key)
+        if sink is None:
+            sink = self._sinks[key] = factory()
+        return sink
+
+    def _ensure_thread(self):
+        # caller holds self._cond
+        if self._pid != os.getpid() and not self._closed:
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+            self._thread.start()
+
+    def _enqueue(self, add):
+        with self._cond:
+            self._ensure_thread()
+            if self._pending >= self.max_pending:
+                self._stats['blocked'] += 1
+                self._cond.notify_all()
+                while self._pending >= self.max_pending and not self._closed:
+                    self._cond.wait(0.5)
+            grew, size = add()
+            self._pending += grew
+            if size >= self.max_batch:
+                self._cond.notify_all()
+
+    def full(self) -> bool:
+        """True si encolar ahora bloquearía (para rechazar en lugar de esperar)."""
+        return self._pending >= self.max_pending
+
+    def insert(self, col, doc: dict):
+        """Encola un `insert_one` (se envía como parte de un `bulk_write`)."""
+        def add():
+            sink = self._sink(id(col), lambda: _MongoSink(col))
+            sink.inserts.append(doc)
+            return 1, len(sink)
+        self._enqueue(add)
+
+    def update(self, col, flt: dict, update: dict, upsert: bool = True):
+        """Encola un `update_one(flt, update)` (`$set`, `$inc`, `$min`, `$max`,
+        `$setOnInsert`); las actualizaciones pendientes sobre el mismo filtro
+        se fusionan en una sola operación."""
+        def add():
+            sink = self._sink(id(col), lambda: _MongoSink(col))
+            key = _freeze(flt)
+            prev = sink.updates.get(key)
+            if prev is None:
+                merged = {}
+                _merge_update(merged, update)
+                sink.updates[key] = (flt, merged, upsert)
+                return 1, len(sink)
+            _merge_update(prev[1], update)
+            sink.updates[key] = (prev[0], prev[1], prev[2] or upsert)
+            return 0, len(sink)
+        self._enqueue(add)
+
+    def set_fields(self, col, flt: dict, fields: dict, upsert: bool = True):
+        """Atajo para `update(col, flt, {'$set': fields})`."""
+        self.update(col, flt, {'$set': fields}, upsert)
+
+    def submit(self, fn, item):
+        """Encola `item` para un destino genérico: `fn(lista_de_items)`."""
+        def add():
+            sink = self._sink(('fn', fn), lambda: _CallableSink(fn))
+            sink.items.append(item)
+            return 1, len(sink)
+        self._enqueue(add)
+
+    # -- flushing --------------------------------------------------------
+    def flush(self):
+        """Vuelca todo lo pendiente ahora (bloqueante)."""
+        with self._flush_lock:
+            with self._cond:
+                batches = [(sink, sink.take()) for sink in self._sinks.values() if len(sink)]
+            for sink, batch in batches:
+                started = time.perf_counter()
+                result = 'ok'
+                try:
+                    n = sink.write(batch)
+                except BulkWriteError as e:
+                    # partially applied: replaying would duplicate inserts and $inc
+                    n = _batch_len(batch)
+                    result = 'error'
+                    log.warning('write-behind flush failed (%d ops): %s', n, e)
+                except Exception as e:
+                    n = _batch_len(batch)
+                    result = 'retry' if sink.failures < MAX_RETRIES else 'dropped'
+                    log.warning('write-behind flush failed (%d ops, attempt %d): %s',
+                                n, sink.failures + 1, e)
+                elapsed = (time.perf_counter() - started) * 1000.0
+                FLUSHES.labels(sink.kind, 'ok' if result == 'ok' else 'error').observe(elapsed / 1000.0)
+                OPS.labels(sink.kind, result).inc(n)
+                with self._cond:
+                    st = self._stats
+                    if result == 'retry':
+                        # still pending: keeps backpressure engaged during an outage
+                        self._pending -= sink.restore(batch)
+                        sink.failures += 1
+                        self._retry_at = time.monotonic() + min(
+                            MAX_BACKOFF, self.flush_interval * 2 ** sink.failures)
+                        st['retried'] += n
+                    else:
+                        self._pending -= n
+                        sink.failures = 0
+                        if result == 'dropped':
+                            log.error('write-behind dropped %d ops after %d attempts',
+                                      n, MAX_RETRIES + 1)
+                        st[{'ok': 'written', 'error': 'errors', 'dropped': 'dropped'}[result]] += n
+                    st['flushes'] += 1
+                    st['last_flush_ms'] = elapsed
+                    st['max_flush_ms'] = max(st['max_flush_ms'], elapsed)
+                    st['total_flush_ms'] += elapsed
+                    self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                deadline = max(time.monotonic() + self.flush_interval, self._retry_at)
+                while not self._closed:
+                    # while backing off after a failure only the deadline counts
+                    backoff = time.monotonic() < self._retry_at
+                    full = any(len(s) >= self.max_batch for s in self._sinks.values())
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 or not backoff and (full or self._pending >= self.max_pending):
+                        break
+                    self._cond.wait(remaining)
+                closed = self._closed
+            self.flush()
+            if closed:
+                return
+
+    def close(self, timeout: float = 10.0):
+        """Detiene el hilo tras un último volcado."""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout)
+        self.flush()
+
+    def stats(self) -> dict:
+        with self._cond:
+            st = dict(self._stats)
+            st['pending'] = self._pending
+        st['avg_flush_ms'] = round(st.pop('total_flush_ms') / st['flushes'], 3) if st['flushes'] else 0.0
+        st['last_flush_ms'] = round(st['last_flush_ms'], 3)
+        st['max_flush_ms'] = round(st['max_flush_ms'], 3)
+        return st
+
+
+def _batch_len(batch) -> int:
+    if isinstance(batch, tuple):
+        return len(batch[0]) + len(batch[1])
+    return len(batch)
+
+
+_WRITER = None
+_WRITER_LOCK = threading.Lock()
+
+
+def get_writer() -> WriteBehind:
+    """Cola write-behind compartida por el proceso (se vacía al salir)."""
+    global _WRITER
+    with _WRITER_LOCK:
+        if _WRITER is None:
+            _WRITER = WriteBehind()
+            atexit.register(_WRITER.close)
+            telemetry.gauge_func('writer_pending', 'Operaciones pendientes en la cola write-behind',
+                                 lambda: _WRITER.stats()['pending'])
+        return _WRITER
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""Exportación masiva de métricas, eventos de dispositivos y resultados.
+
+Uso (desde la raíz del proyecto):
+
+    python src/exportar.py metrics --from 2024-01-01 --to 2025-01-01 --format parquet -o cpu.parquet --metric cpu
+    python src/exportar.py metrics --resolution 1h --format csv > metrics_1h.csv
+    python src/exportar.py device_events --from 1717200000 --ip 192.168.1.10
+    python src/exportar.py monitor_results --local --name router
+
+Lee con cursores por lotes (`--batch`, `EXPORT_BATCH`) de la base
+`monitor` de `MONGO_URI` (la de `monitor_api.py`) y escribe por trozos, así
+que la memoria no crece con el rango. `--local` exporta los resultados de
+`app.py` (`DBClient`: MongoDB o SQLite local). Las fechas aceptan epoch o
+ISO 8601 (UTC si no llevan zona); por defecto, el último día.
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+SRC = Path(__file__).resolve().parent
+if str(SRC) not in sys.path:
+    sys.path.insert(0, str(SRC))
+
+from base_de_datos import export  # noqa: E402
+
+
+def parse_time(value: str) -> float:
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        dt = datetime.fromisoformat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError('not an epoch or ISO 8601 date: %r' % value)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def open_docs(args, start, end):
+    if args.local:
+        from base_de_datos.db import get_db
+        return get_db().iter_results(start, end, args.name, args.batch)
+    from pymongo import MongoClient
+    from base_de_datos.repository import mongo_options
+    db = MongoClient(args.mongo_uri, **mongo_options()).get_database('monitor')
+    if args.dataset == 'metrics':
+        return export.metrics_docs(db, start, end, args.metric, args.resolution, args.batch)
+    if args.dataset == 'device_events':
+        return export.device_events_docs(db, start, end, args.ip, args.batch)
+    return export.monitor_results_docs(db.get_collection('monitor_results'), start, end,
+                                       args.name, args.batch)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('dataset', choices=export.DATASETS)
+    parser.add_argument('--from', dest='start', type=parse_time, help='inicio incluido (epoch o ISO)')
+    parser.add_argument('--to', dest='end', type=parse_time, help='fin excluido (epoch o ISO; ahora)')
+    parser.add_argument('--format', choices=export.FORMATS, default='ndjson')
+    parser.add_argument('-o', '--output', help='fichero de salida (stdout por defecto)')
+    parser.add_argument('--metric', help='solo esta métrica (metrics)')
+    parser.add_argument('--resolution', choices=export.RESOLUTIONS,
+                        help='buckets de rollup en lugar de muestras crudas (metrics)')
+    parser.add_argument('--ip', help='solo este dispositivo (device_events)')
+    parser.add_argument('--name', help='solo este monitor (monitor_results)')
+    parser.add_argument('--local', action='store_true',
+                        help='resultados de app.py (DBClient) en lugar de la base de monitor_api')
+    parser.add_argument('--mongo-uri', default=os.environ.get('MONGO_URI', 'mongodb://localhost:27017'))
+    parser.add_argument('--batch', type=int, default=export.EXPORT_BATCH)
+    args = parser.parse_args(argv)
+
+    if args.local and args.dataset != 'monitor_results':
+        parser.error('--local only holds monitor_results')
+    end = args.end if args.end is not None else time.time()
+    start = args.start if args.start is not None else end - 86400
+    if start >= end:
+        parser.error('--from must be before --to')
+    dataset = 'rollups' if args.dataset == 'metrics' and args.resolution else args.dataset
+    try:
+        chunks = export.export(dataset, open_docs(args, start, end), args.format)
+    except RuntimeError as e:
+        parser.error(str(e))
+
+    out = open(args.output, 'wb') if args.output else sys.stdout.buffer
+    size = 0
+    try:
+        for chunk in chunks:
+            out.write(chunk)
+            size += len(chunk)
+    finally:
+        if args.output:
+            out.close()
+    if args.output:
+        print('%s: %d bytes' % (args.output, size), file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
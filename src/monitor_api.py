@@ -1,17 +1,20 @@
-from fastapi import FastAPI, HTTPException, WebSocket
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, HTTPException, Query, Request, WebSocket
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 import os
 import asyncio
+from contextlib import asynccontextmanager
 from pymongo import MongoClient
-from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
 import threading
+import itertools
 import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
 import psutil
 import json
-import yaml
+import logging
 from pathlib import Path
 import sys
 # ensure project root is on sys.path so local packages (monitores) can be imported
@@ -21,140 +24,407 @@ if str(SRC_ROOT) not in sys.path:
     sys.path.insert(0, str(SRC_ROOT))
 if str(PROJECT_ROOT) not in sys.path:
     sys.path.insert(0, str(PROJECT_ROOT))
-from monitores.devices import scan_cidr
-from monitores.checks import run_ping
-
-# MongoDB client (use MONGO_URI env var if provided)
+from monitores.devices import SCAN_HOSTS, SCAN_SECONDS, iter_scan_cidr
+from monitores.neighbors import PRESENT_STATES, start_watcher
+from monitores.presence import DAY, OBSERVED, PresenceLog
+from monitores.runner import MonitorRunner
+from monitores.search import DeviceIndex
+from monitores.tracker import DeviceTracker
+from base_de_datos.writer import get_writer
+from base_de_datos import export
+from base_de_datos.repository import MongoRepository, RepositoryTimeout, mongo_options
+from base_de_datos.rollups import MAX_POINTS, MetricRollups
+from monitores.scheduler import DEFAULT_RATE, ProbeScheduler
+from utilidades.streaming import EventFeed, encode, media_type, pick_format
+from utilidades.alerts import AlertEngine
+from utilidades.broadcast import BroadcastHub
+from utilidades.config import get_config
+from utilidades.leader import Elector, FileLock, MongoLease
+from utilidades.ringbuffer import MetricBuffer
+from utilidades.snapshot import VersionedSnapshot, etag_matches, pick_encoding
+from utilidades.static import StaticAssets
+from utilidades import telemetry
+
+log = logging.getLogger(__name__)
+
+# MongoDB client (use MONGO_URI env var if provided); connect=False defers all I/O
+# to the first operation, so importing the app (or forking workers) stays cheap.
+# This synchronous client serves the background threads; request handlers read
+# through the async repository opened in `lifespan`
 MONGO_URI = os.environ.get('MONGO_URI', 'mongodb://localhost:27017')
-client = MongoClient(MONGO_URI)
+client = MongoClient(MONGO_URI, connect=False, **mongo_options())
 db = client.get_database('monitor')
 metrics_col = db.get_collection('metrics')
 devices_col = db.get_collection('devices')
+device_events_col = db.get_collection('device_events')
+monitor_results_col = db.get_collection('monitor_results')
+device_presence_col = db.get_collection('device_presence')
+# leader lease and the state the leader shares with the other workers
+runtime_col = db.get_collection('runtime')
+# samples posted to a follower, drained by the leader
+metric_inbox_col = db.get_collection('metric_inbox')
+DEVICE_EVENTS_RETENTION = timedelta(days=float(os.environ.get('DEVICE_EVENTS_RETENTION_DAYS', '90')))
+PRESENCE_RETENTION = timedelta(days=float(os.environ.get('PRESENCE_RETENTION_DAYS', '400')))
+# 'file' (workers on one host) or 'mongo' (replicas on several hosts)
+LEADER_LEASE = os.environ.get('LEADER_LEASE', 'file')
+STATE_INTERVAL = float(os.environ.get('LEADER_STATE_INTERVAL', '1'))
+# samples of the leader's metric log shipped with each state update
+METRIC_LOG_SIZE = 1024
+INBOX_TTL = timedelta(hours=1)
+INBOX_BATCH = 5000
+
+config = get_config()
+
+# all writes go through the shared write-behind queue (batched bulk_write)
+writer = get_writer()
+rollups = MetricRollups(db, writer, raw_col=metrics_col)
+# recent samples at full resolution live in memory; Mongo serves longer history
+recent = MetricBuffer()
+
+# single producer for /ws/updates: collectors publish deltas, sockets subscribe
+hub = BroadcastHub(('metrics', 'devices', 'device_events', 'monitors', 'alerts'))
+
+
+def _publish_alert(alert):
+    # keyed by alert id: a slow client only sees the latest state of each alert
+    hub.publish('alerts', alert, key=alert['id'])
+
+
+# rules from configuracion/alertas.yaml, evaluated as samples arrive
+alerts = AlertEngine(config.alerts(), on_event=_publish_alert)
+
+# async reads for the handlers (bound to the server's event loop)
+repo = None
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # every worker serves HTTP and follows the shared state; only the elected
+    # leader runs the scanner, probes, monitors and collector (_start_workers)
+    global repo
+    repo = MongoRepository(MONGO_URI)
+    hub.attach(asyncio.get_running_loop())
+    config.watch()
+    sync_stop = threading.Event()
+    threading.Thread(target=_sync_loop, args=(sync_stop,), name='leader-sync', daemon=True).start()
+    elector.start()
+    try:
+        yield
+    finally:
+        sync_stop.set()
+        await asyncio.to_thread(_shutdown)
+        await repo.close()
 
-# ensure simple indexes
-metrics_col.create_index('ts')
-devices_col.create_index('ip', unique=True)
 
 # mount static UI under /static so API routes remain at root
 STATIC_DIR = PROJECT_ROOT / 'src' / 'ui' / 'static'
-app = FastAPI(title='Mi Monitor RED API')
+app = FastAPI(title='Mi Monitor RED API', lifespan=lifespan)
 app.add_middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])
-if STATIC_DIR.exists():
-    app.mount('/static', StaticFiles(directory=str(STATIC_DIR), html=True), name='static')
+
+
+@app.middleware('http')
+async def _time_requests(request: Request, call_next):
+    t0 = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # label by route template, not raw path, to keep the series bounded;
+        # streaming responses are timed up to their first byte
+        route = getattr(request.scope.get('route'), 'path', None) or 'unmatched'
+        telemetry.observe_request('fastapi', request.method, route, status,
+                                  time.perf_counter() - t0)
+
+
+@app.exception_handler(RepositoryTimeout)
+async def _query_timeout(request: Request, exc: RepositoryTimeout):
+    return JSONResponse({'detail': str(exc)}, status_code=504)
+
+
+# precompressed, ETagged UI assets (see utilidades/static.py)
+assets = StaticAssets(STATIC_DIR)
+
+
+def _static_response(request: Request, name: str):
+    res = assets.respond(name, request.headers.get('accept-encoding'),
+                         request.headers.get('if-none-match'))
+    if res is None:
+        raise HTTPException(status_code=404, detail='not found')
+    if res.body is not None:
+        return Response(res.body, status_code=res.status, headers=dict(res.headers))
+    return FileResponse(str(res.path), headers=dict(res.headers))
+
+
+@app.api_route('/static/{name:path}', methods=['GET', 'HEAD'])
+async def static_files(request: Request, name: str):
+    return _static_response(request, name)
 
 class Device(BaseModel):
     ip: str
     mac: str | None = None
     hostname: str | None = None
 @app.get('/')
-def read_root():
+async def read_root():
     return {'message': 'Mi Monitor RED API'}
 
 @app.get('/api/metrics')
-def get_metrics(limit: int = 100):
-    rows = list(metrics_col.find({}, {'_id': 0}).sort('ts', -1).limit(limit))
-    return JSONResponse(content=rows)
+async def get_metrics(limit: int = 100, metric: str | None = None,
+                from_: int | None = Query(None, alias='from'), to: int | None = None,
+                step: int | None = None):
+    """Sin parámetros: últimas `limit` muestras. Con `metric` (y opcionalmente
+    `from`/`to` en epoch y `step` en segundos): serie min/max/avg/count leída
+    del buffer en memoria si cubre el rango, o de la resolución más gruesa
+    de los rollups que satisface el paso pedido."""
+    if metric is None and from_ is None and to is None and step is None:
+        rows = recent.latest(limit)
+        if len(rows) < limit:
+            # freshly started process: the buffer has not filled yet
+            rows = await repo.latest_metrics(limit)
+        return JSONResponse(content=rows)
+    if metric is None:
+        raise HTTPException(status_code=400, detail='metric is required for range queries')
+    end = to if to is not None else int(time.time())
+    start = from_ if from_ is not None else end - 3600
+    if start >= end:
+        raise HTTPException(status_code=400, detail='from must be before to')
+    if recent.covers(metric, start):
+        return recent.series(metric, start, end, step or max(1, (end - start) // MAX_POINTS))
+    return await repo.metric_series(rollups, metric, start, end, step)
+
+
+@app.get('/api/metrics/summary')
+async def get_metrics_summary(metric: str, since: float | None = None, n: int | None = None):
+    """count/min/max/mean/p50/p95/p99 de las muestras recientes (solo memoria)."""
+    return recent.summary(metric, since=since, n=n)
 
 
 # NOTE: devices listing compatible endpoint implemented later as `api_devices_list`
 
 
-@app.post('/api/devices')
-def add_device(d: Device):
+def _writer_ready():
+    # a full write-behind queue blocks producers: answer 503 instead of queueing
+    # more, and enqueue off the loop so a flush in progress never stalls it
+    if writer.full():
+        raise HTTPException(status_code=503, detail='write queue full, retry later',
+                            headers={'Retry-After': '1'})
+
+
+def _add_device(d: Device):
     ts = int(time.time())
-    devices_col.update_one({'ip': d.ip}, {'$set': {'mac': d.mac, 'hostname': d.hostname, 'last_seen': ts}}, upsert=True)
+    if elector.is_leader:
+        _track(d.ip, {'mac': d.mac, 'hostname': d.hostname}, ts)
+    writer.set_fields(devices_col, {'ip': d.ip}, {'mac': d.mac, 'hostname': d.hostname, 'last_seen': ts})
+    devices_snapshot.mark(d.ip)
+
+
+@app.post('/api/devices')
+async def add_device(d: Device):
+    _writer_ready()
+    await asyncio.to_thread(_add_device, d)
     return {'ok': True}
 
 
 @app.post('/api/metrics')
-def add_metric(payload: dict):
+async def add_metric(payload: dict):
     ts = int(time.time())
     metric = payload.get('metric')
     value = float(payload.get('value', 0))
-    metrics_col.insert_one({'ts': ts, 'metric': metric, 'value': value})
+    _writer_ready()
+    await asyncio.to_thread(record_metric, metric, value, ts)
     return {'ok': True}
 
 
-# Simple psutil collector that stores cpu and mem every N seconds
-def collector_loop(interval=5):
-    while True:
+_metric_log = deque(maxlen=METRIC_LOG_SIZE)
+_metric_seq = itertools.count(1)
+
+
+def record_metric(metric: str, value: float, ts: int = None):
+    """Punto único de entrada de muestras. El líder las procesa (crudo, rollups,
+    alertas, difusión); un seguidor las encola en `metric_inbox` para el líder,
+    que las devuelve a todos los workers con su estado."""
+    ts = int(ts if ts is not None else time.time())
+    if not elector.is_leader:
+        writer.insert(metric_inbox_col, {'metric': metric, 'ts': ts, 'value': value,
+                                         'expire_at': datetime.now(timezone.utc) + INBOX_TTL})
+        return
+    recent.add(metric, ts, value)
+    rollups.add(metric, ts, value)
+    alerts.observe_metric(metric, value, ts)
+    row = {'ts': ts, 'metric': metric, 'value': value}
+    _metric_log.append(dict(row, seq=next(_metric_seq)))
+    hub.publish('metrics', row, key=metric)
+
+
+def _drain_inbox():
+    """Líder: procesa las muestras que recibieron los seguidores."""
+    docs = list(metric_inbox_col.find({}, {'expire_at': 0}).sort('ts', 1).limit(INBOX_BATCH))
+    for doc in docs:
+        record_metric(doc['metric'], doc['value'], doc['ts'])
+    if docs:
+        # by _id, not a range: ids from several hosts are not ordered
+        metric_inbox_col.delete_many({'_id': {'$in': [d['_id'] for d in docs]}})
+
+
+COLLECTOR_ERRORS = telemetry.counter('collector_errors', 'Fallos del colector psutil')
+
+
+# Simple psutil collector that stores cpu and mem every N seconds (leader only)
+def collector_loop(interval=5, stop=None):
+    stop = stop or threading.Event()
+    while not stop.is_set():
         try:
             ts = int(time.time())
             cpu = psutil.cpu_percent(interval=None)
             mem = psutil.virtual_memory().percent
-            metrics_col.insert_one({'ts': ts, 'metric': 'cpu_percent', 'value': cpu})
-            metrics_col.insert_one({'ts': ts, 'metric': 'mem_percent', 'value': mem})
-        except Exception as e:
-            print('collector error', e)
-        time.sleep(interval)
-
-
-threading.Thread(target=collector_loop, daemon=True).start()
+            record_metric('cpu_percent', cpu, ts)
+            record_metric('mem_percent', mem, ts)
+        except Exception:
+            COLLECTOR_ERRORS.inc()
+            log.exception('collector error')
+        stop.wait(interval)
 
 # Devices scanner (background cache + DB update)
 _SCANNING = False
 _SCAN_LOCK = threading.Lock()
+SCAN_FEED = EventFeed()
+
+
+def _build_devices_snapshot():
+    # pending write-behind ops must land before the snapshot reads them back
+    writer.flush()
+    nets = config.networks()
+    grouped = {n.nombre: [] for n in nets}
+    index = {}
+    pipeline = [{'$match': {'network': {'$in': list(grouped)}}},
+                {'$project': {'_id': 0}},
+                {'$sort': {'last_seen': -1}}]
+    for doc in devices_col.aggregate(pipeline):
+        grouped[doc['network']].append(doc)
+        index[doc['ip']] = doc
+    out = [{'nombre': n.nombre, 'cidr': n.cidr, 'devices': grouped[n.nombre]} for n in nets]
+    return {'count': len(index), 'networks': out}, index
+
+
+# rebuilt only after a scan, probe, neighbor event or config change marks it dirty
+devices_snapshot = VersionedSnapshot(_build_devices_snapshot)
+# IP range / MAC / OUI / hostname lookups, kept in step with the snapshot's change log
+device_index = DeviceIndex()
+
+
+# last known state per device: scans and probes only write what actually changed
+tracker = DeviceTracker()
+# one bit per device and time slot: availability history without raw samples
+presence = PresenceLog()
+
+
+def _track(ip, fields, ts=None) -> dict:
+    """Pasa una observación por `tracker`; escribe los cambios y el log de eventos."""
+    changes, events = tracker.update(ip, fields, ts)
+    if fields.get('ok'):
+        presence.mark(ip, ts)
+    elif 'ok' in fields:
+        presence.observe(ts)
+    if changes:
+        writer.set_fields(devices_col, {'ip': ip}, changes)
+    for ev in events:
+        expire = datetime.fromtimestamp(ev['ts'], tz=timezone.utc) + DEVICE_EVENTS_RETENTION
+        writer.insert(device_events_col, dict(ev, expire_at=expire))
+        hub.publish('device_events', ev)
+    return changes
+
+
+def _flush_touched(force=False):
+    # coalesced last_seen/rtt refreshes; the snapshot picks them up on its next rebuild
+    for ip, fields in tracker.take_touched(force).items():
+        writer.set_fields(devices_col, {'ip': ip}, fields)
+    for ip, day, bits in presence.take_dirty():
+        # the leader holds the whole day in memory (loaded on election): $set is enough
+        expire = datetime.fromtimestamp((day + 1) * DAY, tz=timezone.utc) + PRESENCE_RETENTION
+        writer.set_fields(device_presence_col, {'ip': ip, 'day': day},
+                          {'bits': bits, 'expire_at': expire})
+
+
+def _touch_loop(stop):
+    while not stop.wait(tracker.touch_interval):
+        try:
+            _flush_touched()
+        except Exception:
+            log.exception('last_seen flush failed')
 
-def load_networks():
-    cfg_path = Path(__file__).resolve().parents[1] / 'configuracion' / 'redes.yaml'
-    if not cfg_path.exists():
-        return []
-    try:
-        with open(cfg_path, 'r', encoding='utf-8') as f:
-            cfg = yaml.safe_load(f) or {}
-        return cfg.get('redes', [])
-    except Exception:
-        return []
 
+def _publish_device(event, changed=True):
+    # scan stream subscribers get every event; websocket clients only the real changes
+    SCAN_FEED.publish(event)
+    if not changed:
+        return
+    if event.get('mac'):
+        alerts.observe_device(event.get('network'), event)
+    if event.get('ip'):
+        devices_snapshot.mark(event['ip'])
+        hub.publish('devices', event, key=event['ip'])
 
-def load_monitors():
-    cfg_path = Path(__file__).resolve().parents[1] / 'configuracion' / 'monitores.yaml'
-    if not cfg_path.exists():
-        return []
-    try:
-        with open(cfg_path, 'r', encoding='utf-8') as f:
-            cfg = yaml.safe_load(f) or {}
-        return cfg.get('monitores', [])
-    except Exception:
-        return []
+
+def _set_hostname(device, hostname):
+    # names arrive from the resolver pool after the ping phase
+    device['hostname'] = hostname
+    changed = _track(device['ip'], {'hostname': hostname})
+    _publish_device({'type': 'hostname', 'ip': device['ip'], 'hostname': hostname}, bool(changed))
 
 
 def do_devices_scan():
+    """Escanea todas las redes; cada dispositivo se publica en `SCAN_FEED` en
+    cuanto se conoce y en `devices_col` solo se escribe lo que cambió."""
     global _SCANNING
     with _SCAN_LOCK:
         if _SCANNING:
             return
         _SCANNING = True
     try:
-        nets = load_networks()
+        nets = config.networks()
+        probe_scheduler.set_targets({n.nombre: n.cidr for n in nets})
         for net in nets:
-            name = net.get('nombre') or net.get('name') or str(net.get('cidr'))
-            cidr = net.get('cidr')
-            if not cidr:
-                continue
-            devices = scan_cidr(str(cidr))
-            ts = int(time.time())
-            for d in devices:
+            name, cidr = net.nombre, net.cidr
+            SCAN_FEED.publish({'type': 'network', 'nombre': name, 'cidr': cidr})
+            started = time.perf_counter()
+            for d in iter_scan_cidr(cidr, on_hostname=_set_hostname):
+                ts = int(time.time())
                 ip = d.get('ip')
+                probe_scheduler.observe(ip, d.get('ok', False))
+                SCAN_HOSTS.labels(name, 'up' if d.get('ok') else 'down').inc()
                 # preserve rich device info
                 doc = {
                     'ip': ip,
                     'mac': d.get('mac'),
                     'hostname': d.get('hostname'),
                     'ok': d.get('ok', False),
+                    'rtt_ms': d.get('rtt_ms'),
                     'dev': d.get('dev'),
                     'state': d.get('state'),
                     'timestamp': d.get('timestamp'),
-                    'last_seen': ts,
                     'network': name
                 }
-                devices_col.update_one({'ip': ip}, {'$set': doc}, upsert=True)
+                # a None hostname keeps the last known name; late lookups fill it via _set_hostname
+                changed = _track(ip, doc, ts)
+                if doc['ok']:
+                    doc['last_seen'] = ts
+                if doc['hostname'] is None:
+                    doc.pop('hostname')
+                _publish_device(dict(doc, type='device'), bool(changed))
+            SCAN_SECONDS.labels(name).observe(time.perf_counter() - started)
+            alerts.network_scanned(name)
     finally:
         with _SCAN_LOCK:
             _SCANNING = False
+        SCAN_FEED.publish({'type': 'done'})
 
 
 def trigger_devices_scan(async_=True):
+    if not elector.is_leader:
+        # only the leader scans: leave a request it picks up on its next state sync
+        runtime_col.update_one({'_id': 'scan_request'}, {'$set': {'ts': time.time()}}, upsert=True)
+        return
     if async_:
         t = threading.Thread(target=do_devices_scan, daemon=True)
         t.start()
@@ -162,69 +432,462 @@ def trigger_devices_scan(async_=True):
         do_devices_scan()
 
 
-# start a scan on startup
-trigger_devices_scan(async_=True)
+def _on_neighbor(event, ip, info):
+    # kernel neighbor events keep presence/MAC fresh between full sweeps
+    net = config.network_for(ip)
+    if net is None:
+        return
+    state = info.get('state')
+    fields = {'network': net.nombre, 'state': state}
+    if event == 'add':
+        fields.update(mac=info.get('mac'), dev=info.get('dev'))
+        if state in PRESENT_STATES:
+            fields['ok'] = True
+        elif state == 'FAILED':
+            fields['ok'] = False
+    changes = _track(ip, fields)
+    if changes:
+        _publish_device(dict(tracker.get(ip) or {}, **changes, type='device'))
+
+
+def _on_probe(state, result, changed):
+    # adaptive re-probes between full sweeps: dead addresses that stay dead cost no writes
+    if not result['ok'] and not changed:
+        return
+    doc = {'ok': result['ok'], 'rtt_ms': result['rtt_ms'], 'timestamp': result['timestamp'],
+           'network': state.network}
+    changes = _track(state.ip, doc, state.last_seen if result['ok'] else None)
+    if changes:
+        _publish_device(dict(doc, **changes, ip=state.ip, type='device'))
+
+
+def _on_monitor_result(res):
+    hub.publish('monitors', dict(res), key=res.get('name'))
+    alerts.observe_result(res)
+    writer.insert(monitor_results_col, res)
+
+
+monitor_runner = MonitorRunner(on_result=_on_monitor_result)
+monitor_runner.set_monitors(config.monitors())
+
+
+@config.on_change
+def _on_config_change(kind, old, new):
+    # edits to redes.yaml / monitores.yaml apply without a restart
+    if kind == 'monitors':
+        monitor_runner.set_monitors(new)
+    elif kind == 'networks':
+        devices_snapshot.invalidate()
+        trigger_devices_scan(async_=True)
+    elif kind == 'alerts':
+        alerts.set_rules(new)
+
+
+def _ensure_indexes():
+    metrics_col.create_index('ts')
+    devices_col.create_index('ip', unique=True)
+    device_events_col.create_index('ts')
+    device_events_col.create_index([('ip', 1), ('ts', -1)])
+    device_events_col.create_index('expire_at', expireAfterSeconds=0)
+    monitor_results_col.create_index('timestamp')
+    monitor_results_col.create_index([('name', 1), ('timestamp', -1)])
+    device_presence_col.create_index([('ip', 1), ('day', 1)], unique=True)
+    device_presence_col.create_index('day')
+    device_presence_col.create_index('expire_at', expireAfterSeconds=0)
+    # samples left behind while no leader was draining expire after INBOX_TTL
+    metric_inbox_col.create_index('ts')
+    metric_inbox_col.create_index('expire_at', expireAfterSeconds=0)
+    rollups.ensure_indexes()
+
+
+def _load_devices():
+    # seed the tracker with the stored state; stored MACs are not "new" either,
+    # while networks without history learn on their first sweep
+    docs = list(devices_col.find({}, {'_id': 0, 'ip': 1, 'ok': 1, 'mac': 1, 'hostname': 1,
+                                      'network': 1, 'last_seen': 1}))
+    tracker.load(docs)
+    known = {}
+    for doc in docs:
+        if doc.get('network') and doc.get('mac'):
+            known.setdefault(doc['network'], set()).add(doc['mac'])
+    for name, macs in known.items():
+        alerts.baseline(name, macs)
+    today = int(time.time()) // DAY
+    presence.load(device_presence_col.find({'day': {'$gte': today - 1}},
+                                           {'_id': 0, 'ip': 1, 'day': 1, 'bits': 1}))
+
+
+probe_scheduler = ProbeScheduler(_on_probe, rate=float(os.environ.get('PROBE_RATE', DEFAULT_RATE)))
+
+
+# -- leader-only background workers -------------------------------------------
+_workers = {}
+_sync = {'scan_request': 0.0, 'alerts_ts': 0.0}
+_shared = {}
+
+
+def _start_workers():
+    stop = _workers['stop'] = threading.Event()
+    # a request left before this process won the election was for the old leader
+    _sync['scan_request'] = time.time()
+    # a new term: followers restart their position in the metric log
+    _sync['term'] = os.urandom(8).hex()
+    _metric_log.clear()
+    _ensure_indexes()
+    _load_devices()
+    threading.Thread(target=collector_loop, args=(5, stop), name='collector', daemon=True).start()
+    threading.Thread(target=_touch_loop, args=(stop,), name='last-seen', daemon=True).start()
+    trigger_devices_scan(async_=True)
+    _workers['watcher'] = start_watcher(_on_neighbor)
+    probe_scheduler.start()
+    monitor_runner.start()
+
+
+def _stop_workers():
+    stop = _workers.pop('stop', None)
+    if stop is not None:
+        stop.set()
+    watcher = _workers.pop('watcher', None)
+    if watcher is not None:
+        watcher.stop()
+    probe_scheduler.stop()
+    monitor_runner.stop()
+    _flush_touched(force=True)
+
+
+def _leader_lock():
+    if LEADER_LEASE == 'mongo':
+        return MongoLease(runtime_col, 'api-leader')
+    return FileLock('api-leader')
+
+
+elector = Elector(_leader_lock(), _start_workers, _stop_workers)
+
+
+def _shutdown():
+    elector.stop()
+    writer.close()
+
+
+# -- state shared between workers ----------------------------------------------
+def _publish_state():
+    """Líder: publica lo que solo vive en su memoria y atiende peticiones de escaneo."""
+    _drain_inbox()
+    doc = {
+        'leader': elector.status()['identity'],
+        'term': _sync.get('term'),
+        'ts': time.time(),
+        'devices_version': devices_snapshot.version,
+        'monitors': monitor_runner.latest(),
+        'alerts': alerts.active(),
+        'alerts_history': alerts.history(100),
+        'alerts_stats': alerts.stats(),
+        'metric_log': list(_metric_log),
+    }
+    runtime_col.replace_one({'_id': 'state'}, doc, upsert=True)
+    req = runtime_col.find_one({'_id': 'scan_request'})
+    if req and req.get('ts', 0) > _sync['scan_request']:
+        _sync['scan_request'] = req['ts']
+        trigger_devices_scan(async_=True)
+
+
+def _follow_state():
+    """Seguidor: adopta el estado del líder y reenvía los cambios a sus websockets."""
+    global _shared
+    doc = runtime_col.find_one({'_id': 'state'}, {'_id': 0})
+    if not doc:
+        return
+    prev = _shared
+    if doc.get('devices_version') != prev.get('devices_version'):
+        devices_snapshot.invalidate()
+    if doc.get('term') != _sync.get('metric_term'):
+        _sync['metric_term'], _sync['metric_seq'] = doc.get('term'), 0
+    for row in doc.get('metric_log') or []:
+        if row['seq'] > _sync['metric_seq']:
+            _sync['metric_seq'] = row['seq']
+            recent.add(row['metric'], row['ts'], row['value'])
+            if prev:
+                hub.publish('metrics', {'ts': row['ts'], 'metric': row['metric'],
+                                        'value': row['value']}, key=row['metric'])
+    old_monitors = {m.get('name'): m.get('timestamp') for m in prev.get('monitors') or []}
+    for res in doc.get('monitors') or []:
+        if old_monitors.get(res.get('name')) != res.get('timestamp'):
+            hub.publish('monitors', res, key=res.get('name'))
+    for ev in reversed(doc.get('alerts_history') or []):
+        if ev['ts'] > _sync['alerts_ts']:
+            _sync['alerts_ts'] = ev['ts']
+            # on the first sync the history is the backlog, not news
+            if prev:
+                hub.publish('alerts', ev, key=ev['id'])
+    _shared = doc
+
+
+def _sync_loop(stop):
+    while not stop.wait(STATE_INTERVAL):
+        try:
+            if elector.is_leader:
+                _publish_state()
+            else:
+                _follow_state()
+        except Exception as e:
+            log.warning('state sync failed: %s', e)
+
+
+async def _request_scan():
+    if elector.is_leader:
+        trigger_devices_scan(async_=True)
+    else:
+        await repo.request_scan()
 
 
 @app.post('/api/devices/refresh')
-def api_devices_refresh():
-    trigger_devices_scan(async_=True)
+async def api_devices_refresh():
+    await _request_scan()
     return {'started': True}
 
 
+@app.get('/api/devices/stream')
+async def api_devices_stream(request: Request, format: str | None = None):
+    """Lanza (o se une a) un escaneo y emite los dispositivos según se
+    descubren: NDJSON por defecto, Server-Sent Events con `?format=sse`."""
+    fmt = pick_format(format, request.headers.get('accept'))
+    if elector.is_leader:
+        events = SCAN_FEED.listen()
+        trigger_devices_scan(async_=True)
+    else:
+        # the live scan runs in the leader process: replay the last known devices
+        await _request_scan()
+        snap = await _devices_snapshot()
+        events = [dict(d, type='device') for d in snap.index.values()] + [{'type': 'done'}]
+    # a plain generator: Starlette drains the blocking feed in its threadpool
+    body = (encode(ev, fmt) for ev in events)
+    return StreamingResponse(body, media_type=media_type(fmt),
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@app.get('/api/devices/events')
+async def api_device_events(since: int | None = None, ip: str | None = None,
+                            type: str | None = None, limit: int = 100):
+    """Log de cambios (`new`, `online`, `offline`, `mac`, `hostname`, `network`),
+    el más reciente primero; `since` en epoch."""
+    if writer.stats()['pending']:
+        await asyncio.to_thread(writer.flush)
+    return {'events': await repo.device_events(since, ip, type, limit)}
+
+
+async def _devices_snapshot():
+    # rebuilding reads Mongo with the sync client: keep it off the event loop
+    snap = devices_snapshot.cached()
+    if snap is None:
+        snap = await asyncio.to_thread(devices_snapshot.current)
+    return snap
+
+
+@app.get('/api/devices/search')
+async def api_devices_search(cidr: str | None = None, mac: str | None = None,
+                             vendor: str | None = None, hostname: str | None = None,
+                             network: str | None = None, online: bool | None = None,
+                             offset: int = 0, limit: int = 50):
+    """Busca dispositivos en todas las redes por rango IP (`cidr`, también una
+    IP suelta), MAC exacta, fabricante (OUI o nombre), subcadena del hostname,
+    red y estado; resultado ordenado por IP y paginado con `offset`/`limit`."""
+    snap = await _devices_snapshot()
+    if device_index.version != snap.version:
+        # a full reindex (first query, config change) is CPU-bound: keep it off the loop
+        await asyncio.to_thread(device_index.sync, snap, devices_snapshot.changes_since)
+    try:
+        return device_index.search(cidr=cidr, mac=mac, vendor=vendor, hostname=hostname,
+                                   network=network, online=online, offset=offset, limit=limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def _range(days: float, from_: int | None, to: int | None):
+    end = to if to is not None else int(time.time())
+    start = from_ if from_ is not None else end - int(days * DAY)
+    if start >= end:
+        raise HTTPException(status_code=400, detail='from must be before to')
+    return start, end
+
+
+@app.get('/api/devices/{ip}/uptime')
+async def api_device_uptime(ip: str, days: float = 30, from_: int | None = Query(None, alias='from'),
+                            to: int | None = None):
+    """Porcentaje de franjas online sobre las observadas en el rango (30 días por defecto)."""
+    start, end = _range(days, from_, to)
+    day_from, day_to = start // DAY, (end - 1) // DAY
+    docs = await repo.presence(day_from, day_to, ips=[ip, OBSERVED])
+    return presence.uptime(presence.chunks(docs, day_from, day_to), ip, start, end)
+
+
+@app.get('/api/presence/online')
+async def api_presence_online(at: int | None = None):
+    """Dispositivos que respondieron en la franja de `at` (epoch; ahora por defecto)."""
+    at = at if at is not None else int(time.time())
+    day, slot = presence.locate(at)
+    docs = await repo.presence(day, day, slot=slot)
+    devices = presence.online_at(presence.chunks(docs, day, day), at)
+    return {'at': at, 'slot': presence.slot, 'count': len(devices), 'devices': devices}
+
+
+@app.get('/api/presence/absent')
+async def api_presence_absent(days: float = 7, from_: int | None = Query(None, alias='from'),
+                              to: int | None = None):
+    """Dispositivos conocidos que no respondieron ni una vez en el rango (7 días por defecto)."""
+    start, end = _range(days, from_, to)
+    day_from, day_to = start // DAY, (end - 1) // DAY
+    docs = await repo.presence(day_from, day_to)
+    seen = presence.seen_between(presence.chunks(docs, day_from, day_to), start, end)
+    snap = await _devices_snapshot()
+    devices = [d for ip, d in snap.index.items() if ip not in seen]
+    return {'from': start, 'to': end, 'count': len(devices), 'devices': devices}
+
+
 @app.get('/api/devices')
-def api_devices_list():
-    """Compatibility endpoint: retorna redes con sus dispositivos (igual que la UI espera)."""
-    nets = load_networks()
-    out = []
-    for net in nets:
-        name = net.get('nombre') or net.get('name') or str(net.get('cidr'))
-        cidr = net.get('cidr')
-        # fetch devices for this network
-        docs = list(devices_col.find({'network': name}, {'_id': 0}).sort('last_seen', -1))
-        out.append({'nombre': name, 'cidr': cidr, 'devices': docs})
-    return {'count': sum(len(n['devices']) for n in out), 'networks': out}
+async def api_devices_list(request: Request, since: int | None = None):
+    """Compatibility endpoint: retorna redes con sus dispositivos (igual que la UI espera).
+    Incluye `version`; con `?since=<version>` devuelve solo los dispositivos
+    cambiados desde entonces (o la lista completa si ya no es posible)."""
+    snap = await _devices_snapshot()
+    headers = {'Cache-Control': 'no-cache'}
+    if since is not None:
+        keys = devices_snapshot.changes_since(since)
+        if keys is not None:
+            devices = [snap.index[k] for k in keys if k in snap.index]
+            return JSONResponse({'version': snap.version, 'since': since, 'full': False,
+                                 'count': len(devices), 'devices': devices}, headers=headers)
+    encoding = pick_encoding(request.headers.get('accept-encoding'))
+    headers.update({'ETag': snap.etag(encoding), 'Vary': 'Accept-Encoding'})
+    if etag_matches(request.headers.get('if-none-match'), headers['ETag']):
+        return Response(status_code=304, headers=headers)
+    if encoding != 'identity':
+        headers['Content-Encoding'] = encoding
+    return Response(snap.encoded(encoding), media_type='application/json', headers=headers)
 
 
 @app.get('/api/monitors')
-def api_monitors():
-    mons = load_monitors()
-    results = []
-    for m in mons:
-        host = m.get('host') or m.get('ip') or m.get('hostname')
-        name = m.get('nombre') or m.get('name') or host
-        try:
-            res = run_ping(host)
-            res['name'] = name
-            results.append(res)
-        except Exception:
-            results.append({'host': host, 'ok': False, 'rtt_ms': None, 'name': name})
+async def api_monitors():
+    """Último estado de cada monitor (los checks corren en `monitor_runner`)."""
+    results = monitor_runner.latest() if elector.is_leader else _shared.get('monitors', [])
     return {'count': len(results), 'results': results}
 
 
+@app.get('/api/monitors/history')
+async def api_monitors_history(limit: int = 50, name: str | None = None):
+    """Últimos resultados guardados (de `name` si se indica), el más reciente primero."""
+    results = await repo.recent_results(limit, name)
+    return {'count': len(results), 'results': results}
+
+
+@app.get('/api/export/{dataset}')
+async def api_export(dataset: str, days: float = 1, from_: int | None = Query(None, alias='from'),
+                     to: int | None = None, format: str = 'ndjson', metric: str | None = None,
+                     resolution: str | None = None, ip: str | None = None, name: str | None = None):
+    """Descarga en streaming de `metrics`, `device_events` o `monitor_results` en
+    [from, to) (último día por defecto) como NDJSON, CSV o Parquet."""
+    if dataset not in export.DATASETS:
+        raise HTTPException(status_code=404, detail='unknown dataset: %s' % dataset)
+    if format not in export.FORMATS:
+        raise HTTPException(status_code=400, detail='format must be one of %s' % ', '.join(export.FORMATS))
+    if resolution is not None and resolution not in export.RESOLUTIONS:
+        raise HTTPException(status_code=400, detail='resolution must be one of %s' % ', '.join(export.RESOLUTIONS))
+    start, end = _range(days, from_, to)
+    # include samples still queued in this worker's write-behind buffer
+    await asyncio.to_thread(writer.flush)
+    if dataset == 'metrics':
+        docs = export.metrics_docs(db, start, end, metric, resolution)
+    elif dataset == 'device_events':
+        docs = export.device_events_docs(db, start, end, ip)
+    else:
+        docs = export.monitor_results_docs(monitor_results_col, start, end, name)
+    try:
+        chunks = export.export('rollups' if resolution and dataset == 'metrics' else dataset, docs, format)
+    except RuntimeError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    headers = {'Content-Disposition': 'attachment; filename="%s-%d-%d.%s"' % (dataset, start, end, format)}
+    # sync generator over a sync cursor: Starlette iterates it in its threadpool,
+    # so the event loop never blocks on a batch fetch
+    return StreamingResponse(chunks, media_type=export.MEDIA_TYPES[format], headers=headers)
+
+
 @app.get('/mi-red')
-def mi_red_view():
+async def mi_red_view(request: Request):
     """Serve the alternate API views page."""
-    f = STATIC_DIR / 'mi-red.html'
-    if f.exists():
-        return FileResponse(str(f), media_type='text/html')
-    raise HTTPException(status_code=404, detail='not found')
+    return _static_response(request, 'mi-red.html')
+
+
+@app.get('/api/status')
+async def api_status():
+    # a Mongo lease looks up its holder in the database
+    leader = await asyncio.to_thread(elector.status)
+    return {'status': 'ok', 'service': 'Mi Monitor RED API', 'writer': writer.stats(),
+            'broadcast': hub.stats(), 'leader': leader,
+            'alerts': alerts.stats() if elector.is_leader else _shared.get('alerts_stats')}
+
+
+@app.get('/metrics')
+async def prometheus_metrics():
+    """Métricas internas en formato de texto de Prometheus."""
+    return Response(telemetry.render(), media_type=telemetry.CONTENT_TYPE)
+
+
+@app.get('/debug/profile')
+async def debug_profile(seconds: float = 10.0):
+    """Muestrea las pilas de todos los hilos durante `seconds` y devuelve
+    pilas folded (flamegraph.pl, speedscope)."""
+    try:
+        folded = await asyncio.to_thread(
+            telemetry.PROFILER.profile, min(max(seconds, 0.1), telemetry.MAX_PROFILE_SECONDS))
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return Response(folded, media_type='text/plain; charset=utf-8')
 
 
 @app.get('/api/alerts')
-def get_alerts():
-    # placeholder
-    return {'alerts': []}
+async def get_alerts(limit: int = 100):
+    """Alertas activas y últimas `limit` transiciones (disparo, resolución, eventos)."""
+    if not elector.is_leader:
+        return {'alerts': _shared.get('alerts', []),
+                'history': (_shared.get('alerts_history') or [])[:max(0, limit)],
+                'stats': _shared.get('alerts_stats')}
+    return {'alerts': alerts.active(), 'history': alerts.history(limit), 'stats': alerts.stats()}
 
 
 @app.websocket('/ws/updates')
-async def websocket_updates(ws: WebSocket):
+async def websocket_updates(ws: WebSocket, topics: str | None = None):
+    """Deltas `{topic, data}` de `hub` (sin consultas a la base de datos).
+    `?topics=metrics,devices` limita los temas; el cliente puede cambiarlos
+    enviando `{"subscribe": [...]}` o `{"unsubscribe": [...]}`."""
     await ws.accept()
-    try:
+    wanted = [t for t in (topics.split(',') if topics else hub.topics) if t in hub.topics]
+    sub = hub.subscribe(wanted)
+
+    async def receive():
         while True:
-            # simple push of latest cpu/mem
-            rows = list(metrics_col.find({'metric': {'$in': ['cpu_percent', 'mem_percent']}}, {'_id': 0}).sort('ts', -1).limit(2))
-            await ws.send_text(json.dumps(rows))
-            await asyncio.sleep(3)
-    except Exception:
-        await ws.close()
+            msg = await ws.receive_json()
+            if not isinstance(msg, dict):
+                continue
+            added = [t for t in msg.get('subscribe') or [] if t in hub.topics]
+            sub.topics.update(added)
+            sub.topics.difference_update(msg.get('unsubscribe') or [])
+            for m in hub.snapshot(added):
+                sub.offer(m)
+
+    async def send():
+        for m in hub.snapshot(sub.topics):
+            await ws.send_text(json.dumps(m, default=str))
+        while True:
+            m = await sub.get()
+            await ws.send_text(json.dumps(m, default=str))
+
+    tasks = [asyncio.ensure_future(receive()), asyncio.ensure_future(send())]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        hub.unsubscribe(sub)
+        for t in tasks:
+            t.cancel()
+        try:
+            await ws.close()
+        except Exception:
+            pass
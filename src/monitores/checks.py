@@ -2,15 +2,102 @@ import subprocess
 import re
 from datetime import datetime
 
+from monitores import icmp, services
+from utilidades.config import CHECK_TYPES  # noqa: F401  (validated by config.parse_monitor)
+
 PING_CMD = ['ping', '-c', '1', '-W', '1']
 
 RTT_RE = re.compile(r'time=([0-9\.]+) ms')
 
 
-def run_ping(host: str) -> dict:
+def _icmp_result(host: str, rtt) -> dict:
+    return {
+        'host': host,
+        'ok': rtt is not None,
+        'rtt_ms': round(rtt, 3) if rtt is not None else None,
+        'timestamp': datetime.utcnow().isoformat()
+    }
+
+
+def _error_result(host: str, e: Exception) -> dict:
+    return {
+        'host': host,
+        'ok': False,
+        'rtt_ms': None,
+        'error': str(e),
+        'timestamp': datetime.utcnow().isoformat()
+    }
+
+
+def run_ping(host: str, timeout: float = icmp.DEFAULT_TIMEOUT) -> dict:
     """Realiza un ping simple al host y devuelve un dict con resultados.
     Campos: host, ok (bool), rtt_ms (float|None), timestamp (ISO)
     """
+    if not icmp.use_subprocess():
+        try:
+            return _icmp_result(host, icmp.ping(host, timeout))
+        except Exception as e:
+            return _error_result(host, e)
+    return _run_ping_subprocess(host)
+
+
+async def async_run_ping(host: str, timeout: float = icmp.DEFAULT_TIMEOUT) -> dict:
+    """Como `run_ping`, pero como corrutina. Debe ejecutarse en el loop del
+    motor ICMP (`icmp.get_engine().loop`), p. ej. desde `MonitorRunner`."""
+    engine = icmp.get_engine()
+    if icmp.use_subprocess():
+        return await engine.loop.run_in_executor(None, _run_ping_subprocess, host)
+    try:
+        return _icmp_result(host, await engine.prober.probe(host, timeout))
+    except Exception as e:
+        return _error_result(host, e)
+
+
+def check_type(m: dict) -> str:
+    return str(m.get('tipo') or m.get('type') or 'icmp').lower()
+
+
+def _opt(m: dict, *keys, default=None):
+    for k in keys:
+        if m.get(k) is not None:
+            return m[k]
+    return default
+
+
+async def async_run_check(m: dict, timeout: float = None) -> dict:
+    """Ejecuta el check de un monitor según su `tipo` (icmp por defecto,
+    `tcp`, `tls`, `http`/`https`) en el loop del motor. Mismo formato de
+    resultado que `run_ping`."""
+    kind = check_type(m)
+    host = m['host']
+    if kind in ('icmp', 'ping'):
+        return await async_run_ping(host, timeout or icmp.DEFAULT_TIMEOUT)
+    timeout = float(_opt(m, 'timeout', default=timeout or services.DEFAULT_TIMEOUT))
+    verify = str(_opt(m, 'verificar', 'verify', default=True)).lower() not in ('false', 'no', '0')
+    port = _opt(m, 'puerto', 'port')
+    if kind == 'tcp':
+        if port is None:
+            return _error_result(host, ValueError('tcp check needs puerto'))
+        return await services.tcp_check(host, int(port), timeout)
+    if kind == 'tls':
+        return await services.tls_check(host, int(port or 443), timeout, verify)
+    if kind in ('http', 'https'):
+        url = _opt(m, 'url')
+        if url is None:
+            url = '%s://%s%s%s' % (kind, host, ':%s' % port if port else '',
+                                   _opt(m, 'ruta', 'path', default='/'))
+        expect = _opt(m, 'estado', 'expect_status')
+        if expect is not None:
+            expect = [int(x) for x in (expect if isinstance(expect, (list, tuple)) else [expect])]
+        method = str(_opt(m, 'metodo', 'method', default='GET')).upper()
+        res = await services.http_check(url, timeout, method, expect, verify)
+        # report the configured host so results group with the monitor
+        res['host'] = host
+        return res
+    return _error_result(host, ValueError('unknown check type %r' % kind))
+
+
+def _run_ping_subprocess(host: str) -> dict:
     try:
         completed = subprocess.run(PING_CMD + [host], capture_output=True, text=True, check=False)
         out = completed.stdout or completed.stderr or ''
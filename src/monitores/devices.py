@@ -1,13 +1,31 @@
 import ipaddress
-import subprocess
+import os
 import socket
+import subprocess
+import time
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 
+from monitores import icmp, sharded
+from monitores.neighbors import PRESENT_STATES, read_neigh
+from monitores.resolver import get_resolver
+from utilidades import telemetry
+
 PING_CMD = ['ping', '-c', '1', '-W', '1']
+NEIGH_REFRESH = 0.05
+# >1 shards the sweep across processes; SCAN_RATE caps probes/s across all of them
+SCAN_SHARDS = int(os.getenv('SCAN_SHARDS', '1'))
+SCAN_RATE = float(os.getenv('SCAN_RATE', '0'))
+
+# recorded per configured network by the servers' do_devices_scan()
+SCAN_SECONDS = telemetry.histogram('scan_network_seconds', 'Duración del escaneo de cada red',
+                                   ['network'], buckets=(1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800))
+SCAN_HOSTS = telemetry.counter('scan_hosts', 'Hosts escaneados por red y estado',
+                               ['network', 'state'])
 
 
 def _ping(ip: str) -> dict:
+    """Ping por subproceso (fallback opt-in, ver `icmp.use_subprocess`)."""
     try:
         completed = subprocess.run(PING_CMD + [ip], capture_output=True, text=True, check=False)
         return {'ip': ip, 'ok': completed.returncode == 0}
@@ -15,101 +33,144 @@ def _ping(ip: str) -> dict:
         return {'ip': ip, 'ok': False}
 
 
-def _read_neigh():
+def _read_neigh(family: int = socket.AF_INET):
     """Lee la tabla ARP/neighbor y devuelve map ip->(mac,dev,state)"""
-    try:
-        out = subprocess.check_output(['ip', '-4', 'neigh'], text=True)
-    except Exception:
-        try:
-            out = subprocess.check_output(['arp', '-n'], text=True)
-        except Exception:
-            return {}
-    mapping = {}
-    for line in out.splitlines():
-        parts = line.split()
-        if not parts:
+    return read_neigh(family)
+
+
+def apply_neighbor(device: dict, event: str, info: dict) -> dict:
+    """Aplica un evento de `NeighborWatcher` a un dispositivo (in-place).
+    Devuelve solo los campos que cambiaron (vacío si nada cambió)."""
+    changes = {}
+    state = info.get('state')
+    if event == 'add':
+        if info.get('mac') and info['mac'] != device.get('mac'):
+            changes['mac'] = info['mac']
+        if info.get('dev') and info['dev'] != device.get('dev'):
+            changes['dev'] = info['dev']
+        if state in PRESENT_STATES:
+            changes['ok'] = True
+        elif state == 'FAILED':
+            changes['ok'] = False
+    if state and state != device.get('state'):
+        changes['state'] = state
+    changes = {k: v for k, v in changes.items() if device.get(k) != v}
+    device.update(changes)
+    return changes
+
+
+def _iter_ping(hosts, max_workers: int, timeout: float, idle: float = None):
+    """Itera {'ip', 'ok', 'rtt_ms'} en orden de llegada (None en periodos
+    sin resultados si se pasa `idle`, solo con el motor ICMP)."""
+    if icmp.use_subprocess():
+        hosts = list(hosts)
+        # Ping en paralelo (rápido, ajustable)
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(hosts)))) as ex:
+            futures = {ex.submit(_ping, ip): ip for ip in hosts}
+            for fut in as_completed(futures):
+                yield fut.result()
+        return
+    for item in icmp.iter_ping(hosts, timeout=timeout, idle=idle):
+        if item is None:
+            yield None
             continue
-        # ip neigh format: 192.168.1.5 dev wlp2s0 lladdr aa:bb:cc REACHABLE
-        if 'lladdr' in parts:
-            try:
-                ip = parts[0]
-                dev = parts[2] if len(parts) > 2 else ''
-                llidx = parts.index('lladdr')
-                mac = parts[llidx+1] if len(parts) > llidx+1 else None
-                state = parts[-1]
-                mapping[ip] = {'mac': mac, 'dev': dev, 'state': state}
-            except Exception:
-                continue
-        else:
-            # arp -n fallback: IP HWtype HWaddress Flags Mask Iface
-            # e.g. 192.168.1.1 ether aa:bb:cc:dd:ee:ff C eth0
-            if len(parts) >= 4:
-                ip = parts[0]
-                mac = parts[2]
-                dev = parts[-1]
-                mapping[ip] = {'mac': mac, 'dev': dev, 'state': ''}
-    return mapping
-
-
-def scan_cidr(cidr: str, max_workers: int = 100) -> list:
-    """Escanea el CIDR haciendo ping a cada host y leyendo la tabla ARP.
-    Devuelve lista de dispositivos con ip, mac, hostname, ok, timestamp, dev, state
+        ip, rtt = item
+        yield {'ip': ip, 'ok': rtt is not None, 'rtt_ms': round(rtt, 3) if rtt is not None else None}
+
+
+def _device(r: dict, info, hostname) -> dict:
+    info = info or {}
+    return {
+        'ip': r['ip'],
+        'mac': info.get('mac'),
+        'hostname': hostname,
+        'ok': r.get('ok', False),
+        'rtt_ms': r.get('rtt_ms'),
+        'dev': info.get('dev'),
+        'state': info.get('state'),
+        'timestamp': datetime.utcnow().isoformat()
+    }
+
+
+def iter_scan_cidr(cidr: str, max_workers: int = 100, timeout: float = icmp.DEFAULT_TIMEOUT,
+                   on_hostname=None, shards: int = None, rate: float = None):
+    """Versión en streaming de `scan_cidr`: genera cada dispositivo en cuanto
+    se conoce su resultado de ping (los que responden llegan primero).
+
+    El hostname viene de la caché del resolver; con `on_hostname(device, hostname)`
+    los nombres que falten se resuelven en segundo plano como en `scan_cidr`.
+
+    Con `shards > 1` o `rate` (por defecto `SCAN_SHARDS` / `SCAN_RATE`) el
+    barrido se reparte en procesos con un límite global de sondas/s (ver
+    `monitores/sharded.py`). Los prefijos IPv6 grandes no se recorren: se
+    sondean los vecinos NDP conocidos y los que responden a `ff02::1`.
     """
     net = ipaddress.ip_network(cidr, strict=False)
-    hosts = [str(ip) for ip in net.hosts()]
-    results = []
-
-    # Ping en paralelo (rápido, ajustable)
-    with ThreadPoolExecutor(max_workers=min(max_workers, len(hosts))) as ex:
-        futures = {ex.submit(_ping, ip): ip for ip in hosts}
-        for fut in as_completed(futures):
-            res = fut.result()
-            results.append(res)
+    shards = SCAN_SHARDS if shards is None else shards
+    rate = SCAN_RATE if rate is None else rate
+    family = socket.AF_INET6 if net.version == 6 else socket.AF_INET
+    resolver = get_resolver()
+    neigh = _read_neigh(family)
+    neigh_ts = time.monotonic()
+    # hosts that answered before the kernel table was re-read: the reply
+    # itself creates the ARP entry, so hold them until the next refresh
+    deferred = []
 
-    neigh = _read_neigh()
+    def emit(r, info):
+        device = _device(r, info, resolver.cached(r['ip'])[1])
+        if on_hostname is not None and (device['ok'] or info) and not resolver.cached(device['ip'])[0]:
+            def _apply(ip, hostname, device=device):
+                if hostname:
+                    on_hostname(device, hostname)
+            resolver.resolve_async([device['ip']], _apply)
+        return device
 
-    devices = []
+    if (shards > 1 or rate) and not icmp.use_subprocess():
+        results = sharded.iter_ping_sharded(net, shards, rate, timeout, idle=NEIGH_REFRESH)
+    else:
+        results = _iter_ping(sharded.targets_for(net), max_workers, timeout, idle=NEIGH_REFRESH)
     for r in results:
-        ip = r['ip']
-        ok = r.get('ok', False)
-        mac = None
-        dev = None
-        state = None
-        info = neigh.get(ip)
-        if info:
-            mac = info.get('mac')
-            dev = info.get('dev')
-            state = info.get('state')
-        # Try multiple strategies to obtain a hostname for the IP.
-        hostname = None
-        try:
-            hostname = socket.gethostbyaddr(ip)[0]
-        except Exception:
-            # fallback: try `dig -x` (if available)
-            try:
-                out = subprocess.check_output(['dig', '-x', ip, '+short'], text=True).strip()
-                if out:
-                    # dig may return a trailing dot
-                    hostname = out.splitlines()[0].strip().rstrip('.')
-            except Exception:
-                try:
-                    # fallback: avahi-resolve-address (mDNS) if available
-                    out = subprocess.check_output(['avahi-resolve-address', ip], text=True).strip()
-                    if out:
-                        parts = out.split()  # e.g. "192.168.1.10 hostname.local"
-                        if len(parts) >= 2:
-                            hostname = parts[1]
-                except Exception:
-                    hostname = None
-        devices.append({
-            'ip': ip,
-            'mac': mac,
-            'hostname': hostname,
-            'ok': ok,
-            'dev': dev,
-            'state': state,
-            'timestamp': datetime.utcnow().isoformat()
-        })
+        if r is not None:
+            info = neigh.get(r['ip'])
+            if info is None and r.get('ok'):
+                deferred.append(r)
+            else:
+                yield emit(r, info)
+        if deferred and time.monotonic() - neigh_ts >= NEIGH_REFRESH:
+            neigh = _read_neigh(family)
+            neigh_ts = time.monotonic()
+            for d in deferred:
+                yield emit(d, neigh.get(d['ip']))
+            deferred = []
+    if deferred:
+        neigh = _read_neigh(family)
+        for d in deferred:
+            yield emit(d, neigh.get(d['ip']))
+
+
+def scan_cidr(cidr: str, max_workers: int = 100, timeout: float = icmp.DEFAULT_TIMEOUT,
+              on_hostname=None, shards: int = None, rate: float = None) -> list:
+    """Escanea el CIDR haciendo ping a cada host y leyendo la tabla ARP.
+    Devuelve lista de dispositivos con ip, mac, hostname, ok, rtt_ms, timestamp, dev, state
+
+    Usa el motor ICMP en proceso; `max_workers` solo aplica al fallback
+    por subproceso (`PING_MODE=subprocess`).
+
+    Los nombres solo se resuelven para hosts que respondieron o están en la
+    tabla de vecinos. Sin `on_hostname` se espera a la resolución (concurrente);
+    con `on_hostname(device, hostname)` el escaneo devuelve en cuanto terminan
+    los pings y el callback se invoca desde el pool del resolver a medida que
+    llegan los nombres (el llamador decide cómo aplicarlos).
+    """
+    devices = list(iter_scan_cidr(cidr, max_workers, timeout, on_hostname, shards, rate))
+    if on_hostname is None:
+        resolver = get_resolver()
+        # a MAC means the address is in the neighbor table
+        pending = {d['ip']: d for d in devices
+                   if (d['ok'] or d['mac']) and not resolver.cached(d['ip'])[0]}
+        for ip, hostname in resolver.resolve_many(pending).items():
+            pending[ip]['hostname'] = hostname
+
     # return only online devices first
     devices_sorted = sorted(devices, key=lambda d: (not d['ok'], d['ip']))
     return devices_sorted
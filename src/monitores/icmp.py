@@ -0,0 +1,369 @@
+"""Motor de sondas ICMP echo en proceso (asyncio).
+
+Envía y recibe echo request/reply desde Python usando sockets ICMP de
+datagrama sin privilegios (Linux, `net.ipv4.ping_group_range`) y, si no
+están permitidos, sockets raw. Un único event loop en un hilo de fondo
+multiplexa miles de sondas pendientes; las respuestas se emparejan por
+(id, secuencia) y dirección de origen.
+
+Uso síncrono (desde hilos, Flask o endpoints `def`):
+
+    from monitores import icmp
+    icmp.ping('192.168.1.1')                  # -> rtt en ms o None
+    for ip, rtt in icmp.iter_ping(hosts): ...  # resultados según llegan
+"""
+import asyncio
+import ipaddress
+import itertools
+import os
+import queue
+import socket
+import struct
+import threading
+import time
+
+from utilidades import telemetry
+
+ICMP_ECHO_REQUEST = 8
+ICMP_ECHO_REPLY = 0
+ICMP6_ECHO_REQUEST = 128
+ICMP6_ECHO_REPLY = 129
+
+DEFAULT_TIMEOUT = 1.0
+DEFAULT_CONCURRENCY = 1024
+RCVBUF_BYTES = 1 << 20
+PAYLOAD = b'mi-monitor-red'.ljust(32, b'\0')
+
+_HEADER = struct.Struct('!BBHHH')
+
+PROBES = telemetry.counter('icmp_probes', 'Sondas ICMP por resultado', ['result'])
+PROBE_RTT = telemetry.histogram('icmp_rtt_seconds', 'RTT de las sondas ICMP respondidas')
+REPLIES = telemetry.counter('icmp_replies', 'Paquetes ICMP recibidos', ['match'])
+
+
+class IcmpUnavailable(OSError):
+    """No se pudo abrir ningún socket ICMP (ni datagrama ni raw)."""
+
+
+def _checksum(data: bytes) -> int:
+    if len(data) % 2:
+        data += b'\0'
+    total = sum(struct.unpack('!%dH' % (len(data) // 2), data))
+    total = (total >> 16) + (total & 0xffff)
+    total += total >> 16
+    return ~total & 0xffff
+
+
+def _build_echo(family: int, ident: int, seq: int) -> bytes:
+    icmp_type = ICMP_ECHO_REQUEST if family == socket.AF_INET else ICMP6_ECHO_REQUEST
+    header = _HEADER.pack(icmp_type, 0, 0, ident, seq)
+    if family == socket.AF_INET:
+        # ICMPv6 checksums include a pseudo-header and are filled in by the kernel
+        header = _HEADER.pack(icmp_type, 0, _checksum(header + PAYLOAD), ident, seq)
+    return header + PAYLOAD
+
+
+def _open_socket(family: int):
+    """Abre un socket ICMP no bloqueante. Devuelve (socket, es_raw)."""
+    proto = socket.IPPROTO_ICMP if family == socket.AF_INET else socket.IPPROTO_ICMPV6
+    try:
+        sock = socket.socket(family, socket.SOCK_DGRAM, proto)
+        raw = False
+    except OSError:
+        try:
+            sock = socket.socket(family, socket.SOCK_RAW, proto)
+            raw = True
+        except OSError as e:
+            raise IcmpUnavailable(e.errno, 'ICMP sockets not permitted: %s' % e) from e
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RCVBUF_BYTES)
+    except OSError:
+        pass
+    if not raw:
+        # ping sockets use the bound "port" as echo identifier
+        sock.bind(('0.0.0.0', 0) if family == socket.AF_INET else ('::', 0))
+    sock.setblocking(False)
+    return sock, raw
+
+
+class IcmpProber:
+    """Sondas ICMP echo multiplexadas sobre el event loop actual.
+
+    Mantiene un socket por familia (IPv4/IPv6) y una tabla de sondas
+    pendientes indexada por (familia, id, secuencia).
+    """
+
+    def __init__(self, loop=None):
+        self.loop = loop or asyncio.get_event_loop()
+        self._socks = {}
+        self._pending = {}
+        self._seq = itertools.count(1)
+
+    def _socket_for(self, family: int):
+        entry = self._socks.get(family)
+        if entry is None:
+            sock, raw = _open_socket(family)
+            if raw:
+                ident = (os.getpid() ^ id(self)) & 0xffff
+            else:
+                ident = sock.getsockname()[1] & 0xffff
+            entry = (sock, raw, ident)
+            self._socks[family] = entry
+            self.loop.add_reader(sock.fileno(), self._on_readable, family)
+        return entry
+
+    def _next_seq(self, family: int, ident: int) -> int:
+        for _ in range(0x10000):
+            seq = next(self._seq) & 0xffff
+            if (family, ident, seq) not in self._pending:
+                return seq
+        raise RuntimeError('too many outstanding ICMP probes')
+
+    def _on_readable(self, family: int):
+        sock, raw, ident = self._socks[family]
+        reply_type = ICMP_ECHO_REPLY if family == socket.AF_INET else ICMP6_ECHO_REPLY
+        while True:
+            try:
+                data, addr = sock.recvfrom(2048)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                return
+            now = time.perf_counter()
+            offset = 0
+            if raw and family == socket.AF_INET:
+                # raw IPv4 sockets deliver the IP header as well
+                offset = (data[0] & 0x0f) * 4
+            if len(data) < offset + _HEADER.size:
+                continue
+            icmp_type, _code, _csum, r_ident, r_seq = _HEADER.unpack_from(data, offset)
+            if icmp_type != reply_type or r_ident != ident:
+                continue
+            entry = self._pending.get((family, r_ident, r_seq))
+            if entry is None:
+                continue
+            fut, t0, target = entry
+            if addr[0] != target or fut.done():
+                REPLIES.labels('late').inc()
+                continue
+            REPLIES.labels('matched').inc()
+            fut.set_result((now - t0) * 1000.0)
+
+    async def _resolve(self, host: str):
+        try:
+            ip = ipaddress.ip_address(host.split('%', 1)[0])
+            return (socket.AF_INET if ip.version == 4 else socket.AF_INET6), host
+        except ValueError:
+            pass
+        infos = await self.loop.getaddrinfo(host, None, type=socket.SOCK_DGRAM)
+        if not infos:
+            raise socket.gaierror('no address for %s' % host)
+        # prefer IPv4, like `ping` does for dual-stack names
+        infos.sort(key=lambda i: i[0] != socket.AF_INET)
+        family, _, _, _, sockaddr = infos[0]
+        return family, sockaddr[0]
+
+    async def probe(self, host: str, timeout: float = DEFAULT_TIMEOUT):
+        """Envía un echo request a `host` y devuelve el RTT en ms o None si expira."""
+        family, addr = await self._resolve(host)
+        sock, _raw, ident = self._socket_for(family)
+        seq = self._next_seq(family, ident)
+        key = (family, ident, seq)
+        fut = self.loop.create_future()
+        dest = (addr, 0) if family == socket.AF_INET else (addr, 0, 0, 0)
+        self._pending[key] = (fut, time.perf_counter(), addr)
+        try:
+            await self.loop.sock_sendto(sock, _build_echo(family, ident, seq), dest)
+        except OSError:
+            # unreachable networks surface as send errors: treat like a timeout
+            PROBES.labels('send_error').inc()
+            self._pending.pop(key, None)
+            return None
+        try:
+            rtt = await asyncio.wait_for(fut, timeout)
+        except asyncio.TimeoutError:
+            PROBES.labels('timeout').inc()
+            return None
+        finally:
+            self._pending.pop(key, None)
+        PROBES.labels('reply').inc()
+        PROBE_RTT.observe(rtt / 1000.0)
+        return rtt
+
+    async def probe_many(self, hosts, timeout: float = DEFAULT_TIMEOUT,
+                         concurrency: int = DEFAULT_CONCURRENCY):
+        """Generador asíncrono de (host, rtt_ms|None) en orden de llegada.
+
+        `hosts` puede ser cualquier iterable (se consume de forma perezosa);
+        como máximo hay `concurrency` sondas en vuelo.
+        """
+        it = iter(hosts)
+        inflight = {}
+
+        def fill():
+            while len(inflight) < concurrency:
+                try:
+                    host = next(it)
+                except StopIteration:
+                    return
+                inflight[asyncio.ensure_future(self._probe_safe(host, timeout))] = host
+
+        fill()
+        while inflight:
+            done, _ = await asyncio.wait(inflight, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                host = inflight.pop(task)
+                yield host, task.result()
+            fill()
+
+    async def _probe_safe(self, host, timeout):
+        try:
+            return await self.probe(host, timeout)
+        except IcmpUnavailable:
+            raise
+        except Exception:
+            return None
+
+    def close(self):
+        for sock, _raw, _ident in self._socks.values():
+            try:
+                self.loop.remove_reader(sock.fileno())
+            except Exception:
+                pass
+            sock.close()
+        self._socks.clear()
+        for fut, _t0, _addr in self._pending.values():
+            if not fut.done():
+                fut.cancel()
+        self._pending.clear()
+
+
+class ProbeEngine:
+    """Event loop dedicado en un hilo de fondo con un `IcmpProber` compartido.
+
+    Permite que código síncrono (scan_cidr, run_ping, hilos de Flask)
+    comparta los mismos sockets y la misma tabla de sondas pendientes.
+    `prober_factory(loop)` permite sustituir el backend (p. ej. la red
+    simulada de `benchmarks/`).
+    """
+
+    def __init__(self, prober_factory=None):
+        self.prober_factory = prober_factory or IcmpProber
+        self.loop = asyncio.new_event_loop()
+        self.prober = self.prober_factory(self.loop)
+        self._thread = threading.Thread(target=self._run, name='icmp-engine', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coro):
+        """Programa una corrutina en el loop del motor y devuelve un Future concurrente."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def ping(self, host: str, timeout: float = DEFAULT_TIMEOUT):
+        return self.submit(self.prober.probe(host, timeout)).result()
+
+    def iter_ping(self, hosts, timeout: float = DEFAULT_TIMEOUT,
+                  concurrency: int = DEFAULT_CONCURRENCY, idle: float = None):
+        """Itera (host, rtt_ms|None) según llegan las respuestas.
+
+        Con `idle`, genera `None` si pasan `idle` segundos sin resultados
+        (útil para que el consumidor haga trabajo periódico).
+        """
+        out = queue.Queue()
+        done = object()
+        stop = threading.Event()
+
+        async def pump():
+            try:
+                async for item in self.prober.probe_many(hosts, timeout, concurrency):
+                    if stop.is_set():
+                        break
+                    out.put(item)
+            finally:
+                out.put(done)
+
+        fut = self.submit(pump())
+        try:
+            while True:
+                try:
+                    item = out.get(timeout=idle)
+                except queue.Empty:
+                    yield None
+                    continue
+                if item is done:
+                    break
+                yield item
+        finally:
+            stop.set()
+        # re-raise errors from the engine (e.g. IcmpUnavailable)
+        fut.result()
+
+    def ping_many(self, hosts, timeout: float = DEFAULT_TIMEOUT,
+                  concurrency: int = DEFAULT_CONCURRENCY) -> dict:
+        return dict(self.iter_ping(hosts, timeout, concurrency))
+
+    def close(self):
+        def _stop():
+            self.prober.close()
+            self.loop.stop()
+        self.loop.call_soon_threadsafe(_stop)
+        self._thread.join(timeout=2)
+
+
+_ENGINE = None
+_ENGINE_LOCK = threading.Lock()
+_AVAILABLE = None
+
+
+def get_engine() -> ProbeEngine:
+    global _ENGINE
+    with _ENGINE_LOCK:
+        if _ENGINE is None:
+            _ENGINE = ProbeEngine()
+        return _ENGINE
+
+
+def set_engine(engine: ProbeEngine):
+    """Instala `engine` como motor compartido (cierra el anterior)."""
+    global _ENGINE, _AVAILABLE
+    with _ENGINE_LOCK:
+        old, _ENGINE = _ENGINE, engine
+        # an explicitly installed backend does not depend on ICMP sockets
+        _AVAILABLE = True
+    if old is not None and old is not engine:
+        old.close()
+
+
+def available() -> bool:
+    """True si el proceso puede abrir sockets ICMP IPv4 (datagrama o raw)."""
+    global _AVAILABLE
+    if _AVAILABLE is None:
+        try:
+            sock, _raw = _open_socket(socket.AF_INET)
+            sock.close()
+            _AVAILABLE = True
+        except IcmpUnavailable:
+            _AVAILABLE = False
+    return _AVAILABLE
+
+
+def use_subprocess() -> bool:
+    """El modo `ping` por subproceso es opt-in vía `PING_MODE=subprocess`
+    o automático cuando no hay sockets ICMP disponibles."""
+    return os.environ.get('PING_MODE', 'icmp').lower() == 'subprocess' or not available()
+
+
+def ping(host: str, timeout: float = DEFAULT_TIMEOUT):
+    return get_engine().ping(host, timeout)
+
+
+def iter_ping(hosts, timeout: float = DEFAULT_TIMEOUT, concurrency: int = DEFAULT_CONCURRENCY,
+              idle: float = None):
+    return get_engine().iter_ping(hosts, timeout, concurrency, idle)
+
+
+def ping_many(hosts, timeout: float = DEFAULT_TIMEOUT, concurrency: int = DEFAULT_CONCURRENCY) -> dict:
+    return get_engine().ping_many(hosts, timeout, concurrency)
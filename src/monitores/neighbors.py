@@ -0,0 +1,312 @@
+"""Tabla de vecinos (ARP / NDP) del kernel vía rtnetlink.
+
+- `read_neigh()`: volcado RTM_GETNEIGH por un socket netlink; si no hay
+  netlink (no Linux, sandbox) usa `/proc/net/arp` y, en último caso,
+  `ip neigh` / `arp -n`.
+- `NeighborWatcher`: hilo que se suscribe al grupo RTMGRP_NEIGH y avisa de
+  altas, cambios y bajas de vecinos en tiempo real.
+
+Las entradas tienen la misma forma que devolvía `_read_neigh`:
+    {ip: {'mac': str, 'dev': str, 'state': str}}
+"""
+import errno
+import os
+import socket
+import struct
+import subprocess
+import threading
+import time
+from pathlib import Path
+
+from utilidades import telemetry
+
+PROC_ARP = Path('/proc/net/arp')
+
+NETLINK_ROUTE = 0
+RTMGRP_NEIGH = 0x4
+RTM_NEWNEIGH = 28
+RTM_DELNEIGH = 29
+RTM_GETNEIGH = 30
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+NLM_F_REQUEST = 0x1
+NLM_F_DUMP = 0x300
+NDA_DST = 1
+NDA_LLADDR = 2
+
+NUD_STATES = {
+    0x01: 'INCOMPLETE',
+    0x02: 'REACHABLE',
+    0x04: 'STALE',
+    0x08: 'DELAY',
+    0x10: 'PROBE',
+    0x20: 'FAILED',
+    0x40: 'NOARP',
+    0x80: 'PERMANENT',
+}
+# states that mean the kernel saw the neighbor answer recently
+PRESENT_STATES = frozenset(('REACHABLE', 'DELAY', 'PROBE', 'PERMANENT'))
+
+NEIGH_READS = telemetry.histogram('neighbor_read_seconds', 'Lecturas de la tabla de vecinos',
+                                  ['source'])
+
+_NLMSGHDR = struct.Struct('=LHHLL')
+_NDMSG = struct.Struct('=BxxxiHBB')
+_RTATTR = struct.Struct('=HH')
+
+
+def _align(n: int) -> int:
+    return (n + 3) & ~3
+
+
+def _state_name(state: int) -> str:
+    return NUD_STATES.get(state, 'NONE' if state == 0 else hex(state))
+
+
+def _ifname(index: int, cache: dict) -> str:
+    name = cache.get(index)
+    if name is None:
+        try:
+            name = socket.if_indextoname(index)
+        except OSError:
+            name = str(index)
+        cache[index] = name
+    return name
+
+
+def _parse_ndmsg(payload: bytes, ifcache: dict):
+    """Parsea un ndmsg + atributos. Devuelve (ip, info) o None."""
+    if len(payload) < _NDMSG.size:
+        return None
+    family, ifindex, state, _flags, _ntype = _NDMSG.unpack_from(payload)
+    ip = mac = None
+    off = _NDMSG.size
+    while off + _RTATTR.size <= len(payload):
+        rta_len, rta_type = _RTATTR.unpack_from(payload, off)
+        if rta_len < _RTATTR.size:
+            break
+        data = payload[off + _RTATTR.size:off + rta_len]
+        if rta_type == NDA_DST:
+            try:
+                ip = socket.inet_ntop(family, data)
+            except (ValueError, OSError):
+                ip = None
+        elif rta_type == NDA_LLADDR and data:
+            mac = ':'.join('%02x' % b for b in data)
+        off += _align(rta_len)
+    if ip is None:
+        return None
+    return ip, {'mac': mac, 'dev': _ifname(ifindex, ifcache), 'state': _state_name(state),
+                'family': family}
+
+
+def _iter_messages(buf: bytes):
+    off = 0
+    while off + _NLMSGHDR.size <= len(buf):
+        length, mtype, _flags, seq, _pid = _NLMSGHDR.unpack_from(buf, off)
+        if length < _NLMSGHDR.size:
+            return
+        yield mtype, seq, buf[off + _NLMSGHDR.size:off + length]
+        off += _align(length)
+
+
+def _netlink_dump(family: int) -> dict:
+    sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE)
+    try:
+        sock.bind((0, 0))
+        seq = 1
+        body = _NDMSG.pack(family, 0, 0, 0, 0)
+        hdr = _NLMSGHDR.pack(_NLMSGHDR.size + len(body), RTM_GETNEIGH,
+                             NLM_F_REQUEST | NLM_F_DUMP, seq, 0)
+        sock.send(hdr + body)
+        mapping = {}
+        ifcache = {}
+        while True:
+            buf = sock.recv(1 << 16)
+            for mtype, mseq, payload in _iter_messages(buf):
+                if mseq != seq:
+                    continue
+                if mtype == NLMSG_DONE:
+                    return mapping
+                if mtype == NLMSG_ERROR:
+                    code = struct.unpack_from('=i', payload)[0] if len(payload) >= 4 else 0
+                    if code:
+                        raise OSError(-code, os.strerror(-code))
+                    return mapping
+                if mtype != RTM_NEWNEIGH:
+                    continue
+                parsed = _parse_ndmsg(payload, ifcache)
+                # like `ip neigh | grep lladdr`: only resolved, non-NOARP entries
+                if parsed and parsed[1]['mac'] and parsed[1]['state'] != 'NOARP':
+                    ip, info = parsed
+                    info.pop('family', None)
+                    mapping[ip] = info
+    finally:
+        sock.close()
+
+
+def _read_proc_arp() -> dict:
+    # IP address  HW type  Flags  HW address  Mask  Device
+    mapping = {}
+    with open(PROC_ARP, 'r', encoding='ascii') as f:
+        next(f, None)
+        for line in f:
+            parts = line.split()
+            if len(parts) < 6:
+                continue
+            flags = int(parts[2], 16)
+            if not flags & 0x2 or parts[3] == '00:00:00:00:00:00':
+                continue  # incomplete entry
+            mapping[parts[0]] = {'mac': parts[3], 'dev': parts[5],
+                                 'state': 'PERMANENT' if flags & 0x4 else ''}
+    return mapping
+
+
+def _read_neigh_cmd() -> dict:
+    """Último recurso: parsea la salida de `ip -4 neigh` o `arp -n`."""
+    try:
+        out = subprocess.check_output(['ip', '-4', 'neigh'], text=True)
+    except Exception:
+        try:
+            out = subprocess.check_output(['arp', '-n'], text=True)
+        except Exception:
+            return {}
+    mapping = {}
+    for line in out.splitlines():
+        parts = line.split()
+        if not parts:
+            continue
+        # ip neigh format: 192.168.1.5 dev wlp2s0 lladdr aa:bb:cc REACHABLE
+        if 'lladdr' in parts:
+            try:
+                ip = parts[0]
+                dev = parts[2] if len(parts) > 2 else ''
+                llidx = parts.index('lladdr')
+                mac = parts[llidx+1] if len(parts) > llidx+1 else None
+                state = parts[-1]
+                mapping[ip] = {'mac': mac, 'dev': dev, 'state': state}
+            except Exception:
+                continue
+        else:
+            # arp -n fallback: IP HWtype HWaddress Flags Mask Iface
+            # e.g. 192.168.1.1 ether aa:bb:cc:dd:ee:ff C eth0
+            if len(parts) >= 4:
+                ip = parts[0]
+                mac = parts[2]
+                dev = parts[-1]
+                mapping[ip] = {'mac': mac, 'dev': dev, 'state': ''}
+    return mapping
+
+
+def read_neigh(family: int = socket.AF_INET) -> dict:
+    """Lee la tabla de vecinos y devuelve map ip->{mac, dev, state}."""
+    t0 = time.perf_counter()
+    source, table = _read_neigh_any(family)
+    NEIGH_READS.labels(source).observe(time.perf_counter() - t0)
+    return table
+
+
+def _read_neigh_any(family: int):
+    if hasattr(socket, 'AF_NETLINK'):
+        try:
+            return 'netlink', _netlink_dump(family)
+        except OSError:
+            pass
+    if family == socket.AF_INET:
+        try:
+            return 'proc', _read_proc_arp()
+        except OSError:
+            pass
+        return 'cmd', _read_neigh_cmd()
+    return 'none', {}
+
+
+class NeighborWatcher:
+    """Hilo que escucha eventos RTM_NEWNEIGH / RTM_DELNEIGH.
+
+    `callback(event, ip, info)` recibe `event` en ('add', 'del'), donde
+    'add' cubre altas y cambios de estado o MAC. Si el socket pierde
+    eventos (ENOBUFS) se relee la tabla completa y se emite 'add' por cada
+    entrada para resincronizar.
+    """
+
+    def __init__(self, callback, families=(socket.AF_INET,)):
+        self.callback = callback
+        self.families = frozenset(families)
+        self._sock = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return self
+        sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+        except OSError:
+            pass
+        sock.bind((0, RTMGRP_NEIGH))
+        sock.settimeout(1.0)
+        self._sock = sock
+        self._thread = threading.Thread(target=self._run, name='neigh-watcher', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+        if self._sock is not None:
+            self._sock.close()
+        self._thread = None
+        self._sock = None
+
+    def _emit(self, event, ip, info):
+        try:
+            self.callback(event, ip, info)
+        except Exception:
+            pass
+
+    def _resync(self):
+        for family in self.families:
+            try:
+                table = read_neigh(family)
+            except Exception:
+                continue
+            for ip, info in table.items():
+                self._emit('add', ip, info)
+
+    def _run(self):
+        ifcache = {}
+        while not self._stop.is_set():
+            try:
+                buf = self._sock.recv(1 << 16)
+            except socket.timeout:
+                continue
+            except OSError as e:
+                if e.errno == errno.ENOBUFS:
+                    self._resync()
+                    continue
+                if self._stop.is_set():
+                    return
+                raise
+            for mtype, _seq, payload in _iter_messages(buf):
+                if mtype not in (RTM_NEWNEIGH, RTM_DELNEIGH):
+                    continue
+                parsed = _parse_ndmsg(payload, ifcache)
+                if not parsed:
+                    continue
+                ip, info = parsed
+                if info.pop('family') not in self.families:
+                    continue
+                self._emit('add' if mtype == RTM_NEWNEIGH else 'del', ip, info)
+
+
+def start_watcher(callback, families=(socket.AF_INET,)):
+    """Arranca un `NeighborWatcher`; devuelve None si netlink no está disponible."""
+    if not hasattr(socket, 'AF_NETLINK'):
+        return None
+    try:
+        return NeighborWatcher(callback, families).start()
+    except OSError:
+        return None
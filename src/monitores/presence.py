@@ -0,0 +1,152 @@
+"""Historial de disponibilidad por dispositivo en bitmaps de franjas.
+
+El día (UTC) se divide en franjas de `PRESENCE_SLOT` segundos (300 → 288
+franjas) y cada dispositivo tiene un bitmap de un bit por franja y día:
+36 bytes en `device_presence` (`{ip, day, bits, expire_at}`, `day` en días
+desde epoch). Cada resultado de escaneo o sonda con respuesta pone a 1 el
+bit de su franja; solo existen documentos para los días con algún bit.
+
+La clave `'*'` registra las franjas en las que hubo observaciones: es el
+denominador del uptime, así que una franja en la que el monitor no corría
+no cuenta como caída.
+
+Las consultas son operaciones de bits sobre enteros de Python (`&`, `|`,
+`int.bit_count()`) sobre unos pocos documentos por día, sin recorrer el
+historial crudo:
+
+- `uptime()`: franjas online / franjas observadas en un rango;
+- `online_at()`: dispositivos con el bit de una franja a 1 (en MongoDB,
+  `$bitsAllSet` sobre el campo binario);
+- `seen_between()`: dispositivos con algún bit en un rango (el resto de los
+  conocidos no se ha visto).
+
+`PresenceLog` mantiene en memoria los bitmaps de hoy y ayer, acumula los
+cambiados y los entrega con `take_dirty()` para escribirlos en bloque.
+"""
+import os
+import threading
+import time
+
+SLOT = int(os.getenv('PRESENCE_SLOT', '300'))
+DAY = 86400
+OBSERVED = '*'
+KEEP_DAYS = 2
+
+
+def decode(bits) -> int:
+    return int.from_bytes(bits or b'', 'little')
+
+
+def slot_mask(first: int, last: int) -> int:
+    """Bits `first` .. `last - 1` a 1."""
+    if last <= first:
+        return 0
+    return ((1 << last) - 1) ^ ((1 << first) - 1)
+
+
+class PresenceLog:
+    def __init__(self, slot: int = SLOT):
+        if slot <= 0 or DAY % slot:
+            raise ValueError('PRESENCE_SLOT must divide a day: %r' % slot)
+        self.slot = slot
+        self.slots = DAY // slot
+        self.nbytes = (self.slots + 7) // 8
+        self._bits = {}     # (ip, day) -> int
+        self._dirty = set()
+        self._lock = threading.Lock()
+
+    def locate(self, ts: float):
+        """(día, franja) de `ts`."""
+        ts = int(ts)
+        return ts // DAY, (ts % DAY) // self.slot
+
+    def encode(self, bits: int) -> bytes:
+        # little-endian: bit i of the int is bit i of the BinData for $bitsAllSet
+        return bits.to_bytes(self.nbytes, 'little')
+
+    def mark(self, ip: str, ts: float = None):
+        """`ip` respondió en `ts`; la franja cuenta también como observada."""
+        day, i = self.locate(ts if ts is not None else time.time())
+        bit = 1 << i
+        with self._lock:
+            for key in ((ip, day), (OBSERVED, day)):
+                cur = self._bits.get(key, 0)
+                if not cur & bit:
+                    self._bits[key] = cur | bit
+                    self._dirty.add(key)
+
+    def observe(self, ts: float = None):
+        """Hubo observaciones en `ts` aunque nadie respondiera."""
+        day, i = self.locate(ts if ts is not None else time.time())
+        key = (OBSERVED, day)
+        with self._lock:
+            cur = self._bits.get(key, 0)
+            if not cur >> i & 1:
+                self._bits[key] = cur | 1 << i
+                self._dirty.add(key)
+
+    def load(self, docs):
+        """Funde los documentos guardados de los días recientes (p. ej. al ser elegido líder)."""
+        oldest = int(time.time()) // DAY - KEEP_DAYS + 1
+        with self._lock:
+            for doc in docs:
+                if doc['day'] >= oldest:
+                    key = (doc['ip'], doc['day'])
+                    self._bits[key] = self._bits.get(key, 0) | decode(doc.get('bits'))
+
+    def take_dirty(self) -> list:
+        """[(ip, day, bytes)] cambiados desde la última llamada; olvida los días viejos."""
+        oldest = int(time.time()) // DAY - KEEP_DAYS + 1
+        with self._lock:
+            out = [(ip, day, self.encode(self._bits[(ip, day)])) for ip, day in self._dirty]
+            self._dirty.clear()
+            for key in [k for k in self._bits if k[1] < oldest]:
+                del self._bits[key]
+        return out
+
+    def chunks(self, docs, day_from: int, day_to: int) -> dict:
+        """{(ip, day): int} de `docs` más lo que aún está en memoria."""
+        out = {}
+        for doc in docs:
+            key = (doc['ip'], doc['day'])
+            out[key] = out.get(key, 0) | decode(doc.get('bits'))
+        with self._lock:
+            for key, bits in self._bits.items():
+                if day_from <= key[1] <= day_to:
+                    out[key] = out.get(key, 0) | bits
+        return out
+
+    def masks(self, start: float, end: float):
+        """[(día, máscara)] de las franjas que tocan [start, end)."""
+        out = []
+        start, end = int(start), int(end)
+        if end <= start:
+            return out
+        day_from, first = self.locate(start)
+        day_to, last = self.locate(end - 1)
+        for day in range(day_from, day_to + 1):
+            lo = first if day == day_from else 0
+            hi = last + 1 if day == day_to else self.slots
+            out.append((day, slot_mask(lo, hi)))
+        return out
+
+    # -- queries over chunks ----------------------------------------------------
+    def uptime(self, chunks: dict, ip: str, start: float, end: float) -> dict:
+        online = observed = 0
+        for day, mask in self.masks(start, end):
+            seen = chunks.get((OBSERVED, day), 0) & mask
+            observed += seen.bit_count()
+            online += (chunks.get((ip, day), 0) & seen).bit_count()
+        return {'ip': ip, 'from': int(start), 'to': int(end), 'slot': self.slot,
+                'online_slots': online, 'observed_slots': observed,
+                'uptime_pct': round(100.0 * online / observed, 3) if observed else None}
+
+    def online_at(self, chunks: dict, ts: float) -> list:
+        day, i = self.locate(ts)
+        return sorted(ip for (ip, d), bits in chunks.items()
+                      if d == day and ip != OBSERVED and bits >> i & 1)
+
+    def seen_between(self, chunks: dict, start: float, end: float) -> set:
+        masks = dict(self.masks(start, end))
+        return {ip for (ip, day), bits in chunks.items()
+                if ip != OBSERVED and bits & masks.get(day, 0)}
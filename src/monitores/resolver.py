@@ -0,0 +1,168 @@
+"""Resolución inversa de nombres (PTR / mDNS) concurrente y cacheada.
+
+La cadena de estrategias es la de siempre (`socket.gethostbyaddr`,
+`dig -x`, `avahi-resolve-address`), pero se ejecuta en un pool acotado de
+hilos, con caché con TTL (también para fallos: caché negativa) y sin
+duplicar consultas en vuelo para la misma IP.
+"""
+import subprocess
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from utilidades import telemetry
+
+LOOKUPS = telemetry.histogram('dns_lookup_seconds', 'Resoluciones inversas sin caché', ['result'])
+CACHE = telemetry.counter('dns_cache', 'Consultas a la caché de nombres', ['result'])
+
+DEFAULT_WORKERS = 32
+DEFAULT_TTL = 3600
+NEGATIVE_TTL = 300
+MAX_ENTRIES = 65536
+CMD_TIMEOUT = 2
+
+
+def _resolve_uncached(ip: str):
+    """Intenta varias estrategias para obtener un hostname para la IP."""
+    try:
+        return socket.gethostbyaddr(ip)[0]
+    except Exception:
+        pass
+    # fallback: try `dig -x` (if available)
+    try:
+        out = subprocess.check_output(['dig', '-x', ip, '+short', '+time=1', '+tries=1'],
+                                      text=True, timeout=CMD_TIMEOUT,
+                                      stderr=subprocess.DEVNULL).strip()
+        if out:
+            # dig may return a trailing dot
+            return out.splitlines()[0].strip().rstrip('.')
+    except Exception:
+        pass
+    # fallback: avahi-resolve-address (mDNS) if available
+    try:
+        out = subprocess.check_output(['avahi-resolve-address', ip], text=True,
+                                      timeout=CMD_TIMEOUT, stderr=subprocess.DEVNULL).strip()
+        parts = out.split()  # e.g. "192.168.1.10 hostname.local"
+        if len(parts) >= 2:
+            return parts[1]
+    except Exception:
+        pass
+    return None
+
+
+class HostnameResolver:
+    """Resolver con pool acotado y caché TTL (positiva y negativa)."""
+
+    def __init__(self, max_workers: int = DEFAULT_WORKERS, ttl: float = DEFAULT_TTL,
+                 negative_ttl: float = NEGATIVE_TTL, max_entries: int = MAX_ENTRIES,
+                 resolve_fn=_resolve_uncached):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._resolve_fn = resolve_fn
+        self._cache = {}  # ip -> (expires_at, hostname|None)
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='rdns')
+
+    def cached(self, ip: str):
+        """Devuelve (hit, hostname) sin bloquear. Solo mira: no cuenta en `dns_cache`."""
+        entry = self._cache.get(ip)
+        if entry and entry[0] > time.monotonic():
+            return True, entry[1]
+        return False, None
+
+    def _check(self, ip: str):
+        # one dns_cache sample per lookup, from the entry points below
+        hit, hostname = self.cached(ip)
+        CACHE.labels('hit' if hit else 'miss').inc()
+        return hit, hostname
+
+    def _store(self, ip, hostname):
+        ttl = self.ttl if hostname else self.negative_ttl
+        with self._lock:
+            if len(self._cache) >= self.max_entries:
+                now = time.monotonic()
+                self._cache = {k: v for k, v in self._cache.items() if v[0] > now}
+                if len(self._cache) >= self.max_entries:
+                    self._cache.clear()
+            self._cache[ip] = (time.monotonic() + ttl, hostname)
+            self._inflight.pop(ip, None)
+
+    def _task(self, ip):
+        t0 = time.perf_counter()
+        try:
+            hostname = self._resolve_fn(ip)
+            result = 'name' if hostname else 'none'
+        except Exception:
+            hostname = None
+            result = 'error'
+        LOOKUPS.labels(result).observe(time.perf_counter() - t0)
+        self._store(ip, hostname)
+        return hostname
+
+    def submit(self, ip: str):
+        """Programa la resolución de `ip` y devuelve un Future con el hostname.
+        Las IPs ya en vuelo comparten el mismo Future."""
+        with self._lock:
+            fut = self._inflight.get(ip)
+            if fut is None:
+                fut = self._pool.submit(self._task, ip)
+                self._inflight[ip] = fut
+            return fut
+
+    def lookup(self, ip: str):
+        hit, hostname = self._check(ip)
+        if hit:
+            return hostname
+        return self.submit(ip).result()
+
+    def resolve_async(self, ips, callback=None) -> dict:
+        """Resuelve en segundo plano; `callback(ip, hostname)` se invoca desde
+        el pool por cada IP que no estaba en caché. Devuelve {ip: hostname}
+        con los aciertos de caché inmediatos."""
+        hits = {}
+        for ip in ips:
+            hit, hostname = self._check(ip)
+            if hit:
+                hits[ip] = hostname
+                continue
+            fut = self.submit(ip)
+            if callback is not None:
+                fut.add_done_callback(lambda f, ip=ip: callback(ip, f.result()))
+        return hits
+
+    def resolve_many(self, ips, timeout: float = None) -> dict:
+        """Resuelve todas las IPs concurrentemente y espera (hasta `timeout`)."""
+        out = {}
+        futs = {}
+        for ip in ips:
+            hit, hostname = self._check(ip)
+            if hit:
+                out[ip] = hostname
+            else:
+                futs[self.submit(ip)] = ip
+        done, _ = wait(futs, timeout=timeout)
+        for fut, ip in futs.items():
+            out[ip] = fut.result() if fut in done else None
+        return out
+
+
+_RESOLVER = None
+_RESOLVER_LOCK = threading.Lock()
+
+
+def get_resolver() -> HostnameResolver:
+    global _RESOLVER
+    with _RESOLVER_LOCK:
+        if _RESOLVER is None:
+            _RESOLVER = HostnameResolver()
+        return _RESOLVER
+
+
+def set_resolver(resolver: HostnameResolver):
+    """Sustituye el resolver compartido (p. ej. por uno con `resolve_fn` simulado)."""
+    global _RESOLVER
+    with _RESOLVER_LOCK:
+        _RESOLVER = resolver
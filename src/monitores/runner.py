@@ -0,0 +1,142 @@
+"""Ejecución programada de los checks de `monitores.yaml` (ICMP y, según
+`tipo`, tcp/tls/http; ver `monitores/services.py`).
+
+Cada monitor corre en su propia tarea asyncio sobre el loop del motor ICMP
+(todos los checks son concurrentes) con su intervalo (`intervalo`, en
+segundos). El último resultado de cada monitor queda en una tabla en
+memoria que los endpoints leen sin sondear nada; los resultados se pasan
+además a `on_result` (historial: DBClient, Mongo, ...) fuera del loop.
+"""
+import asyncio
+import threading
+import time
+
+from monitores import icmp, services
+from monitores.checks import async_run_check
+
+DEFAULT_INTERVAL = 30.0
+MIN_INTERVAL = 1.0
+
+
+def _runnable(m, default_interval: float) -> dict:
+    """`Monitor` ya validado (`config.parse_monitor`) → dict del check, con el
+    intervalo por defecto y el mínimo aplicados."""
+    interval = m.intervalo if m.intervalo is not None else default_interval
+    return dict(m.as_dict(), intervalo=max(MIN_INTERVAL, interval))
+
+
+class MonitorRunner:
+    """Planifica los checks y mantiene la tabla de últimos resultados."""
+
+    def __init__(self, on_result=None, default_interval: float = DEFAULT_INTERVAL,
+                 timeout: float = None):
+        # timeout=None: each check type uses its own default (ICMP 1 s, services 5 s)
+        self.on_result = on_result
+        self.default_interval = default_interval
+        self.timeout = timeout
+        self._monitors = {}
+        self._latest = {}
+        self._tasks = {}
+        self._lock = threading.Lock()
+        self._engine = None
+
+    # -- configuration ---------------------------------------------------
+    def set_monitors(self, monitors):
+        """Reemplaza la lista de monitores (`config.Monitor`); las tareas se
+        reconcilian en caliente."""
+        normalized = {m.nombre: _runnable(m, self.default_interval) for m in monitors or []}
+        with self._lock:
+            self._monitors = normalized
+            for name in list(self._latest):
+                if name not in normalized:
+                    del self._latest[name]
+        if self._engine is not None:
+            self._engine.loop.call_soon_threadsafe(self._reconcile)
+
+    def start(self):
+        if self._engine is None:
+            self._engine = icmp.get_engine()
+            self._engine.loop.call_soon_threadsafe(self._reconcile)
+        return self
+
+    def stop(self):
+        if self._engine is not None:
+            def _cancel():
+                for task, _m in self._tasks.values():
+                    task.cancel()
+                self._tasks.clear()
+                services.close_pools()
+            self._engine.loop.call_soon_threadsafe(_cancel)
+            self._engine = None
+
+    def _reconcile(self):
+        # runs on the engine loop
+        with self._lock:
+            monitors = dict(self._monitors)
+        for name, (task, m) in list(self._tasks.items()):
+            if monitors.get(name) != m:
+                task.cancel()
+                del self._tasks[name]
+        for name, m in monitors.items():
+            if name not in self._tasks:
+                self._tasks[name] = (asyncio.ensure_future(self._loop(m)), m)
+
+    # -- checks ----------------------------------------------------------
+    async def check(self, m: dict) -> dict:
+        res = await async_run_check(m, self.timeout)
+        res['name'] = m['nombre']
+        return res
+
+    def _store(self, res: dict):
+        with self._lock:
+            if res['name'] not in self._monitors:
+                return
+            self._latest[res['name']] = res
+        if self.on_result is not None:
+            # history writes may block (Mongo, disk): keep them off the loop
+            asyncio.get_running_loop().run_in_executor(None, self._safe_on_result, dict(res))
+
+    def _safe_on_result(self, res):
+        try:
+            self.on_result(res)
+        except Exception:
+            pass
+
+    async def _loop(self, m: dict):
+        # spread the first round so monitors with equal intervals do not fire together
+        await asyncio.sleep((hash(m['nombre']) % 1000) / 1000.0 * min(m['intervalo'], 5.0))
+        while True:
+            started = time.monotonic()
+            try:
+                self._store(await self.check(m))
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                pass
+            await asyncio.sleep(max(0.0, m['intervalo'] - (time.monotonic() - started)))
+
+    async def _run_all(self) -> list:
+        with self._lock:
+            monitors = list(self._monitors.values())
+        results = await asyncio.gather(*(self.check(m) for m in monitors))
+        for res in results:
+            self._store(res)
+        return list(results)
+
+    def run_now(self) -> list:
+        """Ejecuta todos los checks una vez (concurrentemente) y devuelve los resultados."""
+        engine = self._engine or icmp.get_engine()
+        return engine.submit(self._run_all()).result()
+
+    def latest(self) -> list:
+        """Último resultado de cada monitor, en el orden de la configuración.
+        Los monitores aún no comprobados aparecen con `pending: True`."""
+        with self._lock:
+            out = []
+            for name, m in self._monitors.items():
+                res = self._latest.get(name)
+                if res is None:
+                    res = {'host': m['host'], 'name': name, 'ok': False, 'rtt_ms': None,
+                           'pending': True}
+                out.append(res)
+            return out
@@ -0,0 +1,240 @@
+"""Planificador adaptativo de sondas por host.
+
+En lugar de re-barrer todos los CIDR con el mismo esfuerzo, guarda estado
+por dirección (última vez visto, tasa de cambios de estado, fallos
+consecutivos) y decide cuándo volver a sondear cada una:
+
+- hosts vivos: cada `base_interval`;
+- hosts que alternan online/offline (flapping): cada `min_interval`;
+- direcciones muertas: retroceso exponencial hasta `max_interval`.
+
+Todas las sondas pasan por un token bucket global (`rate` sondas/s).
+"""
+import heapq
+import ipaddress
+import random
+import threading
+import time
+from datetime import datetime
+
+from monitores import icmp
+from monitores.sharded import MAX_BRUTE_V6
+from utilidades.ratelimit import TokenBucket
+
+BASE_INTERVAL = 60.0
+MIN_INTERVAL = 10.0
+MAX_INTERVAL = 3600.0
+DEFAULT_RATE = 100.0
+FLAP_DECAY = 0.8
+FLAP_THRESHOLD = 0.5
+JITTER = 0.1
+MAX_BATCH = 4096
+
+
+class HostState:
+    __slots__ = ('ip', 'network', 'ok', 'last_seen', 'last_probe', 'failures',
+                 'flap', 'next_due')
+
+    def __init__(self, ip: str, network: str, next_due: float):
+        self.ip = ip
+        self.network = network
+        self.ok = None
+        self.last_seen = None
+        self.last_probe = None
+        self.failures = 0
+        self.flap = 0.0
+        self.next_due = next_due
+
+    def as_dict(self) -> dict:
+        return {'ip': self.ip, 'network': self.network, 'ok': self.ok,
+                'last_seen': self.last_seen, 'last_probe': self.last_probe,
+                'failures': self.failures, 'flap': round(self.flap, 3),
+                'next_due': self.next_due}
+
+
+class ProbeScheduler:
+    """Hilo que sondea cada host cuando le toca según su historial.
+
+    `on_result(state, result, changed)` se llama por cada sonda con el
+    `HostState` actualizado, el resultado (`{'ip', 'ok', 'rtt_ms', 'timestamp'}`)
+    y si cambió el estado online/offline.
+    """
+
+    def __init__(self, on_result, base_interval: float = BASE_INTERVAL,
+                 min_interval: float = MIN_INTERVAL, max_interval: float = MAX_INTERVAL,
+                 rate: float = DEFAULT_RATE, timeout: float = icmp.DEFAULT_TIMEOUT):
+        self.on_result = on_result
+        self.base_interval = base_interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.timeout = timeout
+        self.bucket = TokenBucket(rate, burst=rate)
+        self.hosts = {}
+        self._wide = {}
+        self._heap = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    # -- state -----------------------------------------------------------
+    def interval_for(self, st: HostState) -> float:
+        if st.flap >= FLAP_THRESHOLD:
+            # up or just down: a flapping host is watched closely either way
+            interval = self.min_interval
+        elif st.ok or st.ok is None:
+            interval = self.base_interval
+        else:
+            interval = min(self.max_interval, self.base_interval * (2 ** min(st.failures, 16)))
+        return interval * random.uniform(1 - JITTER, 1 + JITTER)
+
+    def _schedule(self, st: HostState, due: float):
+        st.next_due = due
+        heapq.heappush(self._heap, (due, st.ip))
+
+    def set_targets(self, networks: dict):
+        """Define las redes a vigilar: {nombre: cidr}. Las direcciones nuevas
+        se programan tras `base_interval` (el barrido completo las cubre antes)."""
+        now = time.monotonic()
+        wanted = {}
+        wide = {}
+        for name, cidr in networks.items():
+            try:
+                net = ipaddress.ip_network(str(cidr), strict=False)
+            except ValueError:
+                continue
+            if net.version == 6 and net.num_addresses > MAX_BRUTE_V6:
+                # too large to enumerate: its hosts join as sweeps observe them
+                wide[name] = net
+                continue
+            for ip in net.hosts():
+                wanted[str(ip)] = name
+        with self._lock:
+            self._wide = wide
+            for ip in list(self.hosts):
+                if ip not in wanted and self._wide_network(ip) is None:
+                    del self.hosts[ip]
+            for ip, name in wanted.items():
+                st = self.hosts.get(ip)
+                if st is None:
+                    st = self.hosts[ip] = HostState(ip, name, 0)
+                    self._schedule(st, now + self.base_interval * random.random())
+                st.network = name
+        self._wake.set()
+
+    def _update(self, st: HostState, ok: bool, now_wall: int) -> bool:
+        changed = st.ok is not None and st.ok != ok
+        st.flap = st.flap * FLAP_DECAY + (1.0 if changed else 0.0)
+        st.ok = ok
+        st.last_probe = now_wall
+        if ok:
+            st.failures = 0
+            st.last_seen = now_wall
+        else:
+            st.failures += 1
+        return changed
+
+    def observe(self, ip: str, ok: bool):
+        """Incorpora un resultado obtenido fuera del planificador (p. ej. un
+        barrido completo) y reprograma el host en consecuencia."""
+        with self._lock:
+            st = self.hosts.get(ip)
+            if st is None:
+                name = self._wide_network(ip)
+                if name is None:
+                    return False
+                st = self.hosts[ip] = HostState(ip, name, 0)
+            changed = self._update(st, ok, int(time.time()))
+            self._schedule(st, time.monotonic() + self.interval_for(st))
+            return changed
+
+    def _wide_network(self, ip: str):
+        # caller holds _lock
+        if not self._wide:
+            return None
+        try:
+            addr = ipaddress.ip_address(ip.split('%', 1)[0])
+        except ValueError:
+            return None
+        for name, net in self._wide.items():
+            if addr.version == net.version and addr in net:
+                return name
+        return None
+
+    def _pop_due(self, limit: int) -> list:
+        now = time.monotonic()
+        out = []
+        with self._lock:
+            while self._heap and len(out) < limit and self._heap[0][0] <= now:
+                due, ip = heapq.heappop(self._heap)
+                st = self.hosts.get(ip)
+                # stale heap entries: host removed or rescheduled since
+                if st is None or st.next_due != due:
+                    continue
+                out.append(st)
+        return out
+
+    def _next_wait(self) -> float:
+        with self._lock:
+            if not self._heap:
+                return 1.0
+            return max(0.0, min(1.0, self._heap[0][0] - time.monotonic()))
+
+    # -- loop ------------------------------------------------------------
+    def run_once(self) -> int:
+        """Sondea los hosts vencidos que permita el presupuesto actual."""
+        budget = self.bucket.take_up_to(MAX_BATCH)
+        batch = self._pop_due(budget)
+        self.bucket.refund(budget - len(batch))
+        if not batch:
+            return 0
+        by_ip = {st.ip: st for st in batch}
+        for ip, rtt in icmp.iter_ping(list(by_ip), timeout=self.timeout):
+            st = by_ip[ip]
+            ok = rtt is not None
+            with self._lock:
+                changed = self._update(st, ok, int(time.time()))
+                self._schedule(st, time.monotonic() + self.interval_for(st))
+            result = {'ip': ip, 'ok': ok,
+                      'rtt_ms': round(rtt, 3) if rtt is not None else None,
+                      'timestamp': datetime.utcnow().isoformat()}
+            try:
+                self.on_result(st, result, changed)
+            except Exception:
+                pass
+        return len(batch)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                probed = self.run_once()
+            except Exception:
+                probed = 0
+            if not probed:
+                self._wake.wait(self._next_wait() or 0.05)
+                self._wake.clear()
+
+    def start(self):
+        if self._thread is None and not icmp.use_subprocess():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='probe-scheduler', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            states = list(self.hosts.values())
+        return {
+            'hosts': len(states),
+            'online': sum(1 for s in states if s.ok),
+            'flapping': sum(1 for s in states if s.flap >= FLAP_THRESHOLD),
+            'backoff': sum(1 for s in states if s.ok is False and s.failures > 1),
+            'rate': self.bucket.rate,
+        }
@@ -0,0 +1,276 @@
+"""Índice en memoria para buscar dispositivos sin recorrer `/api/devices`.
+
+`DeviceIndex` se mantiene a partir de la instantánea versionada de
+dispositivos (`utilidades.snapshot`): `sync()` aplica solo las claves
+cambiadas desde la última versión indexada, o reindexa todo si el
+registro de cambios ya no alcanza. Estructuras:
+
+- IP: lista ordenada de `(versión, entero, ip)`; un CIDR es un rango
+  contiguo, así que la contención se resuelve con dos `bisect` y la
+  paginación es un corte de la lista (mismo resultado que un árbol de
+  prefijos, sin un nodo por bit).
+- MAC: diccionario MAC normalizada → IPs, y OUI (3 primeros bytes) → IPs
+  para buscar por fabricante. Los nombres de fabricante salen de un
+  fichero OUI del IEEE si existe (`OUI_FILE`, por defecto
+  `configuracion/oui.txt`); si no, `vendor` acepta el OUI en hexadecimal.
+- Hostname: índice de trigramas (subcadena, sin distinguir mayúsculas);
+  las consultas de menos de 3 caracteres recorren los nombres.
+
+Los filtros se combinan por intersección empezando por el conjunto más
+pequeño; el resultado sale ordenado por IP.
+"""
+import bisect
+import ipaddress
+import os
+import re
+import threading
+from pathlib import Path
+
+OUI_FILE = Path(os.getenv('OUI_FILE', Path(__file__).resolve().parents[2] / 'configuracion' / 'oui.txt'))
+MAX_LIMIT = 1000
+
+_HEX = re.compile(r'[^0-9a-f]')
+_OUI = re.compile(r'[0-9a-fA-F]{2}([-:]?[0-9a-fA-F]{2}){2}')
+_OUI_LINE = re.compile(r'^\s*([0-9A-Fa-f]{2}[-:]?[0-9A-Fa-f]{2}[-:]?[0-9A-Fa-f]{2})\s+\(hex\)\s+(.+?)\s*$')
+
+
+def normalize_mac(mac: str) -> str:
+    """'AA-BB-CC-DD-EE-FF' → 'aa:bb:cc:dd:ee:ff' (también prefijos)."""
+    digits = _HEX.sub('', (mac or '').lower())
+    return ':'.join(digits[i:i + 2] for i in range(0, len(digits), 2))
+
+
+def _ip_key(ip: str):
+    addr = ipaddress.ip_address(ip)
+    return addr.version, int(addr), ip
+
+
+def _trigrams(text: str) -> set:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+_VENDORS = None
+_VENDORS_LOCK = threading.Lock()
+
+
+def vendors() -> dict:
+    """{oui: fabricante} del fichero OUI (vacío si no existe); se lee una vez."""
+    global _VENDORS
+    with _VENDORS_LOCK:
+        if _VENDORS is None:
+            table = {}
+            try:
+                with open(OUI_FILE, encoding='utf-8', errors='replace') as f:
+                    for line in f:
+                        m = _OUI_LINE.match(line)
+                        if m:
+                            table[normalize_mac(m.group(1))] = m.group(2)
+            except OSError:
+                pass
+            _VENDORS = table
+        return _VENDORS
+
+
+class DeviceIndex:
+    def __init__(self):
+        self.version = None
+        self._docs = {}       # ip -> device doc
+        self._keys = []       # sorted (version, int, ip)
+        self._key = {}        # ip -> its entry in _keys
+        self._by_network = {}  # network -> {ip}
+        self._by_state = {True: set(), False: set()}
+        self._by_mac = {}     # mac -> {ip}
+        self._by_oui = {}     # oui -> {ip}
+        self._by_tri = {}     # trigram -> {ip}
+        self._names = {}      # ip -> lowercase hostname
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._docs)
+
+    # -- maintenance ---------------------------------------------------------------
+    def sync(self, snapshot, changes_since):
+        """Lleva el índice a `snapshot.version`; `changes_since(v)` es el de
+        `VersionedSnapshot` (None → reindexar todo)."""
+        with self._lock:
+            if self.version == snapshot.version:
+                return
+            keys = changes_since(self.version) if self.version is not None else None
+            if keys is None:
+                self.load(snapshot.index.values())
+            else:
+                for ip in keys:
+                    doc = snapshot.index.get(ip)
+                    if doc is None:
+                        self.remove(ip)
+                    else:
+                        self.upsert(doc)
+            self.version = snapshot.version
+
+    def load(self, docs):
+        with self._lock:
+            self._docs, self._keys, self._key = {}, [], {}
+            self._by_mac, self._by_oui, self._by_tri, self._names = {}, {}, {}, {}
+            self._by_network, self._by_state = {}, {True: set(), False: set()}
+            for doc in docs:
+                try:
+                    key = _ip_key(doc['ip'])
+                except (KeyError, ValueError):
+                    continue
+                self._key[key[2]] = key
+                self._docs[key[2]] = doc
+                self._add_terms(doc)
+            self._keys = sorted(self._key.values())
+
+    def upsert(self, doc: dict):
+        ip = doc.get('ip')
+        try:
+            key = _ip_key(ip)
+        except (TypeError, ValueError):
+            return
+        with self._lock:
+            old = self._docs.get(ip)
+            if old is not None:
+                self._drop_terms(old)
+            else:
+                bisect.insort(self._keys, key)
+                self._key[ip] = key
+            self._docs[ip] = doc
+            self._add_terms(doc)
+
+    def remove(self, ip: str):
+        with self._lock:
+            old = self._docs.pop(ip, None)
+            if old is None:
+                return
+            self._drop_terms(old)
+            key = self._key.pop(ip)
+            i = bisect.bisect_left(self._keys, key)
+            if i < len(self._keys) and self._keys[i] == key:
+                del self._keys[i]
+
+    def _add_terms(self, doc):
+        ip = doc['ip']
+        self._by_network.setdefault(doc.get('network'), set()).add(ip)
+        self._by_state[bool(doc.get('ok'))].add(ip)
+        mac = normalize_mac(doc.get('mac'))
+        if mac:
+            self._by_mac.setdefault(mac, set()).add(ip)
+            self._by_oui.setdefault(mac[:8], set()).add(ip)
+        name = (doc.get('hostname') or '').lower()
+        if name:
+            self._names[ip] = name
+            for tri in _trigrams(name):
+                self._by_tri.setdefault(tri, set()).add(ip)
+
+    def _drop_terms(self, doc):
+        ip = doc['ip']
+        _discard(self._by_network, doc.get('network'), ip)
+        self._by_state[bool(doc.get('ok'))].discard(ip)
+        mac = normalize_mac(doc.get('mac'))
+        if mac:
+            _discard(self._by_mac, mac, ip)
+            _discard(self._by_oui, mac[:8], ip)
+        name = self._names.pop(ip, None)
+        if name:
+            for tri in _trigrams(name):
+                _discard(self._by_tri, tri, ip)
+
+    # -- queries --------------------------------------------------------------------
+    def _cidr_range(self, cidr: str):
+        net = ipaddress.ip_network(cidr, strict=False)
+        lo = bisect.bisect_left(self._keys, (net.version, int(net.network_address), ''))
+        hi = bisect.bisect_right(self._keys, (net.version, int(net.broadcast_address), '\uffff'))
+        return lo, hi
+
+    def _hostname(self, text: str) -> set:
+        text = text.lower()
+        if len(text) < 3:
+            return {ip for ip, name in self._names.items() if text in name}
+        sets = sorted((self._by_tri.get(t, ()) for t in _trigrams(text)), key=len)
+        if not sets or not sets[0]:
+            return set()
+        found = set(sets[0])
+        for s in sets[1:]:
+            found &= s
+            if not found:
+                return found
+        if len(text) == 3:
+            return found
+        return {ip for ip in found if text in self._names.get(ip, '')}
+
+    def _vendor(self, text: str) -> set:
+        if _OUI.fullmatch(text.strip()):
+            return set(self._by_oui.get(normalize_mac(text), ()))
+        text = text.lower()
+        table = vendors()
+        found = set()
+        for prefix, ips in self._by_oui.items():
+            if text in table.get(prefix, '').lower():
+                found |= ips
+        return found
+
+    def _match(self, lo: int, hi: int, sets: list) -> list:
+        """IPs de `_keys[lo:hi]` presentes en todos los `sets`, en orden."""
+        keys = self._keys
+        sets.sort(key=len)
+        if hi - lo <= len(sets[0]):
+            # the IP range is the most selective filter: walk it
+            return [k[2] for k in keys[lo:hi] if all(k[2] in s for s in sets)]
+        cand = sets[0].intersection(*sets[1:])
+        if len(cand) * 4 < hi - lo:
+            # selective filters: sort the few candidates that fall inside the range
+            first, last = keys[lo], keys[hi - 1]
+            return [k[2] for k in sorted(map(self._key.__getitem__, cand)) if first <= k <= last]
+        # dense: walk the sorted range
+        return [k[2] for k in keys[lo:hi] if k[2] in cand]
+
+    def search(self, cidr: str = None, mac: str = None, vendor: str = None, hostname: str = None,
+               network: str = None, online: bool = None, offset: int = 0, limit: int = 50) -> dict:
+        """Dispositivos que cumplen todos los filtros, ordenados por IP.
+
+        `cidr` puede ser una IP suelta; `mac` es exacta; `vendor` es un OUI
+        (`aa:bb:cc`) o parte del nombre del fabricante; `hostname` es una
+        subcadena. Lanza ValueError si `cidr` no es válido.
+        """
+        offset = max(0, int(offset))
+        limit = max(1, min(int(limit), MAX_LIMIT))
+        with self._lock:
+            lo, hi = self._cidr_range(cidr) if cidr else (0, len(self._keys))
+            if lo >= hi:
+                return {'total': 0, 'offset': offset, 'limit': limit, 'devices': []}
+            sets = []
+            if mac:
+                sets.append(self._by_mac.get(normalize_mac(mac), set()))
+            if vendor:
+                sets.append(self._vendor(vendor))
+            if hostname:
+                sets.append(self._hostname(hostname))
+            if network is not None:
+                sets.append(self._by_network.get(network, set()))
+            if online is not None:
+                sets.append(self._by_state[bool(online)])
+            if not sets:
+                # IP range only: the page is a slice of the sorted keys
+                total = hi - lo
+                page = [k[2] for k in self._keys[lo + offset:min(hi, lo + offset + limit)]]
+            else:
+                matched = self._match(lo, hi, sets)
+                total = len(matched)
+                page = matched[offset:offset + limit]
+            docs = self._docs
+            table = vendors()
+            out = []
+            for ip in page:
+                d = docs[ip]
+                name = table.get(normalize_mac(d.get('mac'))[:8]) if table else None
+                out.append(dict(d, vendor=name) if name else d)
+        return {'total': total, 'offset': offset, 'limit': limit, 'devices': out}
+
+
+def _discard(index: dict, term, ip):
+    s = index.get(term)
+    if s is not None:
+        s.discard(ip)
+        if not s:
+            del index[term]
@@ -0,0 +1,301 @@
+"""Checks de servicio (`tcp`, `tls`, `http`) sobre asyncio.
+
+Corren en el loop del motor ICMP (como `async_run_ping`), así que miles de
+checks comparten un único hilo. Un semáforo global acota los connects
+simultáneos. Las peticiones HTTP reutilizan conexiones keep-alive de un
+pool por destino (esquema, host, puerto): en un check con conexión
+reutilizada `connect_ms`/`tls_ms` son None y `reused` es True.
+
+Los resultados tienen el formato de `run_ping` (`host`, `ok`, `rtt_ms`,
+`timestamp`, `error` si falla) más `type`, `port`, `connect_ms`, `tls_ms`,
+`ttfb_ms` y, en HTTP, `status`.
+"""
+import asyncio
+import ssl
+import time
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+
+DEFAULT_TIMEOUT = 5.0
+MAX_CONNECTS = 2048
+POOL_MAX_IDLE = 4
+POOL_IDLE_TIMEOUT = 30.0
+MAX_HEADER_LINES = 200
+
+_connect_sem = None
+
+
+def _sem() -> asyncio.Semaphore:
+    # created lazily so it binds to the engine loop
+    global _connect_sem
+    if _connect_sem is None:
+        _connect_sem = asyncio.Semaphore(MAX_CONNECTS)
+    return _connect_sem
+
+
+def _ms(t0: float) -> float:
+    return round((time.perf_counter() - t0) * 1000.0, 3)
+
+
+def _result(kind: str, host: str, port: int, ok: bool, rtt_ms=None, **extra) -> dict:
+    res = {'host': host, 'ok': ok, 'rtt_ms': rtt_ms, 'type': kind, 'port': port}
+    res.update(extra)
+    res['timestamp'] = datetime.utcnow().isoformat()
+    return res
+
+
+def _ssl_context(verify: bool) -> ssl.SSLContext:
+    ctx = ssl.create_default_context()
+    if not verify:
+        ctx.check_hostname = False
+        ctx.verify_mode = ssl.CERT_NONE
+    return ctx
+
+
+# built once: create_default_context() reloads the CA store (tens of ms) and the
+# handshakes run on the shared engine loop
+_CONTEXTS = {True: _ssl_context(True), False: _ssl_context(False)}
+
+
+def _der(data: bytes, pos: int):
+    """(tag, inicio del contenido, fin) del elemento DER en `pos`."""
+    tag, n = data[pos], data[pos + 1]
+    pos += 2
+    if n & 0x80:
+        size = n & 0x7f
+        n = int.from_bytes(data[pos:pos + size], 'big')
+        pos += size
+    return tag, pos, pos + n
+
+
+def _not_after(der: bytes):
+    """Epoch de `notAfter` de un certificado X.509 en DER (None si no se entiende)."""
+    try:
+        _tag, pos, _end = _der(der, 0)          # Certificate
+        _tag, pos, _end = _der(der, pos)        # TBSCertificate
+        if der[pos] == 0xa0:                    # [0] version
+            pos = _der(der, pos)[2]
+        for _field in range(3):                 # serial, signature, issuer
+            pos = _der(der, pos)[2]
+        _tag, pos, _end = _der(der, pos)        # validity
+        pos = _der(der, pos)[2]                 # notBefore
+        tag, start, end = _der(der, pos)
+        text = der[start:end].decode('ascii')
+        fmt = '%y%m%d%H%M%SZ' if tag == 0x17 else '%Y%m%d%H%M%SZ'
+        return datetime.strptime(text, fmt).replace(tzinfo=timezone.utc).timestamp()
+    except (IndexError, ValueError, UnicodeDecodeError):
+        return None
+
+
+def _cert_days_left(writer):
+    # binary form: the decoded dict is empty when the chain was not verified
+    sslobj = writer.get_extra_info('ssl_object')
+    der = sslobj.getpeercert(binary_form=True) if sslobj is not None else None
+    expires = _not_after(der) if der else None
+    if expires is None:
+        return None
+    return round((expires - time.time()) / 86400.0, 1)
+
+
+async def _open(host: str, port: int, tls: bool, verify: bool, timeout: float):
+    """Abre una conexión midiendo TCP connect y handshake TLS por separado."""
+    async with _sem():
+        t0 = time.perf_counter()
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+        connect_ms = _ms(t0)
+        tls_ms = None
+        if tls:
+            t1 = time.perf_counter()
+            try:
+                await asyncio.wait_for(writer.start_tls(_CONTEXTS[verify], server_hostname=host),
+                                       timeout)
+            except BaseException:
+                writer.close()
+                raise
+            tls_ms = _ms(t1)
+        return reader, writer, connect_ms, tls_ms
+
+
+def _close(writer):
+    try:
+        writer.close()
+    except Exception:
+        pass
+
+
+# -- checks -------------------------------------------------------------------
+async def tcp_check(host: str, port: int, timeout: float = DEFAULT_TIMEOUT) -> dict:
+    """Connect TCP a `host:port`; `rtt_ms` es el tiempo de connect."""
+    try:
+        _r, writer, connect_ms, _tls = await _open(host, port, False, True, timeout)
+    except Exception as e:
+        return _result('tcp', host, port, False, error=_describe(e))
+    _close(writer)
+    return _result('tcp', host, port, True, connect_ms, connect_ms=connect_ms)
+
+
+async def tls_check(host: str, port: int = 443, timeout: float = DEFAULT_TIMEOUT,
+                    verify: bool = True) -> dict:
+    """Connect + handshake TLS; incluye los días hasta que caduca el certificado."""
+    t0 = time.perf_counter()
+    try:
+        _r, writer, connect_ms, tls_ms = await _open(host, port, True, verify, timeout)
+    except ssl.SSLCertVerificationError as e:
+        # still report how long ago (or until when) the rejected certificate expires
+        return _result('tls', host, port, False, error=_describe(e),
+                       cert_days_left=await _unverified_days_left(host, port, timeout))
+    except Exception as e:
+        return _result('tls', host, port, False, error=_describe(e))
+    days = _cert_days_left(writer)
+    _close(writer)
+    return _result('tls', host, port, True, _ms(t0), connect_ms=connect_ms, tls_ms=tls_ms,
+                   cert_days_left=days)
+
+
+async def _unverified_days_left(host: str, port: int, timeout: float):
+    try:
+        _r, writer, _c, _t = await _open(host, port, True, False, timeout)
+    except Exception:
+        return None
+    days = _cert_days_left(writer)
+    _close(writer)
+    return days
+
+
+class _Pool:
+    """Conexiones keep-alive libres hacia un destino."""
+
+    def __init__(self):
+        self.idle = []
+
+    def get(self):
+        now = time.monotonic()
+        while self.idle:
+            reader, writer, since = self.idle.pop()
+            if now - since < POOL_IDLE_TIMEOUT and not reader.at_eof() and not writer.is_closing():
+                return reader, writer
+            _close(writer)
+        return None
+
+    def put(self, reader, writer):
+        if len(self.idle) >= POOL_MAX_IDLE:
+            _close(writer)
+            return
+        self.idle.append((reader, writer, time.monotonic()))
+
+    def close(self):
+        for _r, writer, _t in self.idle:
+            _close(writer)
+        self.idle.clear()
+
+
+_POOLS = {}
+
+
+def close_pools():
+    for pool in _POOLS.values():
+        pool.close()
+    _POOLS.clear()
+
+
+async def _read_body(reader, headers: dict, method: str, status: int) -> bool:
+    """Consume el cuerpo; devuelve True si la conexión puede reutilizarse."""
+    if method == 'HEAD' or status in (204, 304) or 100 <= status < 200:
+        return True
+    if 'chunked' in headers.get('transfer-encoding', '').lower():
+        while True:
+            size = int((await reader.readline()).split(b';', 1)[0].strip() or b'0', 16)
+            if size == 0:
+                # trailers end with an empty line
+                while (await reader.readline()).strip():
+                    pass
+                return True
+            await reader.readexactly(size + 2)
+    length = headers.get('content-length')
+    if length is not None:
+        await reader.readexactly(int(length))
+        return True
+    await reader.read()
+    return False
+
+
+async def _request(reader, writer, method: str, host_header: str, path: str, timeout: float):
+    writer.write(('%s %s HTTP/1.1\r\nHost: %s\r\nUser-Agent: mi-monitor-red\r\n'
+                  'Accept: */*\r\nConnection: keep-alive\r\n\r\n'
+                  % (method, path, host_header)).encode('latin-1'))
+    await writer.drain()
+    t0 = time.perf_counter()
+    line = await asyncio.wait_for(reader.readline(), timeout)
+    ttfb_ms = _ms(t0)
+    parts = line.decode('latin-1').split(None, 2)
+    if len(parts) < 2 or not parts[0].startswith('HTTP/'):
+        raise ConnectionError('invalid status line: %r' % line[:80])
+    status = int(parts[1])
+    headers = {}
+    for _ in range(MAX_HEADER_LINES):
+        raw = await asyncio.wait_for(reader.readline(), timeout)
+        if raw in (b'\r\n', b'\n', b''):
+            break
+        k, _sep, v = raw.decode('latin-1').partition(':')
+        headers[k.strip().lower()] = v.strip()
+    reusable = await asyncio.wait_for(_read_body(reader, headers, method, status), timeout)
+    if parts[0] == 'HTTP/1.0' or headers.get('connection', '').lower() == 'close':
+        reusable = False
+    return status, ttfb_ms, reusable
+
+
+async def http_check(url: str, timeout: float = DEFAULT_TIMEOUT, method: str = 'GET',
+                     expect_status=None, verify: bool = True) -> dict:
+    """Petición HTTP/1.1 sobre una conexión del pool. `ok` si el estado es
+    `expect_status` (o < 400 si no se indica)."""
+    parts = urlsplit(url if '://' in url else 'http://' + url)
+    tls = parts.scheme == 'https'
+    host = parts.hostname or ''
+    port = parts.port or (443 if tls else 80)
+    path = (parts.path or '/') + ('?' + parts.query if parts.query else '')
+    host_header = parts.netloc.rsplit('@', 1)[-1]
+    kind = 'https' if tls else 'http'
+    key = (parts.scheme, host, port, verify)
+    pool = _POOLS.get(key)
+    if pool is None:
+        pool = _POOLS[key] = _Pool()
+    t0 = time.perf_counter()
+    conn = pool.get()
+    connect_ms = tls_ms = None
+    reused = conn is not None
+    try:
+        if conn is None:
+            reader, writer, connect_ms, tls_ms = await _open(host, port, tls, verify, timeout)
+        else:
+            reader, writer = conn
+        try:
+            status, ttfb_ms, reusable = await _request(reader, writer, method, host_header, path,
+                                                       timeout)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            if not reused:
+                raise
+            # the server dropped an idle keep-alive connection: retry once on a fresh one
+            _close(writer)
+            reused = False
+            reader, writer, connect_ms, tls_ms = await _open(host, port, tls, verify, timeout)
+            status, ttfb_ms, reusable = await _request(reader, writer, method, host_header, path,
+                                                       timeout)
+    except Exception as e:
+        return _result(kind, host, port, False, error=_describe(e), url=url)
+    if reusable:
+        pool.put(reader, writer)
+    else:
+        _close(writer)
+    if expect_status is not None:
+        ok = status in (expect_status if isinstance(expect_status, (list, tuple, set))
+                        else (int(expect_status),))
+    else:
+        ok = status < 400
+    return _result(kind, host, port, ok, _ms(t0), url=url, status=status, connect_ms=connect_ms,
+                   tls_ms=tls_ms, ttfb_ms=ttfb_ms, reused=reused)
+
+
+def _describe(e: Exception) -> str:
+    if isinstance(e, asyncio.TimeoutError):
+        return 'timeout'
+    return str(e) or type(e).__name__
@@ -0,0 +1,254 @@
+"""Escaneo por shards en varios procesos para rangos grandes e IPv6.
+
+- `iter_hosts()` recorre las direcciones de una red por aritmética entera,
+  sin materializar `list(net.hosts())`; el shard `i` de `N` toma las
+  posiciones `i, i+N, i+2N...` (la carga se reparte por toda la red).
+- `iter_ping_sharded()` lanza un proceso por shard, cada uno con su event
+  loop y sus sockets ICMP. Todos comparten un `SharedTokenBucket`, así que
+  `rate` es un límite global de paquetes por segundo. Los resultados llegan
+  por lotes a una cola y el reductor los genera según llegan, en streaming.
+  Los procesos salen de un `forkserver` (o `spawn`), nunca de un `fork`
+  del servidor: heredarían los candados de sus hilos (motor ICMP, writer,
+  telemetría) tal y como estuvieran. Por eso `prober_factory` debe poder
+  serializarse (una clase de módulo o un `functools.partial` sobre ella).
+- En IPv6 no se enumeran los prefijos (un /64 son 2^64 direcciones): los
+  objetivos salen de la tabla de vecinos (NDP) tras un echo al grupo
+  all-nodes `ff02::1` de cada interfaz (`seed_ipv6()`).
+"""
+import asyncio
+import ipaddress
+import math
+import multiprocessing
+import queue
+import re
+import socket
+import subprocess
+import time
+
+from monitores import icmp
+from monitores.neighbors import read_neigh
+from utilidades.ratelimit import SharedTokenBucket
+
+# widest IPv6 range that is still enumerated address by address
+MAX_BRUTE_V6 = 65536
+RESULT_BATCH = 256
+BATCH_INTERVAL = 0.1
+TOKEN_CHUNK = 32
+MULTICAST_WAIT = 2
+# process start-up and the final drain, on top of the estimated sweep time
+DEADLINE_SLACK = 30.0
+
+_FROM_RE = re.compile(r'from ([0-9a-fA-F:]+)')
+
+
+def iter_hosts(net, shard: int = 0, shards: int = 1):
+    """Igual que `net.hosts()` pero perezoso y por shard."""
+    first = int(net.network_address)
+    last = int(net.broadcast_address)
+    if net.version == 4 and net.prefixlen < 31:
+        first, last = first + 1, last - 1
+    elif net.version == 6 and net.prefixlen < 127:
+        # hosts() skips the subnet-router anycast address
+        first += 1
+    make = type(net.network_address)
+    for i in range(first + shard, last + 1, shards):
+        yield str(make(i))
+
+
+def seed_ipv6(net, wait: float = MULTICAST_WAIT) -> list:
+    """Direcciones de `net` conocidas sin barrer el prefijo: echo a `ff02::1`
+    en cada interfaz (rellena la caché NDP y lista quién responde) más las
+    entradas de la tabla de vecinos IPv6."""
+    found = set()
+    procs = []
+    for _index, name in socket.if_nameindex():
+        if name == 'lo':
+            continue
+        try:
+            procs.append(subprocess.Popen(
+                ['ping', '-6', '-n', '-c', '2', '-w', str(int(wait)), 'ff02::1%' + name],
+                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True))
+        except OSError:
+            break
+    for p in procs:
+        try:
+            out, _ = p.communicate(timeout=wait + 2)
+        except subprocess.TimeoutExpired:
+            p.kill()
+            out, _ = p.communicate()
+        found.update(_FROM_RE.findall(out or ''))
+    found.update(read_neigh(socket.AF_INET6))
+    targets = []
+    for ip in found:
+        try:
+            if ipaddress.ip_address(ip.split('%', 1)[0]) in net:
+                targets.append(ip)
+        except ValueError:
+            continue
+    return sorted(targets, key=lambda ip: ipaddress.ip_address(ip.split('%', 1)[0]))
+
+
+def targets_for(net, shard: int = 0, shards: int = 1):
+    """Objetivos de un shard: todas las direcciones o, en prefijos IPv6
+    grandes, las sembradas por `seed_ipv6()`."""
+    if net.version == 6 and net.num_addresses > MAX_BRUTE_V6:
+        return iter(seed_ipv6(net)[shard::shards])
+    return iter_hosts(net, shard, shards)
+
+
+# -- shard worker (child process) ------------------------------------------
+class _Batcher:
+    def __init__(self, out, shard: int):
+        self.out = out
+        self.shard = shard
+        self.items = []
+        self.sent = time.monotonic()
+
+    def add(self, item):
+        self.items.append(item)
+        if len(self.items) >= RESULT_BATCH or time.monotonic() - self.sent >= BATCH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        if self.items:
+            self.out.put((self.shard, 'results', self.items))
+            self.items = []
+        self.sent = time.monotonic()
+
+
+async def _run_shard(prober, hosts, bucket, emit, timeout: float, concurrency: int):
+    async def one(host):
+        return host, await prober._probe_safe(host, timeout)
+
+    inflight = set()
+    budget = 0
+    for host in hosts:
+        if bucket is not None:
+            while budget == 0:
+                budget = bucket.take_up_to(TOKEN_CHUNK)
+                if budget == 0:
+                    await asyncio.sleep(min(0.1, TOKEN_CHUNK / bucket.rate))
+            budget -= 1
+        if len(inflight) >= concurrency:
+            done, inflight = await asyncio.wait(inflight, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                emit(task.result())
+        inflight.add(asyncio.ensure_future(one(host)))
+    if budget:
+        bucket.refund(budget)
+    while inflight:
+        done, inflight = await asyncio.wait(inflight, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            emit(task.result())
+
+
+def _shard_main(net, targets, shard, shards, bucket, out, timeout, concurrency, prober_factory):
+    # child process: fresh loop and sockets, nothing shared with the parent's engine
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    prober = prober_factory(loop)
+    batcher = _Batcher(out, shard)
+    try:
+        hosts = iter(targets[shard::shards]) if targets is not None else iter_hosts(net, shard, shards)
+
+        async def main():
+            async def tick():
+                # late replies should not wait for the batch to fill
+                while True:
+                    await asyncio.sleep(BATCH_INTERVAL)
+                    batcher.flush()
+            ticker = asyncio.ensure_future(tick())
+            try:
+                await _run_shard(prober, hosts, bucket, batcher.add, timeout, concurrency)
+            finally:
+                ticker.cancel()
+
+        loop.run_until_complete(main())
+        batcher.flush()
+        out.put((shard, 'done', None))
+    except Exception as e:
+        batcher.flush()
+        out.put((shard, 'error', '%s: %s' % (type(e).__name__, e)))
+    finally:
+        prober.close()
+        loop.close()
+
+
+def _context():
+    # a fork of the server would inherit whatever thread locks happened to be held;
+    # the fork server is a clean single-threaded process that forks cheaply
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        ctx = multiprocessing.get_context('forkserver')
+        ctx.set_forkserver_preload(['monitores.sharded'])
+        return ctx
+    return multiprocessing.get_context('spawn')
+
+
+def _deadline(count: int, shards: int, rate: float, timeout: float, concurrency: int) -> float:
+    """Segundos que puede durar un barrido de `count` direcciones en el peor caso."""
+    rounds = math.ceil(count / float(shards * concurrency))
+    return rounds * timeout + (count / rate if rate else 0) + DEADLINE_SLACK
+
+
+def iter_ping_sharded(net, shards: int = None, rate: float = 0, timeout: float = icmp.DEFAULT_TIMEOUT,
+                      concurrency: int = icmp.DEFAULT_CONCURRENCY, idle: float = None,
+                      prober_factory=None, deadline: float = None):
+    """Itera {'ip', 'ok', 'rtt_ms'} de `net` (red o CIDR) en orden de llegada,
+    repartiendo el barrido en `shards` procesos con un límite global de
+    `rate` sondas/s (0 = sin límite). Con `idle`, genera None si pasan
+    `idle` segundos sin resultados. Pasados `deadline` segundos (por
+    defecto, una estimación del peor caso) termina los shards y lanza
+    RuntimeError."""
+    if not isinstance(net, (ipaddress.IPv4Network, ipaddress.IPv6Network)):
+        net = ipaddress.ip_network(str(net), strict=False)
+    shards = max(1, int(shards or multiprocessing.cpu_count()))
+    targets = None
+    if net.version == 6 and net.num_addresses > MAX_BRUTE_V6:
+        targets = seed_ipv6(net)
+        shards = max(1, min(shards, len(targets)))
+        if not targets:
+            return
+    count = len(targets) if targets is not None else net.num_addresses
+    if deadline is None:
+        deadline = _deadline(count, shards, rate, timeout, concurrency)
+    ends = time.monotonic() + deadline
+    ctx = _context()
+    bucket = SharedTokenBucket(rate, ctx=ctx) if rate else None
+    out = ctx.Queue()
+    factory = prober_factory or icmp.get_engine().prober_factory
+    procs = [ctx.Process(target=_shard_main, name='scan-shard-%d' % i, daemon=True,
+                         args=(net, targets, i, shards, bucket, out, timeout, concurrency, factory))
+             for i in range(shards)]
+    for p in procs:
+        p.start()
+    remaining = set(range(shards))
+    errors = []
+    try:
+        while remaining:
+            if time.monotonic() > ends:
+                errors.append('shards %s still running after %.0f s' % (sorted(remaining), deadline))
+                break
+            try:
+                shard, kind, payload = out.get(timeout=idle or 1.0)
+            except queue.Empty:
+                if all(p.exitcode is not None for p in procs) and out.empty():
+                    errors.append('shards exited without finishing: %s' % sorted(remaining))
+                    break
+                if idle:
+                    yield None
+                continue
+            if kind == 'results':
+                for ip, rtt in payload:
+                    yield {'ip': ip, 'ok': rtt is not None,
+                           'rtt_ms': round(rtt, 3) if rtt is not None else None}
+            else:
+                remaining.discard(shard)
+                if kind == 'error':
+                    errors.append('shard %d: %s' % (shard, payload))
+    finally:
+        for p in procs:
+            if p.is_alive():
+                p.terminate()
+            p.join(1)
+    if errors:
+        raise RuntimeError('sharded scan failed: ' + '; '.join(errors))
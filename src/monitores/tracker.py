@@ -0,0 +1,116 @@
+"""Último estado conocido de cada dispositivo para persistir solo diferencias.
+
+El escáner, el planificador y los eventos de vecinos pasan cada
+observación por `DeviceTracker.update()`, que la compara con el estado en
+memoria y devuelve:
+
+- `changes`: los campos que cambiaron de verdad (alta, online/offline, MAC,
+  hostname, red), que se escriben en el acto;
+- `events`: entradas compactas para el log `device_events`
+  (`{'ts', 'ip', 'network', 'type', 'old', 'new'}` con `type` en
+  `new`, `online`, `offline`, `mac`, `hostname`, `network`).
+
+Lo que solo refresca (`last_seen`, `rtt_ms`, `dev`, `state`, `timestamp`)
+se acumula y `take_touched()` lo entrega como mucho cada `touch_interval`
+segundos, de modo que un host que sigue vivo cuesta una escritura por
+intervalo en lugar de una por barrido o sonda. Una dirección que nunca
+respondió ni tiene MAC no genera escrituras.
+"""
+import os
+import threading
+import time
+
+TOUCH_INTERVAL = float(os.getenv('LAST_SEEN_INTERVAL', '60'))
+TRACKED = ('ok', 'mac', 'hostname', 'network')
+TOUCHED = ('rtt_ms', 'dev', 'state', 'timestamp')
+
+
+class DeviceTracker:
+    def __init__(self, touch_interval: float = TOUCH_INTERVAL):
+        self.touch_interval = touch_interval
+        self._state = {}
+        self._touched = {}
+        self._taken = time.monotonic()
+        self._lock = threading.Lock()
+
+    def load(self, docs):
+        """Siembra el estado con los documentos ya guardados (sin eventos)."""
+        with self._lock:
+            for doc in docs:
+                ip = doc.get('ip')
+                if ip:
+                    self._state[ip] = {k: doc.get(k) for k in TRACKED + ('last_seen',)}
+
+    def get(self, ip: str):
+        with self._lock:
+            st = self._state.get(ip)
+            return dict(st, ip=ip) if st is not None else None
+
+    def __len__(self):
+        return len(self._state)
+
+    def update(self, ip: str, fields: dict, ts: int = None):
+        """Compara `fields` con el último estado de `ip`; devuelve (changes, events).
+
+        `mac`/`hostname` a None significan "desconocido" y no borran el valor
+        guardado; `ok` ausente (p. ej. un evento de vecinos sin estado) no
+        cuenta como transición.
+        """
+        ts = int(ts if ts is not None else time.time())
+        ok = fields.get('ok')
+        with self._lock:
+            prev = self._state.get(ip)
+            if prev is None:
+                if not ok and not fields.get('mac'):
+                    return {}, []
+                prev = self._state[ip] = {k: None for k in TRACKED + ('last_seen',)}
+                new = True
+            else:
+                new = False
+            changes = {}
+            for key in TRACKED:
+                value = fields.get(key)
+                if value is None or value == prev[key]:
+                    continue
+                changes[key] = value
+            events = self._events(ip, prev, changes, ts, new, fields)
+            prev.update(changes)
+            if ok:
+                prev['last_seen'] = ts
+            touch = {k: fields[k] for k in TOUCHED if fields.get(k) is not None}
+            if ok:
+                touch['last_seen'] = ts
+            if changes:
+                # a real change is written now, together with the fresh fields
+                changes.update(self._touched.pop(ip, {}))
+                changes.update(touch)
+            elif touch:
+                self._touched.setdefault(ip, {}).update(touch)
+        return changes, events
+
+    def _events(self, ip, prev, changes, ts, new, fields) -> list:
+        network = changes.get('network') or prev['network'] or fields.get('network')
+        if new:
+            return [{'ts': ts, 'ip': ip, 'network': network, 'type': 'new', 'old': None,
+                     'new': changes.get('mac')}]
+        events = []
+        for key, value in changes.items():
+            if key == 'ok':
+                if prev['ok'] is None and not value:
+                    continue
+                events.append({'ts': ts, 'ip': ip, 'network': network,
+                               'type': 'online' if value else 'offline', 'old': prev['last_seen'],
+                               'new': None})
+            else:
+                events.append({'ts': ts, 'ip': ip, 'network': network, 'type': key,
+                               'old': prev[key], 'new': value})
+        return events
+
+    def take_touched(self, force: bool = False) -> dict:
+        """{ip: campos} acumulados desde la última entrega, si pasó el intervalo."""
+        with self._lock:
+            if not force and time.monotonic() - self._taken < self.touch_interval:
+                return {}
+            self._taken = time.monotonic()
+            touched, self._touched = self._touched, {}
+        return touched
@@ -1,22 +1,60 @@
 #!/usr/bin/env python3
-"""Script muy simple para servir la UI estática en http://localhost:8000
-Usa solo la librería estándar (no requiere Flask).
+"""Servidor de la UI estática en http://localhost:8000
+Usa solo la librería estándar (no requiere Flask): un hilo por conexión,
+keep-alive y los ficheros preparados por `utilidades.static` (ETag,
+variantes gzip/brotli en memoria, `sendfile` para los grandes).
 """
 import http.server
-import socketserver
+import sys
 from pathlib import Path
+from urllib.parse import unquote, urlsplit
 
 PORT = 8000
 ROOT = Path(__file__).resolve().parent / "static"
 
-class Handler(http.server.SimpleHTTPRequestHandler):
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, directory=str(ROOT), **kwargs)
+SRC_ROOT = Path(__file__).resolve().parents[1]
+if str(SRC_ROOT) not in sys.path:
+    sys.path.insert(0, str(SRC_ROOT))
+
+from utilidades.static import StaticAssets  # noqa: E402
+
+ASSETS = StaticAssets(ROOT)
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    # keep-alive: a dashboard load reuses one connection for all its assets
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self._serve(send_body=True)
+
+    def do_HEAD(self):
+        self._serve(send_body=False)
+
+    def _serve(self, send_body):
+        res = ASSETS.respond(unquote(urlsplit(self.path).path),
+                             self.headers.get('Accept-Encoding'),
+                             self.headers.get('If-None-Match'))
+        if res is None:
+            self.send_error(404)
+            return
+        self.send_response(res.status)
+        for key, value in res.headers:
+            self.send_header(key, value)
+        self.end_headers()
+        if not send_body or res.status == 304:
+            return
+        if res.body is not None:
+            self.wfile.write(res.body)
+            return
+        with open(res.path, 'rb') as f:
+            # zero-copy from the page cache to the socket
+            self.connection.sendfile(f)
 
 
 if __name__ == '__main__':
     print(f"Sirviendo UI estática en http://localhost:{PORT} (raíz: {ROOT})")
-    with socketserver.TCPServer(("", PORT), Handler) as httpd:
+    with http.server.ThreadingHTTPServer(("", PORT), Handler) as httpd:
         try:
             httpd.serve_forever()
         except KeyboardInterrupt:
@@ -87,9 +87,9 @@ if(elements.refreshBtn){
 // websocket for realtime metrics
 (function connectWS(){
   try{
-    const ws = new WebSocket((location.protocol==='https:'?'wss://':'ws://')+location.host+'/ws/updates');
+    const ws = new WebSocket((location.protocol==='https:'?'wss://':'ws://')+location.host+'/ws/updates?topics=metrics');
     ws.onopen = ()=>{ log('WS conectado'); }
-    ws.onmessage = (ev)=>{ try{ const data = JSON.parse(ev.data); if(Array.isArray(data)) data.forEach(d=> log(`${d.metric}: ${d.value}`)); }catch(e){} }
+    ws.onmessage = (ev)=>{ try{ const msg = JSON.parse(ev.data); if(msg.topic==='metrics') log(`${msg.data.metric}: ${msg.data.value}`); }catch(e){} }
     ws.onclose = ()=>{ log('WS cerrado, reconectando en 3s'); setTimeout(connectWS,3000); }
   }catch(e){ console.error('ws',e); setTimeout(connectWS,3000); }
 })();
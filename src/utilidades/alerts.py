@@ -0,0 +1,270 @@
+"""Motor de alertas en streaming sobre ventanas deslizantes.
+
+Las reglas (`configuracion/alertas.yaml`, ver `config.AlertRule`) se
+evalúan a medida que llegan las muestras, sin volver a consultar el
+histórico: cada ventana mantiene una suma acumulada y dos colas monótonas
+(mínimo y máximo), así que añadir una muestra, expulsar las caducadas y
+leer avg/min/max/sum/count/last es O(1) amortizado. Las reglas se indexan
+por origen (`metric:cpu_percent`, `monitor:gateway`, `monitor:*`, ...):
+una muestra solo toca las reglas que la afectan, y las reglas con la misma
+ventana sobre el mismo sujeto comparten una sola.
+
+- Histéresis: una alerta se dispara cuando el agregado cumple `op umbral`
+  y solo se resuelve cuando deja de cumplir `op recuperar`.
+- Deduplicación: una alerta activa por (regla, sujeto); mientras sigue
+  activa se actualiza su valor pero no se vuelve a notificar.
+- Eventos (`nueva_mac`): cada MAC se avisa una sola vez por red. Hasta que
+  una red tiene línea base (`baseline()` o el primer barrido completo,
+  `network_scanned()`), sus MAC se aprenden sin avisar.
+
+Las ventanas por tiempo solo avanzan con las muestras de su sujeto.
+"""
+import operator
+import threading
+import time
+from collections import deque
+
+from utilidades import telemetry
+
+HISTORY_SIZE = 500
+
+_OPS = {'>': operator.gt, '>=': operator.ge, '<': operator.lt, '<=': operator.le}
+
+NOTIFIED = telemetry.counter('alerts', 'Transiciones de alertas notificadas', ['severity', 'state'])
+
+
+class Window:
+    """Agregados incrementales de las últimas `samples` muestras o `seconds` segundos."""
+    __slots__ = ('seconds', 'samples', 'items', 'sum', 'mins', 'maxs', 'seq')
+
+    def __init__(self, seconds: float = None, samples: int = None):
+        self.seconds = seconds
+        self.samples = samples
+        self.items = deque()   # (seq, ts, value)
+        self.mins = deque()    # (seq, value), values increasing
+        self.maxs = deque()    # (seq, value), values decreasing
+        self.sum = 0.0
+        self.seq = 0
+
+    def add(self, ts: float, value: float):
+        self.seq += 1
+        seq = self.seq
+        self.items.append((seq, ts, value))
+        self.sum += value
+        mins, maxs = self.mins, self.maxs
+        while mins and mins[-1][1] >= value:
+            mins.pop()
+        mins.append((seq, value))
+        while maxs and maxs[-1][1] <= value:
+            maxs.pop()
+        maxs.append((seq, value))
+        self._evict(ts)
+
+    def _evict(self, now: float):
+        items = self.items
+        cutoff = now - self.seconds if self.seconds is not None else None
+        while items and ((self.samples is not None and len(items) > self.samples)
+                         or (cutoff is not None and items[0][1] <= cutoff)):
+            seq, _ts, value = items.popleft()
+            self.sum -= value
+            if self.mins[0][0] == seq:
+                self.mins.popleft()
+            if self.maxs[0][0] == seq:
+                self.maxs.popleft()
+        if not items:
+            # drop accumulated float error whenever the window drains
+            self.sum = 0.0
+
+    @property
+    def ready(self) -> bool:
+        # count windows wait until they are full ("loss over 10 probes")
+        if self.samples is not None and self.seconds is None:
+            return len(self.items) >= self.samples
+        return bool(self.items)
+
+    def value(self, aggregate: str):
+        n = len(self.items)
+        if not n:
+            return None
+        if aggregate == 'avg':
+            return self.sum / n
+        if aggregate == 'min':
+            return self.mins[0][1]
+        if aggregate == 'max':
+            return self.maxs[0][1]
+        if aggregate == 'sum':
+            return self.sum
+        if aggregate == 'count':
+            return float(n)
+        return self.items[-1][2]
+
+
+def _alert(rule, subject: str, state: str, value, ts: float, since: float = None, **extra) -> dict:
+    a = {'id': '%s:%s' % (rule.nombre, subject), 'rule': rule.nombre, 'subject': subject,
+         'source': rule.source, 'field': rule.field, 'severity': rule.severity, 'state': state,
+         'value': round(value, 3) if isinstance(value, float) else value,
+         'threshold': rule.threshold, 'op': rule.op, 'since': since if since is not None else ts,
+         'ts': ts}
+    a.update(extra)
+    return a
+
+
+class AlertEngine:
+    """Evalúa `AlertRule`s sobre métricas, resultados de monitores y dispositivos.
+
+    `on_event(alert)` recibe cada transición (`firing`, `resolved`, `event`)
+    fuera del lock del motor.
+    """
+
+    def __init__(self, rules=(), on_event=None, history: int = HISTORY_SIZE):
+        self.on_event = on_event
+        self._rules = ()
+        self._index = {}
+        self._windows = {}
+        self._active = {}
+        self._history = deque(maxlen=history)
+        self._known_macs = {}
+        self._baselined = set()
+        self._lock = threading.Lock()
+        self.set_rules(rules)
+
+    # -- rules -----------------------------------------------------------
+    def set_rules(self, rules):
+        """Sustituye las reglas; las ventanas y alertas activas de las reglas
+        que no cambian se conservan."""
+        rules = tuple(rules)
+        index = {}
+        for rule in rules:
+            index.setdefault((rule.source, rule.target), []).append(rule)
+        keep = {r.nombre for r in rules if r in self._rules}
+        with self._lock:
+            self._rules = rules
+            self._index = index
+            specs = {(r.source, r.field, r.window, r.samples) for r in rules}
+            self._windows = {k: w for k, w in self._windows.items()
+                             if (k[0], k[2], k[3], k[4]) in specs}
+            self._active = {k: a for k, a in self._active.items() if k[0] in keep}
+
+    def rules(self) -> tuple:
+        return self._rules
+
+    # -- inputs ------------------------------------------------------------
+    def observe_metric(self, metric: str, value: float, ts: float = None):
+        rules = self._index.get(('metric', metric))
+        if rules:
+            self._observe(rules, metric, 'value', float(value), ts)
+
+    def observe_result(self, res: dict):
+        """Resultado de `run_check`/`MonitorRunner`: `ok` alimenta `loss`
+        (0/100 por sonda) y, si respondió, `rtt_ms`."""
+        name = res.get('name') or res.get('host')
+        rules = self._index.get(('monitor', name), []) + self._index.get(('monitor', '*'), [])
+        if not rules:
+            return
+        ok = bool(res.get('ok'))
+        loss = [r for r in rules if r.field == 'loss']
+        if loss:
+            self._observe(loss, name, 'loss', 0.0 if ok else 100.0, None)
+        rtt = res.get('rtt_ms')
+        if ok and rtt is not None:
+            rtt_rules = [r for r in rules if r.field == 'rtt_ms']
+            if rtt_rules:
+                self._observe(rtt_rules, name, 'rtt_ms', float(rtt), None)
+
+    def observe_device(self, network: str, device: dict):
+        """Dispositivo visto en `network`; avisa de MAC nuevas."""
+        mac = device.get('mac')
+        if not network or not mac:
+            return
+        mac = mac.lower()
+        with self._lock:
+            known = self._known_macs.setdefault(network, set())
+            if mac in known:
+                return
+            known.add(mac)
+            if network not in self._baselined:
+                return
+            rules = self._index.get(('device', network), []) + self._index.get(('device', '*'), [])
+            now = time.time()
+            events = [_alert(r, '%s/%s' % (network, mac), 'event', 1, now, network=network,
+                             mac=mac, ip=device.get('ip'), hostname=device.get('hostname'),
+                             message='new MAC %s (%s) on %s' % (mac, device.get('ip'), network))
+                      for r in rules if r.field == 'nueva_mac']
+            self._history.extend(events)
+        self._notify(events)
+
+    def baseline(self, network: str, macs):
+        """MAC ya conocidas de `network` (p. ej. de la base de datos)."""
+        with self._lock:
+            self._known_macs.setdefault(network, set()).update(m.lower() for m in macs if m)
+            self._baselined.add(network)
+
+    def network_scanned(self, network: str):
+        """Fin de un barrido de `network`: lo aprendido pasa a ser la línea base."""
+        with self._lock:
+            self._baselined.add(network)
+
+    # -- evaluation --------------------------------------------------------
+    def _observe(self, rules, subject: str, field: str, value: float, ts):
+        ts = time.time() if ts is None else float(ts)
+        events = []
+        with self._lock:
+            fed = set()
+            for rule in rules:
+                key = (rule.source, subject, field, rule.window, rule.samples)
+                window = self._windows.get(key)
+                if window is None:
+                    window = self._windows[key] = Window(rule.window, rule.samples)
+                if key not in fed:
+                    window.add(ts, value)
+                    fed.add(key)
+                if window.ready:
+                    ev = self._evaluate(rule, subject, window.value(rule.aggregate), ts)
+                    if ev is not None:
+                        events.append(ev)
+        self._notify(events)
+
+    def _evaluate(self, rule, subject: str, value: float, ts: float):
+        key = (rule.nombre, subject)
+        active = self._active.get(key)
+        cmp = _OPS[rule.op]
+        if active is None:
+            if not cmp(value, rule.threshold):
+                return None
+            active = _alert(rule, subject, 'firing', value, ts)
+            self._active[key] = active
+            ev = dict(active)
+        else:
+            recover = rule.threshold if rule.recover is None else rule.recover
+            if cmp(value, recover):
+                # still firing: refresh the value, no new notification
+                active['value'] = round(value, 3)
+                active['ts'] = ts
+                return None
+            del self._active[key]
+            ev = _alert(rule, subject, 'resolved', value, ts, since=active['since'])
+        self._history.append(ev)
+        return ev
+
+    def _notify(self, events):
+        for ev in events:
+            NOTIFIED.labels(ev['severity'], ev['state']).inc()
+            if self.on_event is not None:
+                self.on_event(ev)
+
+    # -- queries -------------------------------------------------------------
+    def active(self) -> list:
+        with self._lock:
+            alerts = [dict(a) for a in self._active.values()]
+        return sorted(alerts, key=lambda a: a['since'], reverse=True)
+
+    def history(self, limit: int = 100) -> list:
+        """Últimas transiciones, la más reciente primero."""
+        with self._lock:
+            items = list(self._history)
+        return items[::-1][:max(0, limit)]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'rules': len(self._rules), 'windows': len(self._windows),
+                    'active': len(self._active)}
@@ -0,0 +1,106 @@
+"""Hub de difusión para `/ws/updates`.
+
+Un único productor (los colectores, el escáner, los monitores) publica
+deltas por tema (`metrics`, `devices`, `monitors`, ...) y el hub los reparte
+a todos los suscriptores del event loop. Cada suscriptor tiene una cola
+acotada: los mensajes con la misma clave se fusionan (gana el más reciente)
+y, si aun así se llena, se descarta el más antiguo, de modo que un cliente
+lento nunca frena a los demás ni al productor.
+"""
+import asyncio
+import threading
+from collections import OrderedDict
+
+QUEUE_SIZE = 256
+
+
+class Subscriber:
+    def __init__(self, topics, maxsize: int = QUEUE_SIZE):
+        self.topics = set(topics)
+        self.maxsize = maxsize
+        self.dropped = 0
+        self._queue = OrderedDict()
+        self._seq = 0
+        self._ready = asyncio.Event()
+
+    def offer(self, msg: dict, key=None):
+        # runs on the hub loop
+        if msg['topic'] not in self.topics:
+            return
+        if key is not None and key in self._queue:
+            self._queue[key] = msg
+        else:
+            if len(self._queue) >= self.maxsize:
+                self._queue.popitem(last=False)
+                self.dropped += 1
+            if key is None:
+                self._seq += 1
+                key = ('_', self._seq)
+            self._queue[key] = msg
+        self._ready.set()
+
+    async def get(self) -> dict:
+        while not self._queue:
+            self._ready.clear()
+            await self._ready.wait()
+        return self._queue.popitem(last=False)[1]
+
+
+class BroadcastHub:
+    """Reparte mensajes `{'topic', 'data'}` a los suscriptores de cada tema."""
+
+    def __init__(self, topics=('metrics', 'devices', 'monitors')):
+        self.topics = tuple(topics)
+        self.loop = None
+        self._subs = set()
+        self._last = {}
+        self._lock = threading.Lock()
+
+    def attach(self, loop):
+        """Fija el event loop del servidor (llamar al arrancar la app)."""
+        self.loop = loop
+
+    def publish(self, topic: str, data, key=None):
+        """Publica un delta; seguro desde cualquier hilo. `key` identifica el
+        objeto (métrica, IP, monitor) para fusionar y para el snapshot."""
+        msg = {'topic': topic, 'data': data}
+        if key is not None:
+            with self._lock:
+                self._last[(topic, key)] = msg
+        loop = self.loop
+        if loop is None or loop.is_closed():
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._fanout(msg, key)
+        else:
+            loop.call_soon_threadsafe(self._fanout, msg, key)
+
+    def _fanout(self, msg, key):
+        for sub in list(self._subs):
+            sub.offer(msg, None if key is None else (msg['topic'], key))
+
+    def subscribe(self, topics=None) -> Subscriber:
+        sub = Subscriber(topics or self.topics)
+        self._subs.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscriber):
+        self._subs.discard(sub)
+
+    def snapshot(self, topics) -> list:
+        """Último mensaje conocido de cada clave de los temas pedidos."""
+        with self._lock:
+            return [m for (topic, _k), m in self._last.items() if topic in topics]
+
+    def forget(self, topic: str, key):
+        with self._lock:
+            self._last.pop((topic, key), None)
+
+    def stats(self) -> dict:
+        return {'subscribers': len(self._subs),
+                'dropped': sum(s.dropped for s in self._subs),
+                'keys': len(self._last)}
@@ -0,0 +1,358 @@
+"""Configuración compartida (`configuracion/redes.yaml`, `monitores.yaml`,
+`alertas.yaml`).
+
+Cada fichero se parsea y valida una sola vez en objetos inmutables
+(`Network` con su `ipaddress` ya construido, `Monitor`) y solo se vuelve a
+leer cuando cambia su `mtime`/tamaño; comprobarlo es un `stat()` como mucho
+cada `CHECK_INTERVAL` segundos, así que las peticiones no tocan el disco.
+`Config.watch()` arranca un hilo que detecta los cambios sin esperar a una
+petición y avisa a los suscriptores (`on_change`) para que el escáner, el
+planificador y los monitores se reconfiguren sin reiniciar.
+"""
+import ipaddress
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from urllib.parse import urlsplit
+from types import MappingProxyType
+from typing import NamedTuple
+
+try:
+    import yaml
+except Exception:
+    yaml = None
+
+log = logging.getLogger(__name__)
+
+CONFIG_DIR = Path(__file__).resolve().parents[2] / 'configuracion'
+CHECK_INTERVAL = float(os.getenv('CONFIG_CHECK_INTERVAL', '2'))
+# see monitores.checks.async_run_check
+CHECK_TYPES = ('icmp', 'ping', 'tcp', 'tls', 'http', 'https')
+# see utilidades.alerts
+ALERT_AGGREGATES = ('avg', 'min', 'max', 'sum', 'count', 'last')
+ALERT_OPS = ('>', '>=', '<', '<=')
+ALERT_EVENTS = ('nueva_mac',)
+DEFAULT_ALERT_WINDOW = 300.0
+_DURATION_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+class Network(NamedTuple):
+    nombre: str
+    cidr: str
+    network: object  # ipaddress.IPv4Network / IPv6Network
+
+    def __contains__(self, ip) -> bool:
+        try:
+            return ipaddress.ip_address(ip) in self.network
+        except ValueError:
+            return False
+
+    def as_dict(self) -> dict:
+        return {'nombre': self.nombre, 'cidr': self.cidr}
+
+
+class Monitor(NamedTuple):
+    nombre: str
+    host: str
+    intervalo: float = None
+    options: MappingProxyType = MappingProxyType({})
+
+    def as_dict(self) -> dict:
+        d = dict(self.options, nombre=self.nombre, host=self.host)
+        if self.intervalo is not None:
+            d['intervalo'] = self.intervalo
+        return d
+
+
+class AlertRule(NamedTuple):
+    nombre: str
+    source: str            # 'metric', 'monitor' o 'device'
+    target: str            # métrica, monitor o red ('*' = todos)
+    field: str = 'value'   # 'value'; en monitores 'loss' (%) o 'rtt_ms'; en redes el evento
+    aggregate: str = 'avg'
+    op: str = '>'
+    threshold: float = 0.0
+    recover: float = None  # umbral de recuperación (histéresis); None = el mismo umbral
+    window: float = None   # segundos
+    samples: int = None    # o últimas N muestras
+    severity: str = 'warning'
+
+    def as_dict(self) -> dict:
+        return self._asdict()
+
+
+def _parse_simple(text: str, key: str) -> list:
+    # fallback when PyYAML is missing: flat `- k: v` lists only
+    items = []
+    cur = None
+    for line in text.splitlines():
+        line = line.split('#', 1)[0].strip()
+        if not line or line.rstrip(':') == key:
+            continue
+        if line.startswith('-'):
+            cur = {}
+            items.append(cur)
+            line = line.lstrip('-').strip()
+        if cur is not None and ':' in line:
+            k, v = line.split(':', 1)
+            v = v.strip()
+            if len(v) >= 2 and v[0] == v[-1] and v[0] in '"\'':
+                v = v[1:-1]
+            if v:
+                cur[k.strip()] = v
+    return items
+
+
+def _load_items(path: Path, key: str) -> list:
+    with open(path, 'r', encoding='utf-8') as f:
+        text = f.read()
+    if yaml is None:
+        return _parse_simple(text, key)
+    cfg = yaml.safe_load(text) or {}
+    items = cfg.get(key) if isinstance(cfg, dict) else None
+    return [i for i in items or [] if isinstance(i, dict)]
+
+
+def parse_network(item: dict):
+    cidr = item.get('cidr')
+    try:
+        net = ipaddress.ip_network(str(cidr).strip(), strict=False)
+    except ValueError:
+        log.warning('redes.yaml: ignoring entry with invalid cidr %r', cidr)
+        return None
+    return Network(str(item.get('nombre') or item.get('name') or net), str(net), net)
+
+
+def parse_monitor(item: dict):
+    host = item.get('host') or item.get('ip') or item.get('hostname')
+    if not host and item.get('url'):
+        url = str(item['url'])
+        host = urlsplit(url if '://' in url else 'http://' + url).hostname
+    if not host:
+        log.warning('monitores.yaml: ignoring entry without host: %r', item)
+        return None
+    interval = item.get('intervalo') or item.get('interval')
+    try:
+        interval = float(interval) if interval is not None else None
+    except (TypeError, ValueError):
+        log.warning('monitores.yaml: invalid intervalo %r for %s', interval, host)
+        interval = None
+    kind = str(item.get('tipo') or item.get('type') or 'icmp').lower()
+    if kind not in CHECK_TYPES:
+        log.warning('monitores.yaml: unknown tipo %r for %s', kind, host)
+        return None
+    options = {k: v for k, v in item.items()
+               if k not in ('nombre', 'name', 'host', 'ip', 'hostname', 'intervalo', 'interval')}
+    return Monitor(str(item.get('nombre') or item.get('name') or host), str(host), interval,
+                   MappingProxyType(options))
+
+
+def parse_duration(value):
+    """Segundos de `300`, `'30s'`, `'5m'`, `'1h'` o `'1d'`."""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value).strip().lower()
+    unit = _DURATION_UNITS.get(text[-1:])
+    return float(text[:-1]) * unit if unit else float(text)
+
+
+def parse_alert(item: dict):
+    name = item.get('nombre') or item.get('name')
+    if not name:
+        log.warning('alertas.yaml: ignoring rule without nombre: %r', item)
+        return None
+    try:
+        if item.get('evento') or item.get('event'):
+            event = str(item.get('evento') or item.get('event')).lower()
+            if event not in ALERT_EVENTS:
+                raise ValueError('unknown evento %r' % event)
+            return AlertRule(str(name), 'device', str(item.get('red') or item.get('network') or '*'),
+                             event, 'count', '>=', 1.0,
+                             severity=str(item.get('severidad') or item.get('severity') or 'info'))
+        if item.get('metrica') or item.get('metric'):
+            source, target = 'metric', item.get('metrica') or item.get('metric')
+            field = 'value'
+        elif item.get('monitor'):
+            source, target = 'monitor', item['monitor']
+            field = str(item.get('campo') or item.get('field') or 'loss').lower()
+            field = {'perdida': 'loss', 'rtt': 'rtt_ms'}.get(field, field)
+            if field not in ('loss', 'rtt_ms'):
+                raise ValueError('unknown campo %r' % field)
+        else:
+            raise ValueError('needs metrica, monitor or evento')
+        aggregate = str(item.get('agregado') or item.get('aggregate') or 'avg').lower()
+        if aggregate not in ALERT_AGGREGATES:
+            raise ValueError('unknown agregado %r' % aggregate)
+        op = str(item.get('op') or '>')
+        if op not in ALERT_OPS:
+            raise ValueError('unknown op %r' % op)
+        threshold = float(item.get('umbral', item.get('threshold')))
+        recover = item.get('recuperar', item.get('recover'))
+        samples = item.get('muestras') or item.get('samples')
+        samples = int(samples) if samples is not None else None
+        window = parse_duration(item.get('ventana') or item.get('window'))
+        if window is None and samples is None:
+            window = DEFAULT_ALERT_WINDOW
+        if (window is not None and window <= 0) or (samples is not None and samples <= 0):
+            raise ValueError('ventana/muestras must be positive')
+    except (TypeError, ValueError) as e:
+        log.warning('alertas.yaml: ignoring rule %r: %s', name, e)
+        return None
+    return AlertRule(str(name), source, str(target), field, aggregate, op, threshold,
+                     float(recover) if recover is not None else None, window, samples,
+                     str(item.get('severidad') or item.get('severity') or 'warning'))
+
+
+class ConfigFile:
+    """Lista validada de un YAML, recargada solo cuando cambia el fichero."""
+
+    def __init__(self, path, key: str, parse_item, check_interval: float = CHECK_INTERVAL):
+        self.path = Path(path)
+        self.key = key
+        self.parse_item = parse_item
+        self.check_interval = check_interval
+        self._items = ()
+        self._sig = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def _signature(self):
+        try:
+            st = self.path.stat()
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def _parse(self) -> tuple:
+        items = []
+        seen = set()
+        for raw in _load_items(self.path, self.key):
+            item = self.parse_item(raw)
+            if item is None:
+                continue
+            if item.nombre in seen:
+                log.warning('%s: duplicate nombre %r, keeping the first', self.path.name, item.nombre)
+                continue
+            seen.add(item.nombre)
+            items.append(item)
+        return tuple(items)
+
+    def reload(self, force: bool = False):
+        """Relee si el fichero cambió. Devuelve `(antes, después)` o None."""
+        with self._lock:
+            self._checked = time.monotonic()
+            sig = self._signature()
+            if sig == self._sig and not force:
+                return None
+            old = self._items
+            if sig is None:
+                new = ()
+            else:
+                try:
+                    new = self._parse()
+                except Exception as e:
+                    # keep serving the last good version while the file is being edited
+                    log.warning('%s: reload failed: %s', self.path.name, e)
+                    return None
+            self._sig = sig
+            self._items = new
+        return (old, new) if old != new else None
+
+    def due(self) -> bool:
+        return time.monotonic() - self._checked >= self.check_interval
+
+    @property
+    def items(self) -> tuple:
+        return self._items
+
+
+class Config:
+    """Redes, monitores y reglas de alerta compartidos por `app.py` y `monitor_api.py`."""
+
+    def __init__(self, directory=CONFIG_DIR, check_interval: float = CHECK_INTERVAL):
+        directory = Path(directory)
+        self.files = {
+            'networks': ConfigFile(directory / 'redes.yaml', 'redes', parse_network, check_interval),
+            'monitors': ConfigFile(directory / 'monitores.yaml', 'monitores', parse_monitor,
+                                   check_interval),
+            'alerts': ConfigFile(directory / 'alertas.yaml', 'alertas', parse_alert, check_interval),
+        }
+        self.check_interval = check_interval
+        self._listeners = []
+        self._thread = None
+        self._stop = threading.Event()
+        for f in self.files.values():
+            f.reload(force=True)
+
+    def networks(self) -> tuple:
+        return self._get('networks')
+
+    def monitors(self) -> tuple:
+        return self._get('monitors')
+
+    def alerts(self) -> tuple:
+        return self._get('alerts')
+
+    def network_for(self, ip):
+        """Primera red configurada que contiene `ip` (o None)."""
+        try:
+            addr = ipaddress.ip_address(ip)
+        except ValueError:
+            return None
+        for net in self.networks():
+            if addr.version == net.network.version and addr in net.network:
+                return net
+        return None
+
+    def _get(self, kind: str) -> tuple:
+        f = self.files[kind]
+        if f.due():
+            self._check(kind)
+        return f.items
+
+    def _check(self, kind: str):
+        change = self.files[kind].reload()
+        if change is None:
+            return
+        log.info('config: %s reloaded (%d entries)', kind, len(change[1]))
+        for callback in list(self._listeners):
+            try:
+                callback(kind, change[0], change[1])
+            except Exception:
+                log.exception('config listener failed')
+
+    def on_change(self, callback):
+        """`callback(kind, antes, después)` con kind 'networks', 'monitors' o 'alerts'."""
+        self._listeners.append(callback)
+        return callback
+
+    def watch(self):
+        """Comprueba los ficheros en segundo plano cada `check_interval` s."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='config-watch', daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.check_interval):
+            for kind in self.files:
+                self._check(kind)
+
+    def stop(self):
+        self._stop.set()
+
+
+_CONFIG = None
+_CONFIG_LOCK = threading.Lock()
+
+
+def get_config() -> Config:
+    global _CONFIG
+    with _CONFIG_LOCK:
+        if _CONFIG is None:
+            _CONFIG = Config()
+        return _CONFIG
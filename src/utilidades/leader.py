@@ -0,0 +1,255 @@
+"""Elección de líder entre procesos del servidor.
+
+Con varios workers (`uvicorn --workers N`, gunicorn) solo uno debe correr
+los trabajos de fondo (escáner, planificador de sondas, monitores,
+colector): si no, cada worker multiplica las sondas y las escrituras.
+`Elector` intenta adquirir un candado; mientras lo tiene mantiene los
+trabajos arrancados (`on_elected`) y los demás procesos reintentan cada
+`retry` segundos y toman el relevo si el líder muere (`on_demoted` se
+llama si un líder pierde el candado).
+
+- `FileLock`: `flock` sobre un fichero local; el kernel lo suelta cuando
+  el proceso muere. Para workers de una misma máquina (por defecto).
+- `MongoLease`: documento `{_id, owner, expires}` que el líder renueva
+  cada `ttl / 3` segundos. Para réplicas en varias máquinas.
+
+`SharedFile` es el canal de estado compartido sin base de datos: el líder
+publica un JSON (escritura atómica) y los seguidores lo releen solo
+cuando cambia su `mtime`.
+"""
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+try:
+    from pymongo import ReturnDocument
+    from pymongo.errors import DuplicateKeyError
+except Exception:
+    ReturnDocument = None
+    DuplicateKeyError = None
+
+log = logging.getLogger(__name__)
+
+RUN_DIR = Path(os.getenv('LEADER_DIR', Path(__file__).resolve().parents[2] / 'data'))
+RETRY_INTERVAL = 5.0
+LEASE_TTL = 15.0
+
+
+def identity() -> str:
+    # computed on demand: forked workers get their own pid
+    return '%s:%d' % (socket.gethostname(), os.getpid())
+
+
+class FileLock:
+    """Candado exclusivo no bloqueante sobre `RUN_DIR/<name>.lock`."""
+
+    renew_interval = RETRY_INTERVAL
+
+    def __init__(self, name: str, directory=None):
+        self.path = Path(directory or RUN_DIR) / ('%s.lock' % name)
+        self._fd = None
+
+    def acquire(self) -> bool:
+        if self._fd is not None:
+            return True
+        if fcntl is None:
+            # no flock: single-process deployments only
+            self._fd = -1
+            return True
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(str(self.path), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, identity().encode())
+        self._fd = fd
+        return True
+
+    def renew(self) -> bool:
+        return self._fd is not None
+
+    def release(self):
+        fd, self._fd = self._fd, None
+        if fd is not None and fd >= 0:
+            os.close(fd)
+
+    def holder(self):
+        try:
+            return self.path.read_text().strip() or None
+        except OSError:
+            return None
+
+
+class MongoLease:
+    """Lease con caducidad en una colección de MongoDB."""
+
+    def __init__(self, col, name: str, ttl: float = LEASE_TTL):
+        self.col = col
+        self.name = name
+        self.ttl = ttl
+        self.renew_interval = ttl / 3.0
+
+    def acquire(self) -> bool:
+        me = identity()
+        now = time.time()
+        try:
+            doc = self.col.find_one_and_update(
+                {'_id': self.name, '$or': [{'owner': me}, {'expires': {'$lt': now}}]},
+                {'$set': {'owner': me, 'expires': now + self.ttl}},
+                upsert=True, return_document=ReturnDocument.AFTER)
+        except Exception as e:
+            # the upsert collides with the live holder's document
+            if DuplicateKeyError is not None and isinstance(e, DuplicateKeyError):
+                return False
+            raise
+        return doc is not None and doc.get('owner') == me
+
+    renew = acquire
+
+    def release(self):
+        try:
+            self.col.delete_one({'_id': self.name, 'owner': identity()})
+        except Exception as e:
+            log.warning('lease release failed: %s', e)
+
+    def holder(self):
+        doc = self.col.find_one({'_id': self.name})
+        if doc and doc.get('expires', 0) >= time.time():
+            return doc.get('owner')
+        return None
+
+
+class Elector:
+    """Mantiene `on_elected()` / `on_demoted()` en sintonía con el candado."""
+
+    def __init__(self, lock, on_elected, on_demoted=None, retry: float = RETRY_INTERVAL):
+        self.lock = lock
+        self.on_elected = on_elected
+        self.on_demoted = on_demoted
+        self.retry = retry
+        self.since = None
+        self._leader = False
+        self._thread = None
+        self._stop = threading.Event()
+
+    @property
+    def is_leader(self) -> bool:
+        return self._leader
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='leader-elector', daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        wait = 0.0
+        while not self._stop.wait(wait):
+            try:
+                if self._leader:
+                    if not self.lock.renew():
+                        log.warning('leadership lost')
+                        self._demote()
+                elif self.lock.acquire():
+                    self._elect()
+            except Exception as e:
+                log.warning('leader election failed: %s', e)
+                if self._leader:
+                    self._demote()
+            wait = self.lock.renew_interval if self._leader else self.retry
+
+    def _elect(self):
+        self._leader = True
+        self.since = time.time()
+        log.info('elected leader (%s)', identity())
+        try:
+            self.on_elected()
+        except Exception:
+            # e.g. the database is down: step aside and retry on the next round
+            log.exception('leader startup failed')
+            self._demote()
+            self.lock.release()
+
+    def _demote(self):
+        self._leader = False
+        self.since = None
+        if self.on_demoted is not None:
+            try:
+                self.on_demoted()
+            except Exception:
+                log.exception('leader shutdown failed')
+
+    def stop(self):
+        """Detiene la elección; si este proceso era líder, para sus trabajos
+        y suelta el candado para que otro lo tome sin esperar."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        if self._leader:
+            self._demote()
+            self.lock.release()
+
+    def status(self) -> dict:
+        try:
+            holder = self.lock.holder()
+        except Exception:
+            holder = None
+        return {'leader': self._leader, 'identity': identity(), 'holder': holder,
+                'since': self.since}
+
+
+class SharedFile:
+    """JSON compartido entre procesos de la misma máquina."""
+
+    def __init__(self, name: str, directory=None):
+        self.path = Path(directory or RUN_DIR) / ('%s.json' % name)
+        self._sig = None
+        self._data = None
+        self._lock = threading.Lock()
+
+    def publish(self, data):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name('.%s.%d.tmp' % (self.path.name, os.getpid()))
+        tmp.write_text(json.dumps(data, ensure_ascii=False, default=str), encoding='utf-8')
+        os.replace(str(tmp), str(self.path))
+
+    def touch(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.touch()
+        os.utime(str(self.path))
+
+    def mtime(self) -> float:
+        try:
+            return self.path.stat().st_mtime
+        except OSError:
+            return 0.0
+
+    def read(self, default=None):
+        """Último contenido publicado (releído solo si cambió el fichero)."""
+        try:
+            st = self.path.stat()
+        except OSError:
+            return default
+        sig = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            if sig != self._sig:
+                try:
+                    self._data = json.loads(self.path.read_text(encoding='utf-8') or 'null')
+                except (OSError, ValueError):
+                    return self._data if self._data is not None else default
+                self._sig = sig
+            return self._data if self._data is not None else default
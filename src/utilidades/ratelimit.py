@@ -0,0 +1,85 @@
+"""Limitador de tasa tipo token bucket (thread-safe; `SharedTokenBucket`
+también entre procesos)."""
+import multiprocessing
+import threading
+import time
+
+
+class TokenBucket:
+    """`rate` tokens por segundo con ráfaga máxima `burst`."""
+
+    def __init__(self, rate: float, burst: float = None):
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(1.0, rate))
+        self._tokens = self.burst
+        self._ts = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._ts) * self.rate)
+        self._ts = now
+
+    def take_up_to(self, n: int) -> int:
+        """Toma hasta `n` tokens sin bloquear; devuelve cuántos obtuvo."""
+        with self._lock:
+            self._refill(time.monotonic())
+            got = int(min(n, self._tokens))
+            self._tokens -= got
+            return got
+
+    def refund(self, n: int):
+        """Devuelve tokens tomados y no usados."""
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + n)
+
+    def try_take(self, n: int = 1) -> bool:
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= n:
+                self._tokens -= n
+                return True
+            return False
+
+    def acquire(self, n: int = 1, timeout: float = None) -> bool:
+        """Bloquea hasta obtener `n` tokens (o hasta `timeout`)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= n:
+                    self._tokens -= n
+                    return True
+                wait = (n - self._tokens) / self.rate
+            if deadline is not None:
+                if now + wait > deadline:
+                    return False
+            time.sleep(wait)
+
+
+class SharedTokenBucket(TokenBucket):
+    """`TokenBucket` en memoria compartida: un único presupuesto para varios
+    procesos. Debe crearse antes de lanzarlos y pasarse como argumento."""
+
+    def __init__(self, rate: float, burst: float = None, ctx=None):
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(1.0, rate))
+        # CLOCK_MONOTONIC is system-wide, so every process refills on the same clock
+        self._state = (ctx or multiprocessing).Array('d', [self.burst, time.monotonic()])
+        self._lock = self._state.get_lock()
+
+    @property
+    def _tokens(self):
+        return self._state[0]
+
+    @_tokens.setter
+    def _tokens(self, value):
+        self._state[0] = value
+
+    @property
+    def _ts(self):
+        return self._state[1]
+
+    @_ts.setter
+    def _ts(self, value):
+        self._state[1] = value
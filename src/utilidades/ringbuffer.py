@@ -0,0 +1,185 @@
+"""Buffer circular en memoria para las métricas recientes.
+
+Cada métrica guarda sus últimas `capacity` muestras en dos `array('d')`
+(timestamps y valores, 16 bytes por muestra, memoria fija). "Últimas N",
+"desde ts" y los agregados (min/max/media/percentiles) se resuelven sobre
+cortes de los arrays sin tocar la base de datos; si NumPy está instalado
+los percentiles se calculan con él. MongoDB queda para el histórico largo.
+"""
+import os
+import threading
+from array import array
+from bisect import bisect_left
+
+try:
+    import numpy as np
+except Exception:
+    np = None
+
+# 12 h at the collector's 5 s interval
+RING_SIZE = int(os.getenv('METRICS_RING_SIZE', '8640'))
+PERCENTILES = (50, 95, 99)
+
+
+def _percentile(sorted_values, q: float) -> float:
+    # linear interpolation between closest ranks (same as numpy's default)
+    pos = (len(sorted_values) - 1) * q / 100.0
+    lo = int(pos)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (pos - lo)
+
+
+class _Window:
+    """Vista cronológica de un `Ring` (índices lógicos 0..size-1) para bisect."""
+
+    def __init__(self, ring):
+        self.ring = ring
+
+    def __len__(self):
+        return self.ring.size
+
+    def __getitem__(self, i):
+        r = self.ring
+        return r.ts[(r.head - r.size + i) % r.capacity]
+
+
+class Ring:
+    """Últimas `capacity` muestras (ts, valor) de una métrica."""
+
+    def __init__(self, capacity: int = RING_SIZE):
+        self.capacity = max(1, int(capacity))
+        self.ts = array('d', bytes(8 * self.capacity))
+        self.values = array('d', bytes(8 * self.capacity))
+        self.head = 0
+        self.size = 0
+
+    def append(self, ts: float, value: float):
+        self.ts[self.head] = ts
+        self.values[self.head] = value
+        self.head = (self.head + 1) % self.capacity
+        if self.size < self.capacity:
+            self.size += 1
+
+    def _slice(self, buf, start: int):
+        # chronological copy of logical positions start..size-1
+        n = self.size - start
+        if n <= 0:
+            return array('d')
+        first = (self.head - self.size + start) % self.capacity
+        end = first + n
+        if end <= self.capacity:
+            return buf[first:end]
+        return buf[first:] + buf[:end - self.capacity]
+
+    def _start_for(self, since: float = None, n: int = None) -> int:
+        start = 0
+        if since is not None:
+            start = bisect_left(_Window(self), since)
+        if n is not None:
+            start = max(start, self.size - max(0, int(n)))
+        return start
+
+    def window(self, since: float = None, n: int = None):
+        """(timestamps, valores) desde `since` y/o las últimas `n`, en orden."""
+        start = self._start_for(since, n)
+        return self._slice(self.ts, start), self._slice(self.values, start)
+
+    def oldest(self):
+        return _Window(self)[0] if self.size else None
+
+    def summary(self, since: float = None, n: int = None, percentiles=PERCENTILES) -> dict:
+        _ts, values = self.window(since, n)
+        out = {'count': len(values)}
+        if not values:
+            out.update({'min': None, 'max': None, 'mean': None})
+            out.update({'p%d' % q: None for q in percentiles})
+            return out
+        out.update({'min': min(values), 'max': max(values), 'mean': sum(values) / len(values)})
+        if np is not None:
+            arr = np.frombuffer(values, dtype=np.float64)
+            for q, v in zip(percentiles, np.percentile(arr, percentiles)):
+                out['p%d' % q] = float(v)
+        else:
+            ordered = sorted(values)
+            for q in percentiles:
+                out['p%d' % q] = _percentile(ordered, q)
+        return out
+
+
+class MetricBuffer:
+    """Un `Ring` por métrica; seguro entre hilos."""
+
+    def __init__(self, capacity: int = RING_SIZE):
+        self.capacity = capacity
+        self._rings = {}
+        self._lock = threading.Lock()
+
+    def add(self, metric: str, ts: float, value: float):
+        with self._lock:
+            ring = self._rings.get(metric)
+            if ring is None:
+                ring = self._rings[metric] = Ring(self.capacity)
+            ring.append(ts, value)
+
+    def metrics(self) -> list:
+        with self._lock:
+            return sorted(self._rings)
+
+    def covers(self, metric: str, since: float) -> bool:
+        """True si el buffer tiene muestras desde `since` (o desde antes)."""
+        with self._lock:
+            ring = self._rings.get(metric)
+            if ring is None or not ring.size:
+                return False
+            return ring.oldest() <= since
+
+    def last(self, metric: str, n: int = None, since: float = None) -> list:
+        """Muestras `{ts, metric, value}` en orden cronológico."""
+        with self._lock:
+            ring = self._rings.get(metric)
+            if ring is None:
+                return []
+            ts, values = ring.window(since, n)
+        # samples are recorded on whole seconds (see `record_metric`)
+        return [{'ts': int(t), 'metric': metric, 'value': v} for t, v in zip(ts, values)]
+
+    def latest(self, limit: int = 100) -> list:
+        """Últimas `limit` muestras de todas las métricas, de la más reciente a la más antigua."""
+        rows = []
+        for metric in self.metrics():
+            rows.extend(self.last(metric, n=limit))
+        rows.sort(key=lambda r: r['ts'], reverse=True)
+        return rows[:limit]
+
+    def summary(self, metric: str, since: float = None, n: int = None) -> dict:
+        with self._lock:
+            ring = self._rings.get(metric)
+            if ring is None:
+                ring = Ring(1)
+            out = ring.summary(since, n)
+        out['metric'] = metric
+        return out
+
+    def series(self, metric: str, start: float, end: float, step: int) -> dict:
+        """Serie min/max/avg/count con la misma forma que `MetricRollups.query`."""
+        step = max(int(step or 1), 1)
+        with self._lock:
+            ring = self._rings.get(metric)
+            ts, values = ring.window(since=start) if ring is not None else ((), ())
+        points = []
+        cur = None
+        for t, v in zip(ts, values):
+            if t >= end:
+                break
+            bucket = int(t) - int(t) % step
+            if cur is None or cur['ts'] != bucket:
+                cur = {'ts': bucket, 'count': 0, 'sum': 0.0, 'min': v, 'max': v}
+                points.append(cur)
+            cur['count'] += 1
+            cur['sum'] += v
+            cur['min'] = min(cur['min'], v)
+            cur['max'] = max(cur['max'], v)
+        for p in points:
+            p['avg'] = p.pop('sum') / p['count']
+        return {'metric': metric, 'from': int(start), 'to': int(end), 'step': step,
+                'resolution': 'memory', 'points': points}
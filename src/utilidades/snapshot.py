@@ -0,0 +1,156 @@
+"""Instantáneas versionadas de respuestas JSON muy consultadas.
+
+Los productores llaman a `mark(clave)` cuando algo cambia; cada marca
+incrementa la versión. La instantánea solo se reconstruye (con la función
+`build`, p. ej. una única consulta agregada) cuando hay cambios pendientes
+y como mucho cada `min_interval` segundos, y se serializa una vez: el
+cuerpo JSON, su ETag fuerte y las variantes gzip/brotli se reutilizan en
+todas las peticiones hasta el siguiente cambio. `changes_since(v)` devuelve
+las claves modificadas desde la versión `v` para respuestas delta.
+"""
+import gzip
+import hashlib
+import json
+import threading
+import time
+
+try:
+    import brotli
+except Exception:
+    brotli = None
+
+MIN_INTERVAL = 1.0
+MAX_CHANGES = 100000
+
+
+def accepted_encodings(accept_encoding: str = None) -> set:
+    """Codificaciones de `Accept-Encoding` (sin las de peso q=0)."""
+    accepted = set()
+    for part in (accept_encoding or '').split(','):
+        token, _, params = part.strip().partition(';')
+        if params.replace(' ', '') in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            continue
+        accepted.add(token.strip().lower())
+    return accepted
+
+
+def pick_encoding(accept_encoding: str = None) -> str:
+    """'br', 'gzip' o 'identity' según `Accept-Encoding` (sin pesos q=0)."""
+    accepted = accepted_encodings(accept_encoding)
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted or '*' in accepted:
+        return 'gzip'
+    return 'identity'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    tags = [t.strip() for t in if_none_match.split(',')]
+    return etag in tags or 'W/' + etag in tags
+
+
+class Snapshot:
+    """Resultado inmutable de un `build`: cuerpo serializado + índice por clave."""
+
+    def __init__(self, version: int, payload: dict, index: dict):
+        self.version = version
+        self.index = index
+        self.body = json.dumps(dict(payload, version=version), ensure_ascii=False,
+                               separators=(',', ':'), default=str).encode('utf-8')
+        self.digest = hashlib.blake2b(self.body, digest_size=12).hexdigest()
+        self._encoded = {'identity': self.body}
+        self._lock = threading.Lock()
+
+    def etag(self, encoding: str = 'identity') -> str:
+        # strong validators must differ per content-coding
+        suffix = '' if encoding == 'identity' else '-' + encoding
+        return '"%s%s"' % (self.digest, suffix)
+
+    def encoded(self, encoding: str) -> bytes:
+        with self._lock:
+            data = self._encoded.get(encoding)
+            if data is None:
+                if encoding == 'br':
+                    data = brotli.compress(self.body, quality=5)
+                elif encoding == 'gzip':
+                    data = gzip.compress(self.body, compresslevel=6)
+                else:
+                    raise ValueError(encoding)
+                self._encoded[encoding] = data
+            return data
+
+
+class VersionedSnapshot:
+    """Mantiene la instantánea de `build() -> (payload, index)` y el registro de cambios."""
+
+    def __init__(self, build, min_interval: float = MIN_INTERVAL, max_changes: int = MAX_CHANGES):
+        self.build = build
+        self.min_interval = min_interval
+        self.max_changes = max_changes
+        self.version = 0
+        self._changes = {}
+        self._floor = 0
+        self._snap = None
+        self._built_at = 0.0
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+
+    def mark(self, key):
+        """Registra que `key` cambió (seguro desde cualquier hilo)."""
+        with self._lock:
+            self.version += 1
+            # re-insert so the dict stays ordered by version
+            self._changes.pop(key, None)
+            self._changes[key] = self.version
+            while len(self._changes) > self.max_changes:
+                oldest = next(iter(self._changes))
+                self._floor = self._changes.pop(oldest)
+
+    def invalidate(self):
+        """Cambio global (p. ej. otras redes): fuerza respuesta completa a los deltas."""
+        with self._lock:
+            self.version += 1
+            self._changes.clear()
+            self._floor = self.version
+
+    def cached(self):
+        """La instantánea actual si no hace falta reconstruirla; si no, None."""
+        snap = self._snap
+        if snap is not None and (snap.version == self.version
+                                 or time.monotonic() - self._built_at < self.min_interval):
+            return snap
+        return None
+
+    def current(self) -> Snapshot:
+        snap = self.cached()
+        if snap is not None:
+            return snap
+        with self._build_lock:
+            snap = self._snap
+            if snap is not None and snap.version == self.version:
+                return snap
+            # read the version first: anything marked later triggers the next rebuild
+            version = self.version
+            payload, index = self.build()
+            self._snap = snap = Snapshot(version, payload, index)
+            self._built_at = time.monotonic()
+            return snap
+
+    def changes_since(self, since: int):
+        """Claves cambiadas después de la versión `since`, o None si ya no es
+        reconstruible (demasiado antigua o de otro proceso): enviar todo.
+        Puede incluir claves cambiadas después de la instantánea actual; se
+        envían con su estado en ella y vuelven a salir en el siguiente delta."""
+        with self._lock:
+            if since < self._floor or since > self.version:
+                return None
+            keys = []
+            for key in reversed(self._changes):
+                if self._changes[key] <= since:
+                    break
+                keys.append(key)
+            return keys
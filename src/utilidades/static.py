@@ -0,0 +1,184 @@
+"""Ficheros estáticos de la UI preparados una sola vez.
+
+`StaticAssets` recorre el directorio al arrancar y, por cada fichero,
+calcula un ETag fuerte (hash del contenido) y las variantes gzip/brotli de
+los tipos comprimibles con el nivel máximo (se hace una vez, no por
+petición). Los ficheros de hasta `STATIC_MEMORY_LIMIT` bytes se sirven
+desde memoria; los mayores se envían desde disco con `sendfile`.
+
+`respond()` es independiente del servidor: devuelve estado, cabeceras y
+cuerpo (o la ruta a enviar), y lo usan `ui/run_ui.py`, Flask (`app.py`) y
+FastAPI (`monitor_api.py`). Con `If-None-Match` coincidente responde 304
+sin cuerpo; `Cache-Control` es `no-cache` (siempre revalidar, barato con
+304) salvo que `STATIC_MAX_AGE` permita cachear JS/CSS/imágenes.
+
+En desarrollo los cambios en disco se detectan como mucho cada
+`STATIC_CHECK_INTERVAL` segundos (0 desactiva la comprobación).
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import threading
+import time
+from email.utils import formatdate
+from pathlib import Path
+from typing import NamedTuple
+
+from utilidades.snapshot import accepted_encodings, etag_matches
+
+try:
+    import brotli
+except Exception:
+    brotli = None
+
+MEMORY_LIMIT = int(os.getenv('STATIC_MEMORY_LIMIT', str(256 * 1024)))
+MAX_AGE = int(os.getenv('STATIC_MAX_AGE', '0'))
+CHECK_INTERVAL = float(os.getenv('STATIC_CHECK_INTERVAL', '2'))
+# below this a compressed variant rarely pays for the extra header
+MIN_COMPRESS = 256
+COMPRESSIBLE = ('text/', 'application/javascript', 'application/json', 'image/svg+xml',
+                'application/xml', 'application/wasm')
+
+
+class StaticResponse(NamedTuple):
+    status: int
+    headers: list
+    body: bytes = None      # None: send `path` (sendfile)
+    path: Path = None
+
+
+class Asset:
+    __slots__ = ('path', 'size', 'mtime', 'content_type', 'digest', 'cache_control',
+                 'modified', 'variants')
+
+    def __init__(self, path: Path, memory_limit: int, max_age: int):
+        st = path.stat()
+        data = path.read_bytes()
+        self.path = path
+        self.size = len(data)
+        self.mtime = st.st_mtime_ns
+        ctype = mimetypes.guess_type(path.name)[0] or 'application/octet-stream'
+        if ctype.startswith('text/') or ctype in ('application/javascript', 'application/json'):
+            ctype += '; charset=utf-8'
+        self.content_type = ctype
+        self.digest = hashlib.blake2b(data, digest_size=12).hexdigest()
+        self.modified = formatdate(st.st_mtime, usegmt=True)
+        if ctype.startswith('text/html') or not max_age:
+            self.cache_control = 'no-cache'
+        else:
+            self.cache_control = 'public, max-age=%d' % max_age
+        # identity body kept in memory only when small; None means sendfile
+        self.variants = {'identity': data if self.size <= memory_limit else None}
+        if self.size >= MIN_COMPRESS and ctype.startswith(COMPRESSIBLE):
+            encoded = {'gzip': gzip.compress(data, compresslevel=9, mtime=0)}
+            if brotli is not None:
+                encoded['br'] = brotli.compress(data, quality=11)
+            for enc, body in encoded.items():
+                if len(body) < self.size and len(body) <= memory_limit:
+                    self.variants[enc] = body
+
+    def etag(self, encoding: str = 'identity') -> str:
+        # strong validators must differ per content-coding
+        suffix = '' if encoding == 'identity' else '-' + encoding
+        return '"%s%s"' % (self.digest, suffix)
+
+    def pick(self, accept_encoding: str = None) -> str:
+        if len(self.variants) == 1:
+            return 'identity'
+        accepted = accepted_encodings(accept_encoding)
+        for enc in ('br', 'gzip'):
+            if enc in self.variants and (enc in accepted or '*' in accepted):
+                return enc
+        return 'identity'
+
+
+class StaticAssets:
+    """Índice `nombre relativo -> Asset` de un directorio."""
+
+    def __init__(self, root, memory_limit: int = MEMORY_LIMIT, max_age: int = MAX_AGE,
+                 check_interval: float = CHECK_INTERVAL):
+        self.root = Path(root).resolve()
+        self.memory_limit = memory_limit
+        self.max_age = max_age
+        self.check_interval = check_interval
+        self._assets = {}
+        self._checked = time.monotonic()
+        self._lock = threading.Lock()
+        self.load()
+
+    def _scan(self) -> dict:
+        found = {}
+        if not self.root.is_dir():
+            return found
+        for dirpath, _dirs, files in os.walk(self.root):
+            for fname in files:
+                if fname.startswith('.'):
+                    continue
+                path = Path(dirpath) / fname
+                try:
+                    found[path.relative_to(self.root).as_posix()] = path.stat().st_mtime_ns
+                except OSError:
+                    continue
+        return found
+
+    def load(self):
+        """Relee el directorio; solo recalcula los ficheros cambiados."""
+        old = self._assets
+        assets = {}
+        for name, mtime in self._scan().items():
+            asset = old.get(name)
+            if asset is None or asset.mtime != mtime:
+                try:
+                    asset = Asset(self.root / name, self.memory_limit, self.max_age)
+                except OSError:
+                    continue
+            assets[name] = asset
+        self._assets = assets
+
+    def _maybe_reload(self):
+        if not self.check_interval:
+            return
+        now = time.monotonic()
+        if now - self._checked < self.check_interval:
+            return
+        with self._lock:
+            if now - self._checked < self.check_interval:
+                return
+            self._checked = now
+            self.load()
+
+    def get(self, name: str):
+        """Asset de la ruta `name` (relativa a la raíz; '' o '/' → index.html)."""
+        self._maybe_reload()
+        # plain dict lookup: '..' or absolute paths simply do not match
+        name = name.lstrip('/')
+        if not name or name.endswith('/'):
+            name += 'index.html'
+        assets = self._assets
+        return assets.get(name) or assets.get(name + '/index.html')
+
+    def names(self) -> list:
+        return sorted(self._assets)
+
+    def respond(self, name: str, accept_encoding: str = None,
+                if_none_match: str = None):
+        """StaticResponse para `name`, o None si no existe."""
+        asset = self.get(name)
+        if asset is None:
+            return None
+        enc = asset.pick(accept_encoding)
+        headers = [('ETag', asset.etag(enc)), ('Cache-Control', asset.cache_control),
+                   ('Last-Modified', asset.modified)]
+        if len(asset.variants) > 1:
+            headers.append(('Vary', 'Accept-Encoding'))
+        if etag_matches(if_none_match, asset.etag(enc)):
+            return StaticResponse(304, headers, b'')
+        body = asset.variants[enc]
+        headers.append(('Content-Type', asset.content_type))
+        headers.append(('Content-Length', str(asset.size if body is None else len(body))))
+        if enc != 'identity':
+            headers.append(('Content-Encoding', enc))
+        if body is None:
+            return StaticResponse(200, headers, None, asset.path)
+        return StaticResponse(200, headers, body)
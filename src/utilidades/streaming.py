@@ -0,0 +1,108 @@
+"""Difusión de eventos de escaneo y codificación NDJSON / Server-Sent Events.
+
+`EventFeed` reparte los eventos que produce un escaneo en segundo plano a
+todos los clientes conectados a un endpoint de streaming; cada cliente
+tiene su propia cola y recibe un latido si no hay actividad.
+"""
+import json
+import queue
+import threading
+
+NDJSON_MEDIA_TYPE = 'application/x-ndjson'
+SSE_MEDIA_TYPE = 'text/event-stream'
+HEARTBEAT = {'type': 'ping'}
+
+
+def encode(obj: dict, fmt: str = 'ndjson') -> str:
+    data = json.dumps(obj, ensure_ascii=False, default=str)
+    if fmt == 'sse':
+        return 'event: %s\ndata: %s\n\n' % (obj.get('type', 'message'), data)
+    return data + '\n'
+
+
+def media_type(fmt: str) -> str:
+    return SSE_MEDIA_TYPE if fmt == 'sse' else NDJSON_MEDIA_TYPE
+
+
+class EventFeed:
+    """Pub/sub en memoria: `publish` desde el hilo del escáner, `listen` desde
+    cada respuesta en streaming."""
+
+    def __init__(self, maxsize: int = 10000):
+        self.maxsize = maxsize
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    def publish(self, event: dict):
+        with self._lock:
+            listeners = list(self._listeners)
+        for q in listeners:
+            try:
+                q.put_nowait(event)
+            except queue.Full:
+                # a stuck client must not stall the scanner
+                pass
+
+    def listen(self, until=('done',), heartbeat: float = 15.0):
+        """Se suscribe ya (antes de devolver, para no perder eventos) y devuelve
+        una `Subscription` que itera eventos hasta recibir uno cuyo `type`
+        esté en `until`."""
+        return Subscription(self, until, heartbeat)
+
+    def _subscribe(self, q):
+        with self._lock:
+            self._listeners.append(q)
+
+    def _unsubscribe(self, q):
+        with self._lock:
+            if q in self._listeners:
+                self._listeners.remove(q)
+
+
+class Subscription:
+    """Cola de un oyente de `EventFeed`. Se da de baja al terminar la
+    iteración, con `close()` / `with`, o al recolectarse: un cliente que se
+    desconecta antes de que empiece el cuerpo no deja su cola enganchada."""
+
+    def __init__(self, feed: EventFeed, until=('done',), heartbeat: float = 15.0):
+        self.feed = feed
+        self.until = until
+        self.heartbeat = heartbeat
+        self.closed = False
+        self._queue = queue.Queue(feed.maxsize)
+        feed._subscribe(self._queue)
+
+    def __iter__(self):
+        try:
+            while not self.closed:
+                try:
+                    event = self._queue.get(timeout=self.heartbeat)
+                except queue.Empty:
+                    yield HEARTBEAT
+                    continue
+                yield event
+                if event.get('type') in self.until:
+                    return
+        finally:
+            self.close()
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.feed._unsubscribe(self._queue)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __del__(self):
+        self.close()
+
+
+def pick_format(fmt, accept) -> str:
+    """Elige 'sse' o 'ndjson' a partir de `?format=` o la cabecera Accept."""
+    if fmt in ('sse', 'ndjson'):
+        return fmt
+    return 'sse' if SSE_MEDIA_TYPE in (accept or '') else 'ndjson'
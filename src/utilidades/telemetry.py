@@ -0,0 +1,314 @@
+"""Métricas internas en formato Prometheus y perfilador por muestreo.
+
+Contadores e histogramas viven en memoria del proceso: observar un valor
+es un incremento bajo un lock por serie (sin E/S ni formateo); el texto de
+exposición solo se genera cuando alguien consulta `/metrics`.
+
+    SCANS = histogram('scan_network_seconds', 'Duración de cada red escaneada', ['network'])
+    with SCANS.labels('lan').time():
+        ...
+
+`SamplingProfiler` muestrea las pilas de todos los hilos
+(`sys._current_frames`) a intervalos fijos y devuelve pilas "folded"
+(formato de flamegraph.pl / speedscope). Solo cuesta algo mientras está
+activo; se enciende en caliente desde `/debug/profile`.
+"""
+import bisect
+import collections
+import math
+import sys
+import threading
+import time
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+PREFIX = 'mimonitor_'
+MAX_PROFILE_SECONDS = 60.0
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=()) -> str:
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (k, _escape(v)) for k, v in pairs)
+
+
+def _num(v) -> str:
+    if v == math.inf:
+        return '+Inf'
+    if isinstance(v, float) and v.is_integer():
+        return str(int(v))
+    return repr(v)
+
+
+class _Timer:
+    __slots__ = ('child', 't0')
+
+    def __init__(self, child):
+        self.child = child
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.child.observe(time.perf_counter() - self.t0)
+        return False
+
+
+class _CounterChild:
+    __slots__ = ('value', 'lock')
+
+    def __init__(self):
+        self.value = 0.0
+        self.lock = threading.Lock()
+
+    def inc(self, n: float = 1.0):
+        with self.lock:
+            self.value += n
+
+
+class _HistogramChild:
+    __slots__ = ('bounds', 'counts', 'sum', 'lock')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value: float):
+        i = bisect.bisect_left(self.bounds, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    def time(self) -> _Timer:
+        return _Timer(self)
+
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, doc: str, labelnames=()):
+        self.name = PREFIX + name
+        self.doc = doc
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._default = self.labels()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        values = tuple(str(v) for v in values)
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError('%s expects labels %s' % (self.name, self.labelnames))
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _header(self):
+        return ['# HELP %s %s' % (self.name, self.doc.replace('\n', ' ')),
+                '# TYPE %s %s' % (self.name, self.kind)]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, n: float = 1.0):
+        self._default.inc(n)
+
+    def render(self) -> list:
+        lines = self._header()
+        for values, child in list(self._children.items()):
+            lines.append('%s_total%s %s' % (self.name, _labels(self.labelnames, values),
+                                            _num(child.value)))
+        return lines
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, doc, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.bounds = tuple(sorted(buckets))
+        super().__init__(name, doc, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.bounds)
+
+    def observe(self, value: float):
+        self._default.observe(value)
+
+    def time(self) -> _Timer:
+        return _Timer(self._default)
+
+    def render(self) -> list:
+        lines = self._header()
+        for values, child in list(self._children.items()):
+            with child.lock:
+                counts = list(child.counts)
+                total = child.sum
+            cumulative = 0
+            for bound, count in zip(self.bounds + (math.inf,), counts):
+                cumulative += count
+                lines.append('%s_bucket%s %d' % (
+                    self.name, _labels(self.labelnames, values, [('le', _num(float(bound)))]),
+                    cumulative))
+            lab = _labels(self.labelnames, values)
+            lines.append('%s_sum%s %s' % (self.name, lab, _num(total)))
+            lines.append('%s_count%s %d' % (self.name, lab, cumulative))
+        return lines
+
+
+class GaugeFunc(_Metric):
+    """Gauge leído en el momento del scrape: `fn()` devuelve un número o
+    un dict {valores_de_etiquetas (tupla): número}."""
+    kind = 'gauge'
+
+    def __init__(self, name, doc, fn, labelnames=()):
+        self.fn = fn
+        super().__init__(name, doc, labelnames)
+
+    def _new_child(self):
+        return None
+
+    def render(self) -> list:
+        try:
+            value = self.fn()
+        except Exception:
+            return []
+        lines = self._header()
+        items = value.items() if isinstance(value, dict) else [((), value)]
+        for values, v in items:
+            if v is None:
+                continue
+            lines.append('%s%s %s' % (self.name, _labels(self.labelnames, values), _num(float(v))))
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            # modules may be imported twice (e.g. `app` and `src.app`): reuse the first
+            return self._metrics.setdefault(metric.name, metric)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for m in metrics:
+            lines.extend(m.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, doc: str, labelnames=()) -> Counter:
+    return REGISTRY.register(Counter(name, doc, labelnames))
+
+
+def histogram(name: str, doc: str, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, doc, labelnames, buckets))
+
+
+def gauge_func(name: str, doc: str, fn, labelnames=()) -> GaugeFunc:
+    return REGISTRY.register(GaugeFunc(name, doc, fn, labelnames))
+
+
+def render() -> str:
+    return REGISTRY.render()
+
+
+# -- request timing -------------------------------------------------------------
+HTTP_REQUESTS = histogram('http_request_seconds', 'Duración de las peticiones HTTP',
+                          ['app', 'method', 'route', 'status'])
+
+
+def observe_request(app: str, method: str, route: str, status: int, seconds: float):
+    HTTP_REQUESTS.labels(app, method, route, status).observe(seconds)
+
+
+# -- sampling profiler ------------------------------------------------------------
+class SamplingProfiler:
+    """Muestrea las pilas de todos los hilos cada `interval` segundos."""
+
+    def __init__(self, interval: float = 0.005, max_depth: int = 64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples = 0
+        self._stacks = collections.Counter()
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        with self._lock:
+            if self.running:
+                return False
+            self._stacks.clear()
+            self.samples = 0
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+            self._thread.start()
+            return True
+
+    def stop(self) -> str:
+        """Detiene el muestreo y devuelve las pilas en formato folded."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(2)
+        return self.folded()
+
+    def _run(self):
+        me = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    code = frame.f_code
+                    stack.append('%s (%s:%d)' % (code.co_name, code.co_filename.rsplit('/', 1)[-1],
+                                                 code.co_firstlineno))
+                    frame = frame.f_back
+                if ident not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                stack.append(names.get(ident, str(ident)))
+                self._stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def folded(self) -> str:
+        return ''.join('%s %d\n' % (stack, n) for stack, n in self._stacks.most_common())
+
+    def profile(self, seconds: float) -> str:
+        """Muestrea durante `seconds` (bloqueante) y devuelve las pilas folded."""
+        if not self.start():
+            raise RuntimeError('profiler already running')
+        time.sleep(seconds)
+        return self.stop()
+
+
+PROFILER = SamplingProfiler()
@@ -0,0 +1,12 @@
+"""Punto de entrada WSGI de la app Flask (`app.py`).
+
+    gunicorn --chdir src -w 4 -b 0.0.0.0:8000 wsgi:application
+
+Cada worker importa este módulo después del fork y arranca en ese momento
+sus hilos de fondo (elección de líder, configuración, estado compartido),
+reciba peticiones o no. Sin `--preload`: con él, el módulo se importaría
+en el proceso maestro antes del fork.
+"""
+from app import app as application, start_background
+
+start_background()